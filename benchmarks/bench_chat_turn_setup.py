@@ -0,0 +1,57 @@
+"""
+Measures the setup overhead of a chat turn, without calling Bedrock.
+
+Before: a new GeoChatAgent is built for every message, which builds the LLM, the tools, the GIS agents and the
+ZeroShotAgent prompt again. With --cold-clients, AWS clients are created again as well, like before the client
+registry existed.
+After: one GeoChatAgent serves all messages of a session.
+
+    poetry run python benchmarks/bench_chat_turn_setup.py --turns 20
+"""
+import os
+import statistics
+import time
+from unittest import mock
+
+import click
+
+from geospatial_agent.agent.geo_chat.chat_agent import GeoChatAgent
+from geospatial_agent.shared.clients import get_client_registry
+from geospatial_agent.shared.location import ENV_PLACE_INDEX_NAME
+
+
+def _time_turns(turns: int, reuse_agent: bool, cold_clients: bool) -> list:
+    durations = []
+    geo_chat_agent = GeoChatAgent()
+    for _ in range(turns):
+        if cold_clients:
+            get_client_registry().clear()
+
+        start = time.perf_counter()
+        if not reuse_agent:
+            geo_chat_agent = GeoChatAgent()
+        geo_chat_agent.invoke(agent_input="Hello!", storage_mode="local", session_id="benchmark_session")
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+@click.command()
+@click.option('--turns', default=20, show_default=True, help='Number of chat turns to time')
+@click.option('--cold-clients', is_flag=True, help='Create AWS clients again on every turn')
+def main(turns: int, cold_clients: bool):
+    os.environ.setdefault(ENV_PLACE_INDEX_NAME, "benchmark_place_index")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    # INFO: Only the setup is timed, the agent executor returns right away instead of calling Bedrock.
+    with mock.patch(f'{GeoChatAgent.__module__}.AgentExecutor.run', return_value="done"):
+        before = _time_turns(turns, reuse_agent=False, cold_clients=cold_clients)
+        after = _time_turns(turns, reuse_agent=True, cold_clients=False)
+
+    for title, durations in [("New agent per turn", before), ("Agent reused per session", after)]:
+        click.echo(f"{title:26s} mean {statistics.mean(durations) * 1000:8.2f} ms   "
+                   f"median {statistics.median(durations) * 1000:8.2f} ms   "
+                   f"first {durations[0] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures time and peak memory of sampling rows of a large CSV file for the data summary, without calling Bedrock.
+
+Before: the generated file reading code loads the whole file into a data frame and samples complete rows from it.
+After: sniff_schema streams the file in chunks through a reservoir sampler.
+
+    poetry run python benchmarks/bench_file_sampling.py --rows 5000000
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy
+import pandas
+
+from geospatial_agent.agent.action_summarizer.schema_sniffer import sniff_schema
+
+
+def _write_csv(path: str, rows: int):
+    # INFO: Columns similar to GlobalLandTemperaturesByCity.csv, written in chunks to keep the setup itself small.
+    rng = numpy.random.default_rng(0)
+    chunk_size = 500_000
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        temperatures = rng.normal(15, 10, count)
+        temperatures[rng.random(count) < 0.05] = numpy.nan
+        pandas.DataFrame({
+            "dt": pandas.Timestamp("1900-01-01") + pandas.to_timedelta(rng.integers(0, 40000, count), unit="D"),
+            "AverageTemperature": temperatures,
+            "AverageTemperatureUncertainty": rng.random(count),
+            "City": rng.choice(["Aarhus", "Berlin", "Cairo", "Denver", "Lima"], count),
+            "Country": rng.choice(["Denmark", "Germany", "Egypt", "United States", "Peru"], count),
+            "Latitude": rng.uniform(-60, 60, count).round(2),
+            "Longitude": rng.uniform(-180, 180, count).round(2),
+        }).to_csv(path, mode="a", header=start == 0, index=False)
+
+
+def _full_read_sample(path: str) -> pandas.DataFrame:
+    data_frame = pandas.read_csv(path)
+    return data_frame.dropna().sample(n=3, random_state=0)
+
+
+def _measure(title: str, func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    click.echo(f"{title:28s} {duration:8.2f} s   peak traced memory {peak / 1024 / 1024:9.1f} MB")
+
+
+@click.command()
+@click.option('--rows', default=2_000_000, show_default=True, help='Rows of the generated CSV file')
+@click.option('--chunk-size', default=100_000, show_default=True, help='Rows per chunk of the streaming sampler')
+def main(rows: int, chunk_size: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "temperatures.csv")
+        _write_csv(path, rows)
+        click.echo(f"CSV file with {rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        _measure("Full read and sample", _full_read_sample, path)
+        _measure("Streaming reservoir sample", lambda: sniff_schema(path, session_id="benchmark_session",
+                                                                    chunk_size=chunk_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Measures parsing a synthetic plan graph and looking up operation ancestors and descendants of every operation, as
+Solver.solve and Solver.gen_operation_code do, on plans of 10 to 5,000 nodes.
+
+Before: every lookup walks the graph with networkx.ancestors / descendants and scans operation lists.
+After: OperationsParser computes operation closures of all nodes once, in topological order.
+
+    poetry run python benchmarks/bench_operations_parser.py --sizes 10,100,1000,5000
+"""
+import random
+import time
+from typing import List, Sequence
+
+import click
+import networkx
+
+from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser, OperationNode
+
+
+def _get_plan_graph(node_count: int, seed: int) -> networkx.DiGraph:
+    """Returns a plan graph of about node_count nodes. Every operation reads one to three earlier data nodes."""
+    rng = random.Random(seed)
+    graph = networkx.DiGraph()
+    data_names = []
+    for idx in range(max(node_count // 10, 1)):
+        data_names.append(f"input_{idx}")
+        graph.add_node(data_names[-1], node_type="data", data_path=f"input_{idx}.csv", description="Input")
+
+    op_idx = 0
+    while graph.number_of_nodes() < node_count:
+        op_name = f"operation_{op_idx}"
+        graph.add_node(op_name, node_type="operation", description=f"Operation {op_idx}", operation_type="transform")
+        # INFO: Inputs are picked from recent data nodes, so plans are deep like chained geospatial steps.
+        for data_name in set(rng.sample(data_names[-20:], k=min(len(data_names[-20:]), rng.randint(1, 3)))):
+            graph.add_edge(data_name, op_name)
+        for output_idx in range(rng.randint(1, 2)):
+            data_names.append(f"data_{op_idx}_{output_idx}")
+            graph.add_node(data_names[-1], node_type="data", description="Output")
+            graph.add_edge(op_name, data_names[-1])
+        op_idx += 1
+    return graph
+
+
+def _get_ancestors_before(parser: OperationsParser, node_name: str) -> Sequence[OperationNode]:
+    ancestor_names = [name for name in networkx.ancestors(parser.graph, node_name) if name in parser.op_node_names]
+    return [op_node for op_node in parser.operation_nodes if op_node.node_name in ancestor_names]
+
+
+def _get_descendants_before(parser: OperationsParser, node_name: str) -> Sequence[OperationNode]:
+    descendant_names = [name for name in networkx.descendants(parser.graph, node_name)
+                        if name in parser.op_node_names]
+    return [op_node for op_node in parser.operation_nodes if op_node.node_name in descendant_names]
+
+
+def _time_lookups(graph: networkx.DiGraph, before: bool) -> float:
+    start = time.perf_counter()
+    parser = OperationsParser(graph)
+    for op_node in parser.operation_nodes:
+        if before:
+            _get_ancestors_before(parser, op_node.node_name)
+            _get_descendants_before(parser, op_node.node_name)
+        else:
+            parser.get_ancestors(op_node.node_name)
+            parser.get_descendants(op_node.node_name)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--sizes', default="10,100,1000,5000", show_default=True, help='Comma separated plan graph sizes')
+@click.option('--max-before-size', default=1000, show_default=True,
+              help='Largest plan graph measured with the lookups of the old parser')
+def main(sizes: str, max_before_size: int):
+    node_counts: List[int] = [int(size) for size in sizes.split(",")]
+    click.echo(f"{'nodes':>6s} {'operations':>10s} {'before (s)':>11s} {'after (s)':>10s}")
+    for node_count in node_counts:
+        graph = _get_plan_graph(node_count, seed=node_count)
+        op_count = sum(1 for _, node_type in graph.nodes(data="node_type") if node_type == "operation")
+        before = f"{_time_lookups(graph, before=True):11.3f}" if node_count <= max_before_size else f"{'skipped':>11s}"
+        click.echo(f"{graph.number_of_nodes():6d} {op_count:10d} {before} {_time_lookups(graph, before=False):10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures the per call overhead of rendering the prompts of a 30 operation plan, without calling Bedrock.
+
+Before: every call parses its template with PromptTemplate.from_template, and the summarizer builds an LLMChain
+that renders the prompt again inside the chain.
+After: templates are compiled once at import with their fixed values bound, and every call renders its prompt once
+and passes the text to the LLM.
+
+    poetry run python benchmarks/bench_prompt_rendering.py --operations 30
+"""
+import time
+from typing import Callable
+
+import click
+from langchain.chains import LLMChain
+from langchain_community.llms import FakeListLLM
+from langchain_core.prompts import PromptTemplate
+
+from geospatial_agent.agent.action_summarizer.action_summarizer import _DATA_SUMMARY_COMPILED_PROMPT
+from geospatial_agent.agent.action_summarizer.prompts import _DATA_SUMMARY_PROMPT, _ROLE_INTRO
+from geospatial_agent.agent.geospatial.solver.prompts import operation_code_gen_prompt_template, \
+    operation_requirement_gen_task_prefix, operation_code_gen_intro, operation_task_prefix, operation_reply_example, \
+    operation_pydeck_example
+from geospatial_agent.agent.geospatial.solver.solver import _OPERATION_CODE_PROMPT, _OPERATION_REQUIREMENT_PROMPT
+from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE
+
+_CALL_VALUES = dict(operation_description="Join listings with borough boundaries",
+                    task_definition="Draw a heatmap of Airbnb prices by borough",
+                    graph_code="G = nx.DiGraph()\n" * 40,
+                    data_locations_instructions="File Location: agent://airbnb.csv\nColumn Names: ['id', 'price']\n",
+                    session_id="3c18d48c-9c9b-488f-8229-e2e8016fa851",
+                    task_name="1700000000_airbnb_heatmap",
+                    storage_mode="Local",
+                    operation_requirements="1. Use geopandas\n" * 20,
+                    ancestor_operation_code="def load_listings(listings_url):\n    ...\n    return listings_df\n" * 3,
+                    descendant_operations_definition="def plot_prices(joined_gdf):\n    return prices_html\n")
+
+_SUMMARY_VALUES = dict(action="Draw a heatmap of prices", columns=["id", "price", "latitude", "longitude"],
+                       profile="price: float64, min 10, max 900\n" * 10, table="id,price\n1,10.0\n2,20.0\n")
+
+
+def _render_operations_before(operations: int):
+    for idx in range(operations):
+        PromptTemplate.from_template(operation_requirement_gen_task_prefix).format(
+            human_role=HUMAN_ROLE, operation_req_gen_intro=operation_code_gen_intro, operation_name=f"op_{idx}",
+            pre_requirements="1. Use geopandas\n" * 20, operation_properties="1. Join\n", assistant_role=ASSISTANT_ROLE)
+        PromptTemplate.from_template(operation_code_gen_prompt_template).format(
+            human_role=HUMAN_ROLE, operation_code_gen_intro=operation_code_gen_intro,
+            operation_task_prefix=operation_task_prefix, operation_reply_example=operation_reply_example,
+            operation_pydeck_example=operation_pydeck_example, assistant_role=ASSISTANT_ROLE, **_CALL_VALUES)
+
+
+def _render_operations_after(operations: int):
+    for idx in range(operations):
+        _OPERATION_REQUIREMENT_PROMPT.render(operation_name=f"op_{idx}", operation_properties="1. Join\n")
+        _OPERATION_CODE_PROMPT.render(**_CALL_VALUES)
+
+
+def _summarize_before(llm: FakeListLLM):
+    chain = LLMChain(llm=llm, prompt=PromptTemplate.from_template(_DATA_SUMMARY_PROMPT))
+    chain.run(role_intro=_ROLE_INTRO, human_role=HUMAN_ROLE, requirements="1. Be short\n",
+              assistant_role=ASSISTANT_ROLE, **_SUMMARY_VALUES)
+
+
+def _summarize_after(llm: FakeListLLM):
+    llm.predict(_DATA_SUMMARY_COMPILED_PROMPT.render(**_SUMMARY_VALUES))
+
+
+def _time_per_call(call: Callable[[], None], repeat: int) -> float:
+    call()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+@click.command()
+@click.option('--operations', default=30, show_default=True, help='Operations in the plan')
+@click.option('--repeat', default=200, show_default=True, help='Times each measurement is repeated')
+def main(operations: int, repeat: int):
+    llm = FakeListLLM(responses=["Listings with prices"])
+    rows = [
+        (f"prompts of {operations} operations", lambda: _render_operations_before(operations),
+         lambda: _render_operations_after(operations)),
+        ("one data summary call", lambda: _summarize_before(llm), lambda: _summarize_after(llm)),
+    ]
+    click.echo(f"{'':32s} {'before (us)':>12s} {'after (us)':>12s}")
+    for name, before, after in rows:
+        click.echo(f"{name:32s} {_time_per_call(before, repeat):12.1f} {_time_per_call(after, repeat):12.1f}")
+
+
+if __name__ == "__main__":
+    main()
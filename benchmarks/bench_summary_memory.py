@@ -0,0 +1,116 @@
+"""
+Measures peak and steady-state RSS of summarizing several data files with generated file reading code, without
+calling Bedrock. Each mode runs in its own process, so peak RSS of one does not hide the other.
+
+Before: FileSummary keeps the whole data frame returned by the generated code.
+After: the summarizer keeps a profile and a few sample rows of each file, and releases the loaded frames.
+
+    poetry run python benchmarks/bench_summary_memory.py --files 4 --rows 1000000
+"""
+import gc
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import List, Tuple
+
+import click
+import numpy
+import pandas
+
+from geospatial_agent.agent.action_summarizer.action_summarizer import ActionSummarizer, ActionSummary, FileSummary
+from geospatial_agent.agent.action_summarizer.prompts import DATA_FRAMES_VARIABLE_NAME
+from geospatial_agent.agent.shared import execute_assembled_code
+from geospatial_agent.shared.shim import get_shim_imports
+
+_MODES = ["before", "after"]
+
+
+def _write_csv(path: str, rows: int, seed: int):
+    rng = numpy.random.default_rng(seed)
+    pandas.DataFrame({
+        "id": numpy.arange(rows),
+        "price": rng.normal(150, 50, rows).round(2),
+        "room_type": rng.choice(["Entire home/apt", "Private room", "Shared room"], rows),
+        "latitude": rng.uniform(40.5, 40.9, rows).round(5),
+        "longitude": rng.uniform(-74.2, -73.7, rows).round(5),
+    }).to_csv(path, index=False)
+
+
+def _get_read_code(paths: List[str]) -> str:
+    # INFO: Like most generated file reading code, every file is loaded whole and returned as is.
+    return f"""
+import pandas
+
+def read_files():
+    file_summaries = []
+    for path in {paths!r}:
+        data_frame = pandas.read_csv(path)
+        file_summaries.append({{"file_url": path, "data_frame": data_frame, "column_names": list(data_frame.columns)}})
+    return file_summaries
+
+{DATA_FRAMES_VARIABLE_NAME} = read_files()
+"""
+
+
+def _get_rss_mb() -> Tuple[float, float]:
+    """Returns current and peak RSS of this process in MB."""
+    current, peak = None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    return current if current is not None else peak, peak
+
+
+def _summarize_before(code: str) -> List[FileSummary]:
+    execution_result = execute_assembled_code(f'{get_shim_imports()}\n{code}',
+                                              result_names=[DATA_FRAMES_VARIABLE_NAME])
+    return [FileSummary(**data) for data in execution_result.results[DATA_FRAMES_VARIABLE_NAME]]
+
+
+def _run_mode(mode: str, paths: List[str]):
+    code = _get_read_code(paths)
+    baseline, _ = _get_rss_mb()
+
+    if mode == "before":
+        file_summaries = _summarize_before(code)
+    else:
+        file_summaries = ActionSummarizer._gen_file_summaries_from_executing_code(code)
+    action_summary = ActionSummary(action="Draw a heatmap of prices", file_summaries=file_summaries)
+
+    gc.collect()
+    steady, peak = _get_rss_mb()
+    rows_kept = sum(len(item.data_frame) for item in action_summary.file_summaries)
+    frames_mb = sum(item.data_frame.memory_usage(deep=True).sum()
+                    for item in action_summary.file_summaries) / 1024 / 1024
+    click.echo(f"{mode:8s} peak RSS {peak - baseline:8.1f} MB   steady-state RSS {steady - baseline:8.1f} MB   "
+               f"rows kept {rows_kept:8d} ({frames_mb:.1f} MB)")
+
+
+@click.command()
+@click.option('--files', default=4, show_default=True, help='Data files read in the session')
+@click.option('--rows', default=500_000, show_default=True, help='Rows of each generated CSV file')
+@click.option('--mode', type=click.Choice(_MODES), default=None, help='Run only one mode in this process')
+@click.option('--data-dir', default=None, help='Directory with the generated CSV files, used by --mode')
+def main(files: int, rows: int, mode: str, data_dir: str):
+    if mode is not None:
+        _run_mode(mode, sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for index in range(files):
+            _write_csv(os.path.join(tmp_dir, f"listings_{index}.csv"), rows, seed=index)
+        size_mb = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir)) / 1024 / 1024
+        click.echo(f"{files} CSV files with {rows} rows each, {size_mb:.1f} MB in total. RSS above process baseline:")
+
+        for run_mode in _MODES:
+            subprocess.run([sys.executable, __file__, "--mode", run_mode, "--data-dir", tmp_dir], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Compares the rules based operation requirement selector with recorded LLM requirement selections.
+
+Record LLM selections by running the agent with REQUIREMENT_SELECTOR=llm and REQUIREMENT_SELECTION_RECORD_PATH set
+to a JSON lines file. Every operation is recorded then, not only the ones the rules are not confident about. Then run:
+
+    poetry run python benchmarks/compare_requirement_selectors.py requirement_selections.jsonl
+"""
+import json
+
+import click
+
+from geospatial_agent.agent.geospatial.solver.requirement_rules import compare_requirement_selections, \
+    DEFAULT_MIN_RULES_CONFIDENCE
+
+
+@click.command()
+@click.argument('record_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--min-confidence', default=DEFAULT_MIN_RULES_CONFIDENCE, show_default=True,
+              help='Confidence below which the rules fall back to the LLM')
+def main(record_path: str, min_confidence: float):
+    with open(record_path) as record_file:
+        records = [json.loads(line) for line in record_file if line.strip()]
+
+    agreement = compare_requirement_selections(records, min_confidence=min_confidence)
+
+    click.echo(f"Records:          {agreement.record_count}")
+    click.echo(f"Exact matches:    {agreement.exact_match_rate:.1%}")
+    click.echo(f"Mean Jaccard:     {agreement.mean_jaccard:.3f}")
+    click.echo(f"Mean precision:   {agreement.mean_precision:.3f}")
+    click.echo(f"Mean recall:      {agreement.mean_recall:.3f}")
+    click.echo(f"LLM fallbacks:    {agreement.fallback_rate:.1%}")
+
+    for title, counts in [("Selected by rules only", agreement.false_positives),
+                          ("Selected by LLM only", agreement.false_negatives)]:
+        click.echo(f"\n{title}:")
+        for requirement, count in sorted(counts.items(), key=lambda item: -item[1]):
+            click.echo(f"  {count:4d}  {requirement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,63 @@
 import json
-from typing import List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Optional, Dict
 
-from langchain import PromptTemplate, LLMChain
+import geopandas
+import pandas
 from pydantic import BaseModel, ConfigDict
 from pydispatch import dispatcher
 
 from geospatial_agent.agent.action_summarizer.prompts import _ACTION_SUMMARY_PROMPT, _ROLE_INTRO, \
     _READ_FILE_PROMPT, _READ_FILE_REQUIREMENTS, _ACTION_SUMMARY_REQUIREMENTS, DATA_FRAMES_VARIABLE_NAME, \
     _DATA_SUMMARY_REQUIREMENTS, _DATA_SUMMARY_PROMPT
+from geospatial_agent.agent.action_summarizer.profiler import DataProfile, profile_data_frame, render_profile, \
+    render_sample_rows
+from geospatial_agent.agent.action_summarizer.sampler import sample_data_frame
+from geospatial_agent.agent.action_summarizer.schema_sniffer import SchemaSniffingException, is_sniffable, \
+    sniff_schema
+from geospatial_agent.agent.action_summarizer.summary_cache import FileSummaryCache, CachedFileSummary, \
+    get_file_summary_cache, to_sample_rows
+from geospatial_agent.agent.code_executor import CodeExecutor, InProcessCodeExecutor, get_code_executor
 from geospatial_agent.agent.shared import AgentSignal, EventType, SIGNAL_ACTION_CONTEXT_GENERATED, \
-    SENDER_ACTION_SUMMARIZER, SIGNAL_FILE_READ_CODE_GENERATED, SIGNAL_FILE_READ_CODE_EXECUTED, execute_assembled_code
-from geospatial_agent.shared.bedrock import get_claude_v2
-from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE, HUMAN_STOP_SEQUENCE
+    SENDER_ACTION_SUMMARIZER, SIGNAL_FILE_READ_CODE_GENERATED, SIGNAL_FILE_READ_CODE_EXECUTED, \
+    get_code_chunk_sender, SIGNAL_FILE_SUMMARY_FAILED, SIGNAL_FILE_SUMMARIES_CACHED
+from geospatial_agent.shared.llm_stages import StageLLMFactory, get_stage_llm_factory, STAGE_ACTION_CONTEXT, \
+    STAGE_FILE_READ_CODE, STAGE_DATA_SUMMARY
+from geospatial_agent.shared.prompt_template import CompiledPrompt
+from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE
 from geospatial_agent.shared.shim import get_shim_imports
+from geospatial_agent.shared.streaming import predict_block
 from geospatial_agent.shared.utils import extract_code
 
 
+# Data summaries generated at the same time. Each file is summarized with its own LLM call.
+DEFAULT_MAX_CONCURRENT_SUMMARIES = 4
+
+_ACTION_SUMMARY_COMPILED_PROMPT = CompiledPrompt("action_context", _ACTION_SUMMARY_PROMPT).partial(
+    role_intro=_ROLE_INTRO,
+    human_role=HUMAN_ROLE,
+    requirements="\n".join(
+        [f"{index + 1}. {requirement}" for index, requirement in enumerate(_ACTION_SUMMARY_REQUIREMENTS)]),
+    assistant_role=ASSISTANT_ROLE
+)
+
+_READ_FILE_COMPILED_PROMPT = CompiledPrompt("file_read_code", _READ_FILE_PROMPT).partial(
+    role_intro=_ROLE_INTRO,
+    human_role=HUMAN_ROLE,
+    requirements="\n".join(
+        [f"{index + 1}. {requirement}" for index, requirement in enumerate(_READ_FILE_REQUIREMENTS)]),
+    assistant_role=ASSISTANT_ROLE
+)
+
+_DATA_SUMMARY_COMPILED_PROMPT = CompiledPrompt("data_summary", _DATA_SUMMARY_PROMPT).partial(
+    role_intro=_ROLE_INTRO,
+    human_role=HUMAN_ROLE,
+    requirements="\n".join(
+        [f"{index + 1}. {requirement}" for index, requirement in enumerate(_DATA_SUMMARY_REQUIREMENTS)]),
+    assistant_role=ASSISTANT_ROLE
+)
+
+
 class ActionSummarizerException(Exception):
     def __init__(self, message: str):
         self.message = message
@@ -28,11 +70,19 @@ class ActionContext(BaseModel):
 
 
 class FileSummary(BaseModel):
+    """Summary of a data file. data_frame holds a few sample rows of the file, never the whole file."""
     model_config = ConfigDict(arbitrary_types_allowed=True)
     file_url: str
     data_frame: Any
     column_names: List[str]
     file_summary: Optional[str] = None
+    profile: Optional[DataProfile] = None
+
+    def has_geometry(self) -> bool:
+        """Returns whether the file has a geometry column, from its profile, or from its sample rows otherwise."""
+        if self.profile is not None:
+            return self.profile.has_geometry
+        return isinstance(self.data_frame, geopandas.GeoDataFrame)
 
 
 class ActionSummary(BaseModel):
@@ -40,6 +90,15 @@ class ActionSummary(BaseModel):
     file_summaries: List[FileSummary]
 
 
+def _sample_file_summaries(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turns the data frames returned by file reading code into file summaries with their profile and a few rows. The
+    generated code often returns whole data files, so this runs where the code runs, and only summaries are returned.
+    """
+    dataframes = results.get(DATA_FRAMES_VARIABLE_NAME) or []
+    return {DATA_FRAMES_VARIABLE_NAME: [ActionSummarizer._to_sampled_file_summary(data) for data in dataframes]}
+
+
 class ActionSummarizer:
     """Action summarizer acts on raw user messages with the following traits
     1. It is a geospatial query or analysis such as "Draw me a heatmap".
@@ -48,12 +107,20 @@ class ActionSummarizer:
     ActionSummarizer generates a list of ActionSummary.
     """
 
-    def __init__(self, llm=None):
-        if llm is None:
-            claude_v2 = get_claude_v2()
-            self.llm = claude_v2
+    def __init__(self, llm=None, llm_factory: Optional[StageLLMFactory] = None, use_schema_sniffing: bool = True,
+                 max_workers: int = DEFAULT_MAX_CONCURRENT_SUMMARIES,
+                 summary_cache: Optional[FileSummaryCache] = None,
+                 code_executor: Optional[CodeExecutor] = None):
+        self.use_schema_sniffing = use_schema_sniffing
+        self.code_executor = code_executor
+        self.max_workers = max_workers
+        self.summary_cache = summary_cache if summary_cache is not None else get_file_summary_cache()
+        if llm_factory is not None:
+            self.llm_factory = llm_factory
+        elif llm is not None:
+            self.llm_factory = StageLLMFactory.from_llm(llm)
         else:
-            self.llm = llm
+            self.llm_factory = get_stage_llm_factory()
 
     def invoke(self, user_input: str, session_id: str, storage_mode: str) -> ActionSummary:
         try:
@@ -66,26 +133,59 @@ class ActionSummarizer:
                                 event_message=f'Detected desired action {action_context.action}. And file paths: {action_context.file_paths}.'
                             ))
 
-            read_file_code = self._gen_file_read_code(action_context, session_id, storage_mode)
-            dispatcher.send(signal=SIGNAL_FILE_READ_CODE_GENERATED,
-                            sender=SENDER_ACTION_SUMMARIZER,
-                            event_data=AgentSignal(
-                                event_type=EventType.PythonCode,
-                                event_source=SENDER_ACTION_SUMMARIZER,
-                                event_message=f'Generated code to read and understand data schema.',
-                                event_data=read_file_code
-                            ))
-
-            data_files_summary = self._gen_file_summaries_from_executing_code(read_file_code)
-            dispatcher.send(signal=SIGNAL_FILE_READ_CODE_EXECUTED,
-                            sender=SENDER_ACTION_SUMMARIZER,
-                            event_data=AgentSignal(
-                                event_type=EventType.Message,
-                                event_source=SENDER_ACTION_SUMMARIZER,
-                                event_message=f'Successfully executed code to read and understand data schema.',
-                            ))
+            cached_summaries = self._get_cached_file_summaries(action_context, session_id)
+            if len(cached_summaries) > 0:
+                dispatcher.send(signal=SIGNAL_FILE_SUMMARIES_CACHED,
+                                sender=SENDER_ACTION_SUMMARIZER,
+                                event_data=AgentSignal(
+                                    event_type=EventType.Message,
+                                    event_source=SENDER_ACTION_SUMMARIZER,
+                                    event_message=f'Reused cached data summaries of {list(cached_summaries.keys())}.'
+                                ))
+
+            file_paths = action_context.file_paths
+            missing_file_paths = [path for path in file_paths if path not in cached_summaries]
+            if len(missing_file_paths) == 0:
+                file_summaries = [cached_summaries[path] for path in action_context.file_paths]
+                return ActionSummary(action=action_context.action, file_summaries=file_summaries)
+            action_context = ActionContext(action=action_context.action, file_paths=missing_file_paths)
+
+            data_files_summary = None
+            if self.use_schema_sniffing:
+                data_files_summary = self._gen_file_summaries_from_sniffing(action_context.file_paths, session_id)
+
+            if data_files_summary is not None:
+                dispatcher.send(signal=SIGNAL_FILE_READ_CODE_EXECUTED,
+                                sender=SENDER_ACTION_SUMMARIZER,
+                                event_data=AgentSignal(
+                                    event_type=EventType.Message,
+                                    event_source=SENDER_ACTION_SUMMARIZER,
+                                    event_message=f'Successfully read data schema without generating code.',
+                                ))
+            else:
+                read_file_code = self._gen_file_read_code(action_context, session_id, storage_mode)
+                dispatcher.send(signal=SIGNAL_FILE_READ_CODE_GENERATED,
+                                sender=SENDER_ACTION_SUMMARIZER,
+                                event_data=AgentSignal(
+                                    event_type=EventType.PythonCode,
+                                    event_source=SENDER_ACTION_SUMMARIZER,
+                                    event_message=f'Generated code to read and understand data schema.',
+                                    event_data=read_file_code
+                                ))
+
+                data_files_summary = self._gen_file_summaries_from_executing_code(
+                    read_file_code, code_executor=self.code_executor or get_code_executor())
+                dispatcher.send(signal=SIGNAL_FILE_READ_CODE_EXECUTED,
+                                sender=SENDER_ACTION_SUMMARIZER,
+                                event_data=AgentSignal(
+                                    event_type=EventType.Message,
+                                    event_source=SENDER_ACTION_SUMMARIZER,
+                                    event_message=f'Successfully executed code to read and understand data schema.',
+                                ))
 
             file_summaries = self._gen_file_summaries_for_action(action_context.action, data_files_summary)
+            self._cache_file_summaries(action_context.action, file_summaries, session_id)
+            file_summaries = self._merge_file_summaries(file_paths, cached_summaries, file_summaries)
             return ActionSummary(action=action_context.action, file_summaries=file_summaries)
 
         except Exception as e:
@@ -95,62 +195,167 @@ class ActionSummarizer:
                 raise ActionSummarizerException(
                     message=f"Failed to extract dataframes from data reading code. Original exception: {e}") from e
 
-    def _gen_file_summaries_for_action(self, action: str, file_summaries: List[FileSummary]) -> List[FileSummary]:
+    def _get_cached_file_summaries(self, action_context: ActionContext, session_id: str) -> Dict[str, FileSummary]:
+        """Returns the cached summaries of local files that did not change since they were summarized for the action."""
+        if self.summary_cache is None:
+            return {}
+
+        model_id = self.llm_factory.get_config(STAGE_DATA_SUMMARY).model_id
+        cached_summaries = {}
+        for file_path in action_context.file_paths:
+            cached = self.summary_cache.get(file_path, session_id, action_context.action, model_id)
+            if cached is None:
+                continue
+            cached_summaries[file_path] = FileSummary(
+                file_url=cached.file_url,
+                data_frame=cached.get_sample_data_frame(),
+                column_names=cached.column_names,
+                file_summary=cached.file_summary,
+                profile=cached.profile
+            )
+        return cached_summaries
+
+    @staticmethod
+    def _merge_file_summaries(file_paths: List[str], cached_summaries: Dict[str, FileSummary],
+                              generated_summaries: List[FileSummary]) -> List[FileSummary]:
+        """
+        Returns the summaries of file_paths in their order, taking each from the cache or from the generated
+        summaries. Generated summaries whose file URL is not one of file_paths fill the remaining places in order.
+        """
+        generated_by_url = {item.file_url: item for item in generated_summaries}
+        unmatched_summaries = iter([item for item in generated_summaries if item.file_url not in file_paths])
+
+        file_summaries = []
+        for file_path in file_paths:
+            if file_path in cached_summaries:
+                file_summaries.append(cached_summaries[file_path])
+            elif file_path in generated_by_url:
+                file_summaries.append(generated_by_url[file_path])
+            else:
+                unmatched_summary = next(unmatched_summaries, None)
+                if unmatched_summary is not None:
+                    file_summaries.append(unmatched_summary)
+        file_summaries.extend(unmatched_summaries)
+        return file_summaries
+
+    def _cache_file_summaries(self, action: str, file_summaries: List[FileSummary], session_id: str):
+        if self.summary_cache is None:
+            return
+
+        model_id = self.llm_factory.get_config(STAGE_DATA_SUMMARY).model_id
         for item in file_summaries:
-            requirements_str = "\n".join(
-                [f"{index + 1}. {requirement}" for index, requirement in enumerate(_DATA_SUMMARY_REQUIREMENTS)])
-            file_summary_template: PromptTemplate = PromptTemplate.from_template(_DATA_SUMMARY_PROMPT)
-            gdf_str = item.data_frame.to_json()
-
-            if len(gdf_str) > 4000:
-                gdf_str = gdf_str[:4000]
-
-            chain = LLMChain(llm=self.llm, prompt=file_summary_template)
-            file_summary = chain.run(
-                role_intro=_ROLE_INTRO,
-                human_role=HUMAN_ROLE,
-                requirements=requirements_str,
-                action=action,
-                columns=item.column_names,
-                table=gdf_str,
-                assistant_role=ASSISTANT_ROLE,
-                stop=[HUMAN_STOP_SEQUENCE]
-            ).strip()
-            item.file_summary = file_summary
+            self.summary_cache.set(session_id, action, model_id, CachedFileSummary(
+                file_url=item.file_url,
+                column_names=[str(name) for name in item.column_names],
+                file_summary=item.file_summary,
+                profile=item.profile,
+                sample_rows=to_sample_rows(item.data_frame)
+            ))
+
+    def _gen_file_summaries_for_action(self, action: str, file_summaries: List[FileSummary]) -> List[FileSummary]:
+        """
+        Generates the summaries of all files concurrently, at most max_workers at a time. If summarizing any file
+        fails, an ActionSummarizerException naming all failed files is raised after the other files are done.
+        """
+        if len(file_summaries) == 0:
+            return file_summaries
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(file_summaries)))
+        try:
+            futures = [executor.submit(self._gen_file_summary, action, item) for item in file_summaries]
+        finally:
+            executor.shutdown(wait=True)
+
+        failures = []
+        for item, future in zip(file_summaries, futures):
+            error = future.exception()
+            if error is None:
+                item.file_summary = future.result()
+                continue
+
+            failures.append(f"{item.file_url}: {error}")
+            dispatcher.send(signal=SIGNAL_FILE_SUMMARY_FAILED,
+                            sender=SENDER_ACTION_SUMMARIZER,
+                            event_data=AgentSignal(
+                                event_type=EventType.Error,
+                                event_source=SENDER_ACTION_SUMMARIZER,
+                                event_message=f'Failed to generate data summary of {item.file_url}: {error}',
+                            ))
+
+        if failures:
+            raise ActionSummarizerException(
+                message=f"Failed to generate data summaries of {len(failures)} of {len(file_summaries)} files. "
+                        f"{'; '.join(failures)}")
 
         return file_summaries
 
+    def _gen_file_summary(self, action: str, item: FileSummary) -> str:
+        if item.profile is None:
+            item.profile = profile_data_frame(item.data_frame)
+
+        file_summary_prompt = _DATA_SUMMARY_COMPILED_PROMPT.render(
+            action=action,
+            columns=item.column_names,
+            profile=render_profile(item.profile),
+            table=render_sample_rows(item.data_frame)
+        )
+        file_summary = self.llm_factory.get_llm(STAGE_DATA_SUMMARY).predict(
+            file_summary_prompt, stop=self.llm_factory.get_stop_sequences(STAGE_DATA_SUMMARY)).strip()
+        return file_summary
+
     def _gen_file_read_code(self, action_context: ActionContext, session_id: str, storage_mode: str) -> str:
         file_paths = action_context.file_paths
         file_urls_str = "\n".join(
             [f"{index + 1}. {file_url}" for index, file_url in enumerate(file_paths)])
 
-        requirements_str = "\n".join(
-            [f"{index + 1}. {requirement}" for index, requirement in enumerate(_READ_FILE_REQUIREMENTS)])
-        read_file_template: PromptTemplate = PromptTemplate.from_template(_READ_FILE_PROMPT)
-
-        chain = LLMChain(llm=self.llm, prompt=read_file_template)
-        read_file_code_response = chain.run(
-            role_intro=_ROLE_INTRO,
-            human_role=HUMAN_ROLE,
-            requirements=requirements_str,
+        read_file_prompt = _READ_FILE_COMPILED_PROMPT.render(
             session_id=session_id,
             storage_mode=storage_mode,
-            assistant_role=ASSISTANT_ROLE,
-            file_urls=file_urls_str,
-            stop=[HUMAN_STOP_SEQUENCE]
+            file_urls=file_urls_str
+        )
+        read_file_code_response = predict_block(
+            llm=self.llm_factory.get_llm(STAGE_FILE_READ_CODE),
+            prompt=read_file_prompt,
+            stop=self.llm_factory.get_stop_sequences(STAGE_FILE_READ_CODE),
+            on_partial=get_code_chunk_sender(SENDER_ACTION_SUMMARIZER, "Generating code to read data files")
         ).strip()
 
         read_file_code = extract_code(read_file_code_response)
         return read_file_code
 
     @staticmethod
-    def _gen_file_summaries_from_executing_code(code: str) -> List[FileSummary]:
-        assembled_code = f'{get_shim_imports()}\n{code}'
-        output, _globals = execute_assembled_code(assembled_code)
+    def _gen_file_summaries_from_sniffing(file_paths: List[str], session_id: str) -> Optional[List[FileSummary]]:
+        """
+        Returns file summaries read directly from file headers and a bounded number of rows. Returns None if any file
+        can not be read this way, then the file reading code is generated by the LLM instead.
+        """
+        if len(file_paths) == 0 or not all(is_sniffable(file_path) for file_path in file_paths):
+            return None
+
+        file_summaries = []
+        for file_path in file_paths:
+            try:
+                schema = sniff_schema(file_path, session_id)
+            except SchemaSniffingException:
+                return None
+
+            file_summaries.append(FileSummary(
+                file_url=schema.file_url,
+                data_frame=schema.sample,
+                column_names=schema.column_names,
+                profile=schema.profile
+            ))
+
+        return file_summaries
 
-        dataframes = _globals[DATA_FRAMES_VARIABLE_NAME]
-        file_summaries = [FileSummary(**data) for data in dataframes]
+    @staticmethod
+    def _gen_file_summaries_from_executing_code(code: str,
+                                                code_executor: Optional[CodeExecutor] = None) -> List[FileSummary]:
+        assembled_code = f'{get_shim_imports()}\n{code}'
+        code_executor = code_executor or InProcessCodeExecutor()
+        execution_result = code_executor.execute(assembled_code, result_names=[DATA_FRAMES_VARIABLE_NAME],
+                                                 result_processor=_sample_file_summaries)
+        file_summaries = execution_result.results.get(DATA_FRAMES_VARIABLE_NAME, [])
 
         if len(file_summaries) == 0:
             raise ActionSummarizerException(
@@ -169,20 +374,20 @@ class ActionSummarizer:
 
         return file_summaries
 
+    @staticmethod
+    def _to_sampled_file_summary(data: dict) -> FileSummary:
+        data_frame = data.get("data_frame")
+        if not isinstance(data_frame, pandas.DataFrame):
+            return FileSummary(**data)
+
+        return FileSummary(**{**data,
+                              "data_frame": sample_data_frame(data_frame),
+                              "profile": profile_data_frame(data_frame)})
+
     def _extract_action_context(self, user_input: str) -> ActionContext:
-        filepaths_extract_template: PromptTemplate = PromptTemplate.from_template(_ACTION_SUMMARY_PROMPT)
-        requirements_str = "\n".join(
-            [f"{index + 1}. {requirement}" for index, requirement in enumerate(_ACTION_SUMMARY_REQUIREMENTS)])
-
-        chain = LLMChain(llm=self.llm, prompt=filepaths_extract_template)
-        action_summary = chain.run(
-            role_intro=_ROLE_INTRO,
-            human_role=HUMAN_ROLE,
-            requirements=requirements_str,
-            assistant_role=ASSISTANT_ROLE,
-            message=user_input,
-            stop=[HUMAN_STOP_SEQUENCE]
-        ).strip()
+        action_context_prompt = _ACTION_SUMMARY_COMPILED_PROMPT.render(message=user_input)
+        action_summary = self.llm_factory.get_llm(STAGE_ACTION_CONTEXT).predict(
+            action_context_prompt, stop=self.llm_factory.get_stop_sequences(STAGE_ACTION_CONTEXT)).strip()
 
         try:
             action_summary_obj = ActionContext.parse_raw(action_summary)
@@ -0,0 +1,199 @@
+from typing import Any, Dict, List, Optional
+
+import geopandas
+import numpy
+import pandas
+from pandas.api import types as pandas_types
+from pydantic import BaseModel
+
+from geospatial_agent.agent.action_summarizer.sampler import DataFrameReservoir, DEFAULT_SAMPLE_SEED
+
+# Rows kept to estimate quantiles, distinct values and top values. Counts, min, max and bounds use every row.
+DEFAULT_PROFILE_SAMPLE_ROWS = 10_000
+
+_QUANTILES = [0.25, 0.5, 0.75]
+_TOP_VALUES = 3
+_MAX_VALUE_LENGTH = 30
+
+
+class ColumnProfile(BaseModel):
+    name: str
+    dtype: str
+    null_count: int = 0
+    distinct_count: Optional[int] = None
+    distinct_count_is_estimate: bool = False
+    min: Optional[Any] = None
+    max: Optional[Any] = None
+    quantiles: Optional[List[Any]] = None
+    top_values: Optional[Dict[str, float]] = None
+    geometry_types: Optional[Dict[str, int]] = None
+
+
+class DataProfile(BaseModel):
+    row_count: int
+    columns: List[ColumnProfile]
+    crs: Optional[str] = None
+    bounds: Optional[List[float]] = None
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def has_geometry(self) -> bool:
+        return any(column.dtype == "geometry" or column.geometry_types for column in self.columns)
+
+
+class DataProfiler:
+    """
+    Builds a DataProfile from data frame chunks. Row and null counts, min, max, geometry types and bounds are exact.
+    Quantiles, distinct and top values are computed from a uniform sample of at most sample_rows rows.
+    """
+
+    def __init__(self, sample_rows: int = DEFAULT_PROFILE_SAMPLE_ROWS, seed: Optional[int] = DEFAULT_SAMPLE_SEED):
+        self.row_count = 0
+        self.crs: Optional[str] = None
+        self._labels: Dict[str, Any] = {}
+        self._dtypes: Dict[str, str] = {}
+        self._null_counts: Dict[str, int] = {}
+        self._mins: Dict[str, Any] = {}
+        self._maxs: Dict[str, Any] = {}
+        self._geometry_types: Dict[str, Dict[str, int]] = {}
+        self._bounds: Optional[numpy.ndarray] = None
+        self._reservoir = DataFrameReservoir(k=sample_rows, seed=seed, complete_only=False)
+
+    def add(self, chunk: pandas.DataFrame):
+        self.row_count += len(chunk)
+        self._reservoir.add(chunk)
+
+        if isinstance(chunk, geopandas.GeoDataFrame) and chunk.crs is not None and self.crs is None:
+            self.crs = chunk.crs.to_string()
+
+        null_counts = chunk.isna().sum()
+        for column in chunk.columns:
+            name = str(column)
+            series = chunk[column]
+            self._labels.setdefault(name, column)
+            self._dtypes.setdefault(name, str(series.dtype))
+            self._null_counts[name] = self._null_counts.get(name, 0) + int(null_counts[column])
+
+            if isinstance(series, geopandas.GeoSeries):
+                self._add_geometry(name, series)
+            elif _is_ordered(series) and series.notna().any():
+                chunk_min, chunk_max = series.min(), series.max()
+                self._mins[name] = chunk_min if name not in self._mins else min(self._mins[name], chunk_min)
+                self._maxs[name] = chunk_max if name not in self._maxs else max(self._maxs[name], chunk_max)
+
+    def profile(self) -> DataProfile:
+        sample = self._reservoir.sample
+        sampled = self.row_count > self._reservoir.k
+
+        columns = []
+        for name, dtype in self._dtypes.items():
+            column = ColumnProfile(name=name, dtype=dtype, null_count=self._null_counts[name])
+            if name in self._geometry_types:
+                column.geometry_types = self._geometry_types[name]
+                columns.append(column)
+                continue
+
+            values = sample[self._labels[name]].dropna() if sample is not None else pandas.Series(dtype=object)
+            column.min = _to_builtin(self._mins.get(name))
+            column.max = _to_builtin(self._maxs.get(name))
+            column.distinct_count = int(values.astype(str).nunique()) if len(values) > 0 else 0
+            column.distinct_count_is_estimate = sampled and column.distinct_count == len(values)
+
+            if len(values) > 0 and pandas_types.is_numeric_dtype(values) and not pandas_types.is_bool_dtype(values):
+                column.quantiles = [_to_builtin(value) for value in values.quantile(_QUANTILES).tolist()]
+            elif len(values) > 0 and not _is_ordered(values):
+                shares = values.astype(str).value_counts(normalize=True).head(_TOP_VALUES)
+                column.top_values = {_shorten(str(value)): round(float(share), 3) for value, share in shares.items()}
+
+            columns.append(column)
+
+        bounds = [float(value) for value in self._bounds] if self._bounds is not None else None
+        return DataProfile(row_count=self.row_count, columns=columns, crs=self.crs, bounds=bounds)
+
+    def _add_geometry(self, name: str, series: geopandas.GeoSeries):
+        type_counts = self._geometry_types.setdefault(name, {})
+        for geometry_type, count in series.geom_type.value_counts().items():
+            type_counts[geometry_type] = type_counts.get(geometry_type, 0) + int(count)
+
+        valid = series[series.notna() & ~series.is_empty]
+        if len(valid) == 0:
+            return
+        chunk_bounds = valid.total_bounds
+        if self._bounds is None:
+            self._bounds = chunk_bounds
+        else:
+            self._bounds = numpy.concatenate([numpy.minimum(self._bounds[:2], chunk_bounds[:2]),
+                                              numpy.maximum(self._bounds[2:], chunk_bounds[2:])])
+
+
+def profile_data_frame(data_frame: pandas.DataFrame,
+                       sample_rows: int = DEFAULT_PROFILE_SAMPLE_ROWS) -> DataProfile:
+    profiler = DataProfiler(sample_rows=sample_rows)
+    profiler.add(data_frame)
+    return profiler.profile()
+
+
+def render_profile(profile: DataProfile) -> str:
+    """Renders a data profile as a compact table, one line per column."""
+    header = f"Rows: {profile.row_count}"
+    if profile.crs:
+        header += f" | CRS: {profile.crs}"
+    if profile.bounds:
+        header += f" | Bounds: [{', '.join(_format_value(value) for value in profile.bounds)}]"
+
+    lines = [header, "column | type | nulls | distinct | min | max | p25/p50/p75 | top values"]
+    for column in profile.columns:
+        distinct = "" if column.distinct_count is None else \
+            f"{'>=' if column.distinct_count_is_estimate else ''}{column.distinct_count}"
+        quantiles = "/".join(_format_value(value) for value in column.quantiles) if column.quantiles else ""
+        if column.geometry_types:
+            top_values = ", ".join(f"{name} {count}" for name, count in column.geometry_types.items())
+        elif column.top_values:
+            top_values = ", ".join(f"{value} {share:.0%}" for value, share in column.top_values.items())
+        else:
+            top_values = ""
+
+        lines.append(" | ".join([column.name, column.dtype, str(column.null_count), distinct,
+                                 _format_value(column.min), _format_value(column.max), quantiles, top_values]))
+    return "\n".join(lines)
+
+
+def render_sample_rows(data_frame: pandas.DataFrame) -> str:
+    """Renders rows of a data frame as CSV, with geometries as shortened WKT and long values shortened."""
+    rendered = pandas.DataFrame(index=data_frame.index)
+    for column in data_frame.columns:
+        series = data_frame[column]
+        if isinstance(series, geopandas.GeoSeries):
+            series = series.to_wkt()
+        rendered[str(column)] = series.map(lambda value: _shorten(str(value)) if value is not None else "")
+    return rendered.to_csv(index=False).strip()
+
+
+def _is_ordered(series: pandas.Series) -> bool:
+    return (pandas_types.is_numeric_dtype(series) and not pandas_types.is_bool_dtype(series)) or \
+        pandas_types.is_datetime64_any_dtype(series)
+
+
+def _to_builtin(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, pandas.Timestamp):
+        return value.isoformat()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return _shorten(str(value))
+
+
+def _shorten(value: str) -> str:
+    return value if len(value) <= _MAX_VALUE_LENGTH else value[:_MAX_VALUE_LENGTH - 3] + "..."
@@ -70,7 +70,7 @@ _DATA_SUMMARY_REQUIREMENTS = [
 
 _DATA_SUMMARY_PROMPT = """\
 {role_intro}
-{human_role}: You are provided with a table with some rows data. Your task is to generate a summary that describes the data in the table following the requirements below:
+{human_role}: You are provided with a profile of a table and some of its rows. Your task is to generate a summary that describes the data in the table following the requirements below:
 
 Requirements:
 {requirements}
@@ -80,7 +80,10 @@ Intended user action: {action}
 The table has following columns:
 {columns}
 
-Table:
+Table profile:
+{profile}
+
+Sample rows:
 {table}
 
 
@@ -0,0 +1,74 @@
+from typing import Optional
+
+import numpy
+import pandas
+
+# INFO: A fixed seed picks the same sample rows for the same file on every run, so data summary prompts stay the same
+# and can be answered from the LLM response cache.
+DEFAULT_SAMPLE_SEED = 0
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Rows kept of a data file to show in the data summary prompt.
+DEFAULT_SAMPLE_ROWS = 3
+
+
+class DataFrameReservoir:
+    """
+    Keeps a uniform random sample of k rows without missing values from all data frame chunks added to it, or of any
+    rows if complete_only is False. Every row gets a random key and the k rows with the smallest keys are kept, so
+    memory use is bounded by the size of one chunk plus k rows.
+    """
+
+    def __init__(self, k: int, seed: Optional[int] = DEFAULT_SAMPLE_SEED, complete_only: bool = True):
+        self.k = k
+        self.complete_only = complete_only
+        self.rows_seen = 0
+        self.complete_rows_seen = 0
+        self._rng = numpy.random.default_rng(seed)
+        self._sample: Optional[pandas.DataFrame] = None
+        self._keys: Optional[numpy.ndarray] = None
+        self._first_rows: Optional[pandas.DataFrame] = None
+
+    def add(self, chunk: pandas.DataFrame):
+        if self._first_rows is None:
+            self._first_rows = chunk.head(self.k)
+        self.rows_seen += len(chunk)
+
+        complete = chunk.dropna() if self.complete_only else chunk
+        self.complete_rows_seen += len(complete)
+        if len(complete) == 0:
+            return
+
+        keys = self._rng.random(len(complete))
+        if self._sample is not None:
+            complete = pandas.concat([self._sample, complete])
+            keys = numpy.concatenate([self._keys, keys])
+
+        if len(complete) > self.k:
+            kept = numpy.argpartition(keys, self.k)[:self.k]
+            complete, keys = complete.iloc[kept], keys[kept]
+
+        self._sample, self._keys = complete, keys
+
+    @property
+    def sample(self) -> Optional[pandas.DataFrame]:
+        """The sampled rows. If no row was complete, the first rows are returned instead."""
+        if self._sample is None:
+            return None if self._first_rows is None else self._first_rows.reset_index(drop=True)
+        return self._sample.iloc[numpy.argsort(self._keys)].reset_index(drop=True)
+
+
+def sample_data_frame(data_frame: pandas.DataFrame, k: int = DEFAULT_SAMPLE_ROWS,
+                      seed: Optional[int] = DEFAULT_SAMPLE_SEED) -> pandas.DataFrame:
+    """
+    Returns a copy of k random rows without missing values of a loaded data frame, in their original order, so the
+    data frame itself can be released. If no row is complete, rows with missing values are sampled instead.
+    """
+    complete = data_frame.dropna()
+    if len(complete) == 0:
+        complete = data_frame
+    if len(complete) > k:
+        positions = numpy.sort(numpy.random.default_rng(seed).choice(len(complete), size=k, replace=False))
+        complete = complete.iloc[positions]
+    return complete.copy()
@@ -0,0 +1,165 @@
+import itertools
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import fiona
+import geopandas
+import pandas
+
+from geospatial_agent.agent.action_summarizer.profiler import DataProfile, DataProfiler
+from geospatial_agent.agent.action_summarizer.sampler import DataFrameReservoir, DEFAULT_CHUNK_SIZE, \
+    DEFAULT_SAMPLE_SEED, DEFAULT_SAMPLE_ROWS
+from geospatial_agent.shared.shim import get_data_file_url
+
+# Features of vector files are read one by one, and profiled in chunks of this size.
+DEFAULT_VECTOR_CHUNK_SIZE = 10_000
+
+CSV_EXTENSIONS = {".csv", ".tsv", ".txt"}
+VECTOR_EXTENSIONS = {".geojson", ".json", ".shp", ".zip", ".gpkg"}
+PARQUET_EXTENSIONS = {".parquet", ".geoparquet"}
+
+
+class SchemaSniffingException(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class SniffedSchema:
+    """Profile of a data file, with a few complete rows as sample."""
+
+    def __init__(self, file_url: str, sample: pandas.DataFrame, profile: DataProfile):
+        self.file_url = file_url
+        self.sample = sample
+        self.profile = profile
+
+    @property
+    def column_names(self) -> List[str]:
+        return self.profile.column_names
+
+    @property
+    def dtypes(self) -> Dict[str, str]:
+        return {column.name: column.dtype for column in self.profile.columns}
+
+    @property
+    def crs(self) -> Optional[str]:
+        return self.profile.crs
+
+    @property
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        return tuple(self.profile.bounds) if self.profile.bounds else None
+
+
+def is_sniffable(file_url: str) -> bool:
+    """Returns True if the file format of file_url can be read by sniff_schema."""
+    return _get_extension(file_url) in CSV_EXTENSIONS | VECTOR_EXTENSIONS | PARQUET_EXTENSIONS
+
+
+def sniff_schema(file_url: str,
+                 session_id: str,
+                 sample_rows: int = DEFAULT_SAMPLE_ROWS,
+                 max_rows: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 seed: Optional[int] = DEFAULT_SAMPLE_SEED) -> SniffedSchema:
+    """
+    Reads the schema of a CSV, GeoJSON, Shapefile, zipped Shapefile, GeoPackage or Parquet file, and a uniform random
+    sample of rows without missing values, and profiles its columns. The file is read once in chunks of chunk_size
+    rows, or feature by feature, and never loaded as a whole. If max_rows is given, only the first max_rows rows are
+    read.
+    """
+    extension = _get_extension(file_url)
+    if not is_sniffable(file_url):
+        raise SchemaSniffingException(message=f"Can not read schema of {file_url}, unsupported format {extension}")
+
+    resolved_file_url = get_data_file_url(file_url, session_id)
+    try:
+        if extension in CSV_EXTENSIONS:
+            return _sniff_csv(file_url, resolved_file_url, sample_rows, max_rows, chunk_size, seed)
+        elif extension in PARQUET_EXTENSIONS:
+            return _sniff_parquet(file_url, resolved_file_url, sample_rows, max_rows, chunk_size, seed)
+        else:
+            return _sniff_vector(file_url, resolved_file_url, sample_rows, max_rows, DEFAULT_VECTOR_CHUNK_SIZE, seed)
+    except SchemaSniffingException:
+        raise
+    except Exception as e:
+        raise SchemaSniffingException(message=f"Failed to read schema of {file_url}: {e}") from e
+
+
+def _sniff_csv(file_url: str, resolved_file_url: str, sample_rows: int, max_rows: Optional[int], chunk_size: int,
+               seed: Optional[int]) -> SniffedSchema:
+    separator = "\t" if _get_extension(file_url) == ".tsv" else ","
+    with pandas.read_csv(resolved_file_url, sep=separator, chunksize=chunk_size, nrows=max_rows) as reader:
+        return _sniff_chunks(file_url, reader, sample_rows, seed)
+
+
+def _sniff_vector(file_url: str, resolved_file_url: str, sample_rows: int, max_rows: Optional[int],
+                  chunk_size: int, seed: Optional[int]) -> SniffedSchema:
+    if _get_extension(file_url) == ".zip" and not resolved_file_url.startswith("zip"):
+        resolved_file_url = f"zip://{resolved_file_url}"
+
+    with fiona.open(resolved_file_url) as collection:
+        crs = collection.crs.to_string() if collection.crs else None
+        columns = list(collection.schema["properties"].keys()) + ["geometry"]
+        features = iter(collection) if max_rows is None else itertools.islice(collection, max_rows)
+
+        def read_chunks():
+            # INFO: Features are read one by one, and turned into a data frame every chunk_size features.
+            while True:
+                features_chunk = list(itertools.islice(features, chunk_size))
+                if len(features_chunk) == 0:
+                    return
+                yield geopandas.GeoDataFrame.from_features(features_chunk, crs=crs, columns=columns)
+
+        return _sniff_chunks(file_url, read_chunks(), sample_rows, seed)
+
+
+def _sniff_parquet(file_url: str, resolved_file_url: str, sample_rows: int, max_rows: Optional[int],
+                   chunk_size: int, seed: Optional[int]) -> SniffedSchema:
+    try:
+        import pyarrow.parquet
+    except ImportError as e:
+        raise SchemaSniffingException(message="Reading parquet files requires pyarrow") from e
+
+    parquet_file = pyarrow.parquet.ParquetFile(resolved_file_url)
+
+    # INFO: GeoParquet files describe their geometry columns in the "geo" file metadata, geometries are WKB encoded.
+    geo_metadata = (parquet_file.schema_arrow.metadata or {}).get(b"geo")
+    geo = json.loads(geo_metadata) if geo_metadata is not None else None
+
+    def read_chunks():
+        rows_read = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            chunk = batch.to_pandas()
+            if max_rows is not None:
+                chunk = chunk.head(max_rows - rows_read)
+            rows_read += len(chunk)
+
+            if geo is not None:
+                geometry_column = geo["primary_column"]
+                crs = geo["columns"][geometry_column].get("crs", "OGC:CRS84")
+                chunk[geometry_column] = geopandas.GeoSeries.from_wkb(chunk[geometry_column])
+                chunk = geopandas.GeoDataFrame(chunk, geometry=geometry_column, crs=crs)
+            yield chunk
+
+            if max_rows is not None and rows_read >= max_rows:
+                return
+
+    return _sniff_chunks(file_url, read_chunks(), sample_rows, seed)
+
+
+def _sniff_chunks(file_url: str, chunks: Iterable[pandas.DataFrame], sample_rows: int,
+                  seed: Optional[int]) -> SniffedSchema:
+    reservoir = DataFrameReservoir(k=sample_rows, seed=seed)
+    profiler = DataProfiler(seed=seed)
+    for chunk in chunks:
+        reservoir.add(chunk)
+        profiler.add(chunk)
+
+    if reservoir.sample is None:
+        raise SchemaSniffingException(message=f"No rows found in {file_url}")
+    return SniffedSchema(file_url=file_url, sample=reservoir.sample, profile=profiler.profile())
+
+
+def _get_extension(file_url: str) -> str:
+    return os.path.splitext(file_url.split("?")[0])[1].lower()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import geopandas
+import pandas
+from pydantic import BaseModel
+
+from geospatial_agent.agent.action_summarizer.profiler import DataProfile
+from geospatial_agent.shared.cache import PersistentLRUCache, get_persistent_cache_from_env
+from geospatial_agent.shared.shim import get_data_file_url
+
+ENV_SUMMARY_CACHE_PREFIX = "SUMMARY_CACHE"
+ENV_SUMMARY_CACHE_PATH = f"{ENV_SUMMARY_CACHE_PREFIX}_PATH"
+ENV_SUMMARY_CACHE_MAX_SIZE_MB = f"{ENV_SUMMARY_CACHE_PREFIX}_MAX_SIZE_MB"
+ENV_SUMMARY_CACHE_TTL_SECONDS = f"{ENV_SUMMARY_CACHE_PREFIX}_TTL_SECONDS"
+
+_SUMMARY_CACHE_NAMESPACE = "file_summaries"
+
+# Bytes hashed at the start, the middle and the end of a file. Smaller files are hashed as a whole.
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+# Bump when the cached value format or the way summaries are generated changes, so old entries are not used.
+_CACHE_VERSION = 1
+
+# A Shapefile is read together with these files next to it, a change in any of them changes the data.
+_SHAPEFILE_SIDECAR_EXTENSIONS = [".dbf", ".shx", ".prj", ".cpg"]
+
+
+class CachedFileSummary(BaseModel):
+    file_url: str
+    column_names: List[str]
+    file_summary: str
+    profile: Optional[DataProfile] = None
+    sample_rows: List[Dict[str, Any]] = []
+
+    def get_sample_data_frame(self) -> pandas.DataFrame:
+        return pandas.DataFrame.from_records(self.sample_rows)
+
+
+def fingerprint_file(file_path: str) -> Optional[str]:
+    """
+    Returns a fingerprint of a local file from its size, modification time and a hash of its first, middle and last
+    FINGERPRINT_BLOCK_SIZE bytes. Returns None if file_path is not a local file.
+    """
+    paths = [file_path]
+    if os.path.splitext(file_path)[1].lower() == ".shp":
+        stem = os.path.splitext(file_path)[0]
+        paths += [stem + extension for extension in _SHAPEFILE_SIDECAR_EXTENSIONS
+                  if os.path.isfile(stem + extension)]
+
+    digest = hashlib.sha256()
+    try:
+        for path in paths:
+            if not os.path.isfile(path):
+                return None
+            stat = os.stat(path)
+            digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+            with open(path, "rb") as file:
+                for offset in _get_block_offsets(stat.st_size):
+                    file.seek(offset)
+                    digest.update(file.read(FINGERPRINT_BLOCK_SIZE))
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+
+class FileSummaryCache:
+    """
+    Keeps file summaries, profiles and sample rows in a PersistentLRUCache, keyed by the fingerprint of the data file,
+    the action and the model that wrote the summary. Only local files are cached. Each file also has an index entry
+    with the fingerprint its summaries were made for, so summaries of a file that changed are deleted on next use
+    instead of waiting to be evicted.
+    """
+
+    def __init__(self, store: PersistentLRUCache):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_url: str, session_id: str, action: str, model_id: str) -> Optional[CachedFileSummary]:
+        resolved_path = _resolve_local_path(file_url, session_id)
+        fingerprint = fingerprint_file(resolved_path) if resolved_path else None
+        if fingerprint is None:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            self._invalidate_if_changed(resolved_path, fingerprint)
+            value = self.store.get(self._get_key(fingerprint, action, model_id))
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        cached = CachedFileSummary.model_validate_json(value)
+        cached.file_url = file_url
+        return cached
+
+    def set(self, session_id: str, action: str, model_id: str, summary: CachedFileSummary):
+        resolved_path = _resolve_local_path(summary.file_url, session_id)
+        fingerprint = fingerprint_file(resolved_path) if resolved_path else None
+        if fingerprint is None:
+            return
+
+        key = self._get_key(fingerprint, action, model_id)
+        with self._lock:
+            index = self._invalidate_if_changed(resolved_path, fingerprint) or {"fingerprint": fingerprint, "keys": []}
+            self.store.set(key, summary.model_dump_json().encode("utf-8"))
+            if key not in index["keys"]:
+                index["keys"].append(key)
+            self.store.set(self._get_index_key(resolved_path), json.dumps(index).encode("utf-8"))
+
+    def invalidate(self, file_url: str, session_id: str):
+        """Deletes all cached summaries of file_url."""
+        resolved_path = _resolve_local_path(file_url, session_id)
+        if resolved_path is None:
+            return
+        with self._lock:
+            self._delete_index(resolved_path, self._read_index(resolved_path))
+
+    def _invalidate_if_changed(self, resolved_path: str, fingerprint: str) -> Optional[dict]:
+        index = self._read_index(resolved_path)
+        if index is not None and index["fingerprint"] != fingerprint:
+            self._delete_index(resolved_path, index)
+            return None
+        return index
+
+    def _read_index(self, resolved_path: str) -> Optional[dict]:
+        value = self.store.get(self._get_index_key(resolved_path))
+        return json.loads(value) if value is not None else None
+
+    def _delete_index(self, resolved_path: str, index: Optional[dict]):
+        if index is None:
+            return
+        for key in index["keys"]:
+            self.store.delete(key)
+        self.store.delete(self._get_index_key(resolved_path))
+
+    @staticmethod
+    def _get_key(fingerprint: str, action: str, model_id: str) -> str:
+        key_source = json.dumps([_CACHE_VERSION, fingerprint, action, model_id])
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _get_index_key(resolved_path: str) -> str:
+        return "file:" + hashlib.sha256(os.path.abspath(resolved_path).encode("utf-8")).hexdigest()
+
+
+def to_sample_rows(data_frame: Any) -> List[Dict[str, Any]]:
+    """Converts sample rows of a data frame to JSON serializable records, geometries as WKT."""
+    if not isinstance(data_frame, pandas.DataFrame):
+        return []
+
+    data_frame = pandas.DataFrame(data_frame)
+    for column in data_frame.columns:
+        if isinstance(data_frame[column].dtype, geopandas.array.GeometryDtype):
+            data_frame[column] = geopandas.GeoSeries(data_frame[column]).to_wkt()
+    data_frame.columns = [str(column) for column in data_frame.columns]
+    return json.loads(data_frame.to_json(orient="records", date_format="iso", default_handler=str))
+
+
+def get_file_summary_cache() -> Optional[FileSummaryCache]:
+    """
+    Returns a file summary cache if SUMMARY_CACHE_PATH environment variable is set. Caches of the same path share one
+    store.
+    """
+    store = get_persistent_cache_from_env(ENV_SUMMARY_CACHE_PREFIX, _SUMMARY_CACHE_NAMESPACE)
+    if store is None:
+        return None
+    return FileSummaryCache(store=store)
+
+
+def _resolve_local_path(file_url: str, session_id: str) -> Optional[str]:
+    try:
+        resolved = get_data_file_url(file_url, session_id)
+    except (FileNotFoundError, ValueError):
+        return None
+    if "://" in resolved:
+        return None
+    return resolved
+
+
+def _get_block_offsets(size: int) -> List[int]:
+    if size <= 3 * FINGERPRINT_BLOCK_SIZE:
+        return [offset for offset in range(0, size, FINGERPRINT_BLOCK_SIZE)] or [0]
+    return [0, size // 2 - FINGERPRINT_BLOCK_SIZE // 2, size - FINGERPRINT_BLOCK_SIZE]
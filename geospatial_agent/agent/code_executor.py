@@ -0,0 +1,307 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from multiprocessing.connection import Connection
+from typing import Callable, List, Optional
+
+from geospatial_agent.agent.execution_limits import ExecutionLimits, CodeExecutionLimitExceeded, LIMIT_CPU, \
+    LIMIT_WALL_CLOCK, get_execution_limits_from_env, get_process_cpu_seconds
+from geospatial_agent.agent.shared import CodeExecutionResult, EXECUTED_CODE_FILE_NAME, execute_assembled_code, \
+    get_resident_memory_bytes, ResultProcessor
+
+ENV_CODE_EXECUTOR_WORKERS = "CODE_EXECUTOR_WORKERS"
+ENV_CODE_EXECUTOR_MAX_JOBS_PER_WORKER = "CODE_EXECUTOR_MAX_JOBS_PER_WORKER"
+ENV_CODE_EXECUTOR_MAX_WORKER_MEMORY_MB = "CODE_EXECUTOR_MAX_WORKER_MEMORY_MB"
+
+DEFAULT_MAX_JOBS_PER_WORKER = 20
+DEFAULT_MAX_WORKER_MEMORY_MB = 2048
+
+# Modules imported by every worker before it takes its first job, so generated code does not pay for importing them.
+DEFAULT_WARM_IMPORTS = ["pandas", "geopandas", "shapely", "pyproj", "pydeck", "matplotlib.pyplot", "networkx",
+                        "geospatial_agent.shared.shim"]
+
+_MESSAGE_OUTPUT = "output"
+_MESSAGE_RESULT = "result"
+_MESSAGE_ERROR = "error"
+_MESSAGE_LIMIT_EXCEEDED = "limit_exceeded"
+
+# Time after a wall clock or CPU limit that a worker gets to stop by itself, before it is killed.
+DEFAULT_KILL_GRACE_SECONDS = 5.0
+_WATCHDOG_INTERVAL_SECONDS = 0.5
+# RLIMIT_CPU is set in whole seconds, so a worker may use up to a second more than its CPU limit before SIGXCPU.
+_CPU_LIMIT_GRANULARITY_SECONDS = 1.0
+
+_default_executor: Optional["CodeExecutor"] = None
+_default_executor_lock = threading.Lock()
+
+
+class CodeExecutorException(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class CodeExecutor(ABC):
+    def __init__(self, limits: Optional[ExecutionLimits] = None):
+        self.limits = limits
+
+    @abstractmethod
+    def execute(self,
+                code: str,
+                result_names: Optional[List[str]] = None,
+                filename: str = EXECUTED_CODE_FILE_NAME,
+                on_output: Optional[Callable[[str], None]] = None,
+                limits: Optional[ExecutionLimits] = None,
+                result_processor: Optional[ResultProcessor] = None) -> CodeExecutionResult:
+        """
+        Executes code with limits, or with the limits of the executor if limits is None. result_processor runs where
+        the code runs, so only what it returns for the results is handed back.
+        """
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class InProcessCodeExecutor(CodeExecutor):
+    """
+    Executes code in the agent process, with execute_assembled_code. Only the wall clock limit is enforced, as CPU and
+    memory limits would apply to the agent itself.
+    """
+
+    def execute(self,
+                code: str,
+                result_names: Optional[List[str]] = None,
+                filename: str = EXECUTED_CODE_FILE_NAME,
+                on_output: Optional[Callable[[str], None]] = None,
+                limits: Optional[ExecutionLimits] = None,
+                result_processor: Optional[ResultProcessor] = None) -> CodeExecutionResult:
+        return execute_assembled_code(code, result_names=result_names, filename=filename, on_output=on_output,
+                                      limits=limits or self.limits, result_processor=result_processor)
+
+
+class SubprocessCodeExecutorPool(CodeExecutor):
+    """
+    Executes code in a pool of worker processes that import warm_imports when they start, before their first job.
+    Output is streamed back while the code runs, and the requested results are sent back pickled, after the result
+    processor ran on them in the worker. The result processor has to be picklable, like a module level function. A
+    worker is replaced by a new one after max_jobs_per_worker jobs, when its resident memory grows over
+    max_worker_memory_mb, or when it dies, so a crash or a leak of generated code does not take down the agent.
+
+    Wall clock, CPU and memory limits are enforced inside the worker. If the code does not stop within
+    kill_grace_seconds after a wall clock or CPU limit, the worker is killed.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER,
+                 max_worker_memory_mb: float = DEFAULT_MAX_WORKER_MEMORY_MB,
+                 warm_imports: Optional[List[str]] = None,
+                 limits: Optional[ExecutionLimits] = None,
+                 kill_grace_seconds: float = DEFAULT_KILL_GRACE_SECONDS):
+        super().__init__(limits=limits)
+        if workers < 1:
+            raise CodeExecutorException(message=f"Code executor pool needs at least one worker, got {workers}")
+
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_memory_bytes = int(max_worker_memory_mb * 1024 * 1024)
+        self.warm_imports = DEFAULT_WARM_IMPORTS if warm_imports is None else warm_imports
+        self.kill_grace_seconds = kill_grace_seconds
+        self.recycled_workers = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._idle_workers: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._is_shut_down = False
+
+        for _ in range(workers):
+            self._idle_workers.put(self._start_worker())
+
+    def execute(self,
+                code: str,
+                result_names: Optional[List[str]] = None,
+                filename: str = EXECUTED_CODE_FILE_NAME,
+                on_output: Optional[Callable[[str], None]] = None,
+                limits: Optional[ExecutionLimits] = None,
+                result_processor: Optional[ResultProcessor] = None) -> CodeExecutionResult:
+        if self._is_shut_down:
+            raise CodeExecutorException(message="Code executor pool is shut down")
+
+        limits = limits or self.limits
+        worker = self._idle_workers.get()
+        try:
+            message_type, payload = worker.run(code, result_names or [], filename, on_output, limits,
+                                               result_processor, self.kill_grace_seconds)
+        except CodeExecutionLimitExceeded:
+            self._replace_worker(worker, kill=True)
+            raise
+        except (EOFError, OSError) as e:
+            self._replace_worker(worker, kill=True)
+            raise CodeExecutorException(
+                message=f"Code executor worker {worker.process.pid} exited with code "
+                        f"{worker.process.exitcode} while executing code") from e
+        except BaseException:
+            # INFO: The worker may still be running the code, so it can not take another job.
+            self._replace_worker(worker, kill=True)
+            raise
+
+        if worker.jobs >= self.max_jobs_per_worker or \
+                (worker.memory_bytes or 0) > self.max_worker_memory_bytes:
+            self._replace_worker(worker)
+        else:
+            self._idle_workers.put(worker)
+
+        if message_type == _MESSAGE_LIMIT_EXCEEDED:
+            raise payload
+        if message_type == _MESSAGE_ERROR:
+            raise CodeExecutorException(message=payload)
+        return CodeExecutionResult(**payload)
+
+    def shutdown(self):
+        with self._lock:
+            self._is_shut_down = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+    def _start_worker(self) -> "_Worker":
+        worker = _Worker(self._context, self.warm_imports)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace_worker(self, worker: "_Worker", kill: bool = False):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.recycled_workers += 1
+        worker.stop(kill=kill)
+        if not self._is_shut_down:
+            self._idle_workers.put(self._start_worker())
+
+
+class _Worker:
+    def __init__(self, context, warm_imports: List[str]):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_run_worker, args=(worker_connection, warm_imports), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        self.jobs = 0
+        self.memory_bytes: Optional[int] = None
+
+    def run(self, code: str, result_names: List[str], filename: str, on_output: Optional[Callable[[str], None]],
+            limits: Optional[ExecutionLimits], result_processor: Optional[ResultProcessor], kill_grace_seconds: float):
+        self.connection.send((code, result_names, filename, on_output is not None, limits, result_processor))
+        self.jobs += 1
+        watchdog = _Watchdog(self.process.pid, limits, kill_grace_seconds)
+        while True:
+            while not self.connection.poll(_WATCHDOG_INTERVAL_SECONDS):
+                watchdog.check()
+
+            message_type, payload, memory_bytes = self.connection.recv()
+            if message_type == _MESSAGE_OUTPUT:
+                on_output(payload)
+                continue
+            self.memory_bytes = memory_bytes
+            return message_type, payload
+
+    def stop(self, kill: bool = False):
+        if not kill:
+            try:
+                self.connection.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class _Watchdog:
+    """Raises CodeExecutionLimitExceeded once a worker runs kill_grace_seconds over its wall clock or CPU limit."""
+
+    def __init__(self, pid: int, limits: Optional[ExecutionLimits], kill_grace_seconds: float):
+        self.pid = pid
+        self.limits = limits
+        self.kill_grace_seconds = kill_grace_seconds
+        self.start = time.monotonic()
+        self.start_cpu_seconds = get_process_cpu_seconds(pid) if limits and limits.cpu_seconds else None
+
+    def check(self):
+        if self.limits is None:
+            return
+
+        elapsed = time.monotonic() - self.start
+        if self.limits.wall_clock_seconds is not None and \
+                elapsed > self.limits.wall_clock_seconds + self.kill_grace_seconds:
+            raise CodeExecutionLimitExceeded(limit=LIMIT_WALL_CLOCK, limit_value=self.limits.wall_clock_seconds,
+                                             elapsed_seconds=elapsed)
+
+        if self.start_cpu_seconds is not None:
+            cpu_seconds = get_process_cpu_seconds(self.pid)
+            if cpu_seconds is not None and \
+                    cpu_seconds - self.start_cpu_seconds > \
+                    self.limits.cpu_seconds + _CPU_LIMIT_GRANULARITY_SECONDS + self.kill_grace_seconds:
+                raise CodeExecutionLimitExceeded(limit=LIMIT_CPU, limit_value=self.limits.cpu_seconds,
+                                                 elapsed_seconds=elapsed)
+
+
+def _run_worker(connection: Connection, warm_imports: List[str]):
+    for module_name in warm_imports:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        code, result_names, filename, stream_output, limits, result_processor = job
+        on_output = (lambda text: connection.send((_MESSAGE_OUTPUT, text, None))) if stream_output else None
+        try:
+            result = execute_assembled_code(code, result_names=result_names, filename=filename, on_output=on_output,
+                                            limits=limits, owns_process=True, result_processor=result_processor)
+            payload = {"output": result.output, "results": result.results,
+                       "peak_memory_bytes": result.peak_memory_bytes,
+                       "process_peak_memory_bytes": result.process_peak_memory_bytes,
+                       "duration_seconds": result.duration_seconds}
+            connection.send((_MESSAGE_RESULT, payload, get_resident_memory_bytes()))
+        except CodeExecutionLimitExceeded as e:
+            connection.send((_MESSAGE_LIMIT_EXCEEDED, e, get_resident_memory_bytes()))
+        except Exception as e:
+            message = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            connection.send((_MESSAGE_ERROR, message, get_resident_memory_bytes()))
+
+
+def get_code_executor() -> CodeExecutor:
+    """
+    Returns the process-wide code executor. If CODE_EXECUTOR_WORKERS environment variable is set to a positive number,
+    it is a pool of that many worker processes, otherwise code is executed in the agent process. Execution limits are
+    read from CODE_EXECUTION_TIMEOUT_SECONDS, CODE_EXECUTION_CPU_SECONDS and CODE_EXECUTION_MEMORY_MB.
+    """
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            workers = int(os.environ.get(ENV_CODE_EXECUTOR_WORKERS) or 0)
+            if workers > 0:
+                max_jobs = os.environ.get(ENV_CODE_EXECUTOR_MAX_JOBS_PER_WORKER)
+                max_memory_mb = os.environ.get(ENV_CODE_EXECUTOR_MAX_WORKER_MEMORY_MB)
+                _default_executor = SubprocessCodeExecutorPool(
+                    workers=workers,
+                    max_jobs_per_worker=int(max_jobs) if max_jobs else DEFAULT_MAX_JOBS_PER_WORKER,
+                    max_worker_memory_mb=float(max_memory_mb) if max_memory_mb else DEFAULT_MAX_WORKER_MEMORY_MB,
+                    limits=get_execution_limits_from_env())
+            else:
+                _default_executor = InProcessCodeExecutor(limits=get_execution_limits_from_env())
+        return _default_executor
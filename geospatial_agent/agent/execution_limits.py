@@ -0,0 +1,183 @@
+import math
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from types import FrameType, TracebackType
+from typing import Iterator, Optional
+
+from pydantic import BaseModel
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENV_CODE_EXECUTION_TIMEOUT_SECONDS = "CODE_EXECUTION_TIMEOUT_SECONDS"
+ENV_CODE_EXECUTION_CPU_SECONDS = "CODE_EXECUTION_CPU_SECONDS"
+ENV_CODE_EXECUTION_MEMORY_MB = "CODE_EXECUTION_MEMORY_MB"
+
+LIMIT_WALL_CLOCK = "wall_clock"
+LIMIT_CPU = "cpu"
+LIMIT_MEMORY = "memory"
+
+# Once a limit is hit, the limit error is raised again at this interval, in case the generated code catches it.
+_REPEAT_INTERVAL_SECONDS = 1.0
+
+
+class ExecutionLimits(BaseModel):
+    """
+    Limits of one execution of generated code. memory_mb is the address space the code may allocate on top of what
+    the process already uses. CPU and memory limits are process wide, so they are only applied in worker processes.
+    """
+    wall_clock_seconds: Optional[float] = None
+    cpu_seconds: Optional[float] = None
+    memory_mb: Optional[float] = None
+
+
+class CodeExecutionLimitExceeded(Exception):
+    def __init__(self, limit: str, limit_value: float, elapsed_seconds: float, operation: Optional[str] = None,
+                 line_number: Optional[int] = None):
+        self.limit = limit
+        self.limit_value = limit_value
+        self.elapsed_seconds = elapsed_seconds
+        self.operation = operation
+        self.line_number = line_number
+        self.message = f"Execution stopped after {elapsed_seconds:.1f} seconds, {limit} limit of {limit_value} " \
+                       f"{'MB' if limit == LIMIT_MEMORY else 'seconds'} exceeded while running " \
+                       f"{operation or 'an unknown operation'}" + \
+                       (f" at line {line_number}" if line_number is not None else "")
+        super().__init__(self.message)
+
+    def __reduce__(self):
+        return CodeExecutionLimitExceeded, (self.limit, self.limit_value, self.elapsed_seconds, self.operation,
+                                            self.line_number)
+
+
+def get_execution_limits_from_env() -> ExecutionLimits:
+    def read(name: str) -> Optional[float]:
+        value = os.environ.get(name)
+        return float(value) if value else None
+
+    return ExecutionLimits(wall_clock_seconds=read(ENV_CODE_EXECUTION_TIMEOUT_SECONDS),
+                           cpu_seconds=read(ENV_CODE_EXECUTION_CPU_SECONDS),
+                           memory_mb=read(ENV_CODE_EXECUTION_MEMORY_MB))
+
+
+@contextmanager
+def enforce_limits(limits: Optional[ExecutionLimits], filename: str, apply_process_limits: bool = False) -> Iterator:
+    """
+    Stops the code run inside the with block with CodeExecutionLimitExceeded once it runs longer than the wall clock
+    limit, uses more CPU time than the CPU limit or fails to allocate memory over the memory limit. The error names
+    the innermost function of filename that was running. The wall clock limit uses SIGALRM, so it is only enforced
+    in the main thread.
+    """
+    if limits is None:
+        yield
+        return
+
+    start = time.monotonic()
+    restore = []
+    hit_limit = []
+
+    def raise_limit(limit: str, limit_value: float, frame: Optional[FrameType]):
+        operation, line_number = _find_operation(frame, filename)
+        error = CodeExecutionLimitExceeded(limit=limit, limit_value=limit_value,
+                                           elapsed_seconds=time.monotonic() - start,
+                                           operation=operation, line_number=line_number)
+        hit_limit.append(error)
+        raise error
+
+    is_main_thread = threading.current_thread() is threading.main_thread()
+    try:
+        if limits.wall_clock_seconds is not None and is_main_thread and hasattr(signal, "setitimer"):
+            previous_handler = signal.signal(
+                signal.SIGALRM, lambda signum, frame: raise_limit(LIMIT_WALL_CLOCK, limits.wall_clock_seconds, frame))
+            restore.append(lambda: signal.signal(signal.SIGALRM, previous_handler))
+            signal.setitimer(signal.ITIMER_REAL, limits.wall_clock_seconds, _REPEAT_INTERVAL_SECONDS)
+            restore.append(lambda: signal.setitimer(signal.ITIMER_REAL, 0))
+
+        if apply_process_limits and resource is not None:
+            if limits.cpu_seconds is not None and is_main_thread:
+                # INFO: RLIMIT_CPU counts the CPU time of the whole process, so the limit is set above the time used
+                # so far. The kernel sends SIGXCPU every second after the soft limit. The hard limit is left as is,
+                # so the worker can be reused, and the parent process kills workers that do not stop.
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                soft_limit = math.ceil(usage.ru_utime + usage.ru_stime + limits.cpu_seconds)
+                previous_cpu_handler = signal.signal(
+                    signal.SIGXCPU, lambda signum, frame: raise_limit(LIMIT_CPU, limits.cpu_seconds, frame))
+                restore.append(lambda: signal.signal(signal.SIGXCPU, previous_cpu_handler))
+                restore.append(_set_soft_limit(resource.RLIMIT_CPU, soft_limit))
+
+            address_space_bytes = _get_address_space_bytes()
+            if limits.memory_mb is not None and address_space_bytes is not None:
+                soft_limit = address_space_bytes + int(limits.memory_mb * 1024 * 1024)
+                restore.append(_set_soft_limit(resource.RLIMIT_AS, soft_limit))
+
+        yield
+    except MemoryError as e:
+        if limits.memory_mb is None or not apply_process_limits:
+            raise
+        operation, line_number = _find_operation_in_traceback(e.__traceback__, filename)
+        raise CodeExecutionLimitExceeded(limit=LIMIT_MEMORY, limit_value=limits.memory_mb,
+                                         elapsed_seconds=time.monotonic() - start,
+                                         operation=operation, line_number=line_number) from e
+    finally:
+        for restore_step in reversed(restore):
+            restore_step()
+
+    if hit_limit:
+        # INFO: The generated code caught the limit error and finished anyway.
+        raise hit_limit[0]
+
+
+def _set_soft_limit(limit: int, soft_limit: int):
+    previous_soft, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        soft_limit = min(soft_limit, hard)
+    resource.setrlimit(limit, (soft_limit, hard))
+    return lambda: resource.setrlimit(limit, (previous_soft, hard))
+
+
+def _get_address_space_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _find_operation(frame: Optional[FrameType], filename: str):
+    while frame is not None:
+        if frame.f_code.co_filename == filename:
+            return _get_operation_name(frame.f_code.co_name), frame.f_lineno
+        frame = frame.f_back
+    return None, None
+
+
+def _find_operation_in_traceback(tb: Optional[TracebackType], filename: str):
+    operation, line_number = None, None
+    while tb is not None:
+        if tb.tb_frame.f_code.co_filename == filename:
+            operation, line_number = _get_operation_name(tb.tb_frame.f_code.co_name), tb.tb_lineno
+        tb = tb.tb_next
+    return operation, line_number
+
+
+def _get_operation_name(function_name: str) -> str:
+    return "top level code" if function_name == "<module>" else function_name
+
+
+def get_process_cpu_seconds(pid: int) -> Optional[float]:
+    """Returns the CPU time used by process pid so far, or None if it can not be read."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            # INFO: The process name can contain spaces, fields are counted after its closing parenthesis.
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
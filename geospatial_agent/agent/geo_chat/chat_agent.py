@@ -1,4 +1,4 @@
-from typing import Sequence
+from typing import Dict, Optional, Sequence, Tuple
 
 from langchain.agents import AgentExecutor, ZeroShotAgent
 from langchain.tools import BaseTool
@@ -8,7 +8,7 @@ from geospatial_agent.agent.geo_chat.tools.geocode_tool import geocode_tool
 from geospatial_agent.agent.geo_chat.tools.gis_work_tool import gis_work_tool
 from geospatial_agent.agent.shared import AgentSignal, EventType, SIGNAL_GEO_CHAT_INITIATED, \
     SENDER_GEO_CHAT_AGENT, SIGNAL_GEO_CHAT_RESPONSE_COMPLETE
-from geospatial_agent.shared.bedrock import get_claude_v2
+from geospatial_agent.shared.llm_stages import StageLLMFactory, get_stage_llm_factory, STAGE_CHAT
 from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE
 
 _PREFIX = f"""\
@@ -70,16 +70,14 @@ class GeoChatAgent:
     If no, then it converses with the customer with the help of some tools.
     """
 
-    def __init__(self, memory=None):
+    def __init__(self, memory=None, llm_factory: Optional[StageLLMFactory] = None):
         self.memory = memory
-        self.claude_v2 = get_claude_v2()
+        self.llm_factory = llm_factory or get_stage_llm_factory()
+        self.llm = self.llm_factory.get_llm(STAGE_CHAT)
+        self._agent_executors: Dict[Tuple[str, str], AgentExecutor] = {}
 
     def invoke(self, agent_input: str, storage_mode: str, session_id: str) -> str:
-        tools: Sequence[BaseTool] = [geocode_tool(), gis_work_tool(session_id=session_id, storage_mode=storage_mode)]
-        agent = ZeroShotAgent.from_llm_and_tools(
-            llm=self.claude_v2, tools=tools,
-            prefix=_PREFIX, suffix=_SUFFIX, input_variables=["input", "agent_scratchpad"],
-            format_instructions=_FORMAT_INSTRUCTIONS, memory=self.memory)
+        agent_executor = self._get_agent_executor(session_id=session_id, storage_mode=storage_mode)
 
         dispatcher.send(signal=SIGNAL_GEO_CHAT_INITIATED,
                         sender=SENDER_GEO_CHAT_AGENT,
@@ -88,7 +86,6 @@ class GeoChatAgent:
                             event_message="Initiating Agent Smith, your conversational geospatial agent",
                         ))
 
-        agent_executor = AgentExecutor.from_agent_and_tools(agent=agent, tools=tools, memory=self.memory)
         output = agent_executor.run(input=agent_input, chat_history=[])
         dispatcher.send(signal=SIGNAL_GEO_CHAT_RESPONSE_COMPLETE,
                         sender=SENDER_GEO_CHAT_AGENT,
@@ -99,3 +96,22 @@ class GeoChatAgent:
                             is_final=True,
                         ))
         return output
+
+    def _get_agent_executor(self, session_id: str, storage_mode: str) -> AgentExecutor:
+        """
+        Returns the agent executor of a session. The agent, its compiled prompt and its tools are built on the first
+        turn of a session and reused for every following turn.
+        """
+        key = (session_id, storage_mode)
+        if key not in self._agent_executors:
+            tools: Sequence[BaseTool] = [geocode_tool(),
+                                         gis_work_tool(session_id=session_id, storage_mode=storage_mode,
+                                                       llm_factory=self.llm_factory)]
+            agent = ZeroShotAgent.from_llm_and_tools(
+                llm=self.llm, tools=tools,
+                prefix=_PREFIX, suffix=_SUFFIX, input_variables=["input", "agent_scratchpad"],
+                format_instructions=_FORMAT_INSTRUCTIONS, memory=self.memory)
+            self._agent_executors[key] = AgentExecutor.from_agent_and_tools(
+                agent=agent, tools=tools, memory=self.memory)
+
+        return self._agent_executors[key]
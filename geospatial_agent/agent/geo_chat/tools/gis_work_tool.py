@@ -6,7 +6,7 @@ from geospatial_agent.agent.geospatial.agent import GeospatialAgent
 GIS_WORK_TOOL = "gis_work_tool"
 
 
-def gis_work_tool(session_id: str, storage_mode: str, action_summarizer=None, gis_agent=None):
+def gis_work_tool(session_id: str, storage_mode: str, action_summarizer=None, gis_agent=None, llm_factory=None):
     desc = f"""\
 A tool that invokes a {GeospatialAgent.__name__} if the user action is requires geospatial analysis to be done on user provided data.
 {GeospatialAgent.__name__} description: {GeospatialAgent.__doc__}
@@ -29,10 +29,10 @@ This tool will invoke the GIS agent to perform the geospatial analysis on the da
 The return is freeform string or a URL to the result of the analysis."""
 
     if action_summarizer is None:
-        action_summarizer = ActionSummarizer()
+        action_summarizer = ActionSummarizer(llm_factory=llm_factory)
 
     if gis_agent is None:
-        gis_agent = GeospatialAgent(storage_mode=storage_mode)
+        gis_agent = GeospatialAgent(storage_mode=storage_mode, llm_factory=llm_factory)
 
     def gis_work_tool_func(user_input: str):
         action_summary = action_summarizer.invoke(
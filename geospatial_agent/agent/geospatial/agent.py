@@ -1,16 +1,30 @@
 import os
+from typing import Optional
 
 import networkx
 from pydispatch import dispatcher
 
 from geospatial_agent.agent.action_summarizer.action_summarizer import ActionSummary
-from geospatial_agent.agent.geospatial.planner.planner import gen_plan_graph, gen_task_name
-from geospatial_agent.agent.geospatial.solver.solver import Solver
+from geospatial_agent.agent.action_summarizer.profiler import render_profile
+from geospatial_agent.agent.code_executor import CodeExecutor, InProcessCodeExecutor, get_code_executor
+from geospatial_agent.agent.execution_limits import CodeExecutionLimitExceeded
+from geospatial_agent.agent.geospatial.planner.plan_graph import PLAN_GRAPH_FORMAT_JSON
+from geospatial_agent.agent.geospatial.planner.planner import gen_plan_graph, gen_task_name_async, \
+    resolve_task_name, gen_structured_plan_graph, PlannerException
+from geospatial_agent.agent.geospatial.solver.op_profiler import load_operations_profile_report, \
+    render_operations_profile
+from geospatial_agent.agent.geospatial.solver.solver import Solver, REQUIREMENT_SELECTOR_RULES, REQUIREMENT_SELECTORS
 from geospatial_agent.agent.shared import AgentSignal, EventType, SIGNAL_ASSEMBLED_CODE_EXECUTED, \
     SENDER_GEOSPATIAL_AGENT, SIGNAL_GRAPH_CODE_GENERATED, SIGNAL_TASK_NAME_GENERATED, SIGNAL_ASSEMBLED_CODE_EXECUTING, \
-    execute_assembled_code
-from geospatial_agent.shared.bedrock import get_claude_v2
+    CodeOutputSender, format_memory, SIGNAL_OPERATIONS_PROFILED, CodeExecutionResult
+from geospatial_agent.shared.llm_stages import StageLLMFactory, get_stage_llm_factory, STAGE_TASK_NAME, \
+    STAGE_PLAN_GRAPH
 from geospatial_agent.shared.shim import LocalStorage
+from geospatial_agent.shared.utils import get_graph_code
+
+ENV_PROFILE_OPERATIONS = "PROFILE_OPERATIONS"
+ENV_PLAN_GRAPH_FORMAT = "PLAN_GRAPH_FORMAT"
+ENV_REQUIREMENT_SELECTOR = "REQUIREMENT_SELECTOR"
 
 
 class GISAgentException(Exception):
@@ -35,56 +49,67 @@ class GeospatialAgent:
     """A  geospatial data scientist and a python developer agent written by Amazon Location Service."""
 
     _assembled_code_file_name = "assembled_code.py"
+    _operations_profile_file_name = "assembled_code_profile.json"
 
-    def __init__(self, storage_mode: str):
-        claude_v2 = get_claude_v2()
-        self.llm = claude_v2
+    def __init__(self, storage_mode: str, llm_factory: Optional[StageLLMFactory] = None,
+                 code_executor: Optional[CodeExecutor] = None, profile_operations: Optional[bool] = None,
+                 plan_graph_format: Optional[str] = None, requirement_selector: Optional[str] = None):
+        self.llm_factory = llm_factory or get_stage_llm_factory()
+        self.code_executor = code_executor or get_code_executor()
+        # INFO: Profiling slows down operations that allocate a lot of memory, so it is off unless asked for.
+        if profile_operations is None:
+            profile_operations = os.environ.get(ENV_PROFILE_OPERATIONS, "").lower() in ("1", "true", "yes")
+        self.profile_operations = profile_operations
+        self.plan_graph_format = plan_graph_format or os.environ.get(ENV_PLAN_GRAPH_FORMAT, PLAN_GRAPH_FORMAT_JSON)
+        self.requirement_selector = requirement_selector or os.environ.get(ENV_REQUIREMENT_SELECTOR,
+                                                                           REQUIREMENT_SELECTOR_RULES)
+        if self.requirement_selector not in REQUIREMENT_SELECTORS:
+            raise GISAgentException(message=f"Unknown requirement selector '{self.requirement_selector}'. "
+                                            f"Use one of: {', '.join(REQUIREMENT_SELECTORS)}")
         self.local_storage = LocalStorage()
         self.storage_mode = storage_mode
 
     def invoke(self, action_summary: ActionSummary, session_id: str) -> GISAgentResponse:
         try:
-            # INFO: Generating a task name from the action summary action
-            task_name = gen_task_name(self.llm, action_summary.action)
+            # INFO: Generating a task name from the action summary action. The task name is only needed once the plan
+            # graph is ready, so it is generated in the background while the plan graph is generated.
+            task_name_future = gen_task_name_async(
+                self.llm_factory.get_llm(STAGE_TASK_NAME), action_summary.action,
+                stop_sequences=self.llm_factory.get_stop_sequences(STAGE_TASK_NAME))
+
+            data_locations_instructions = self._get_data_locations_instructions(action_summary)
+
+            # INFO: Generating the graph plan to write code
+            graph, graph_plan_code, repl_output = self._gen_plan_graph(action_summary.action,
+                                                                       data_locations_instructions)
+
+            task_name = resolve_task_name(task_name_future, action_summary.action)
             dispatcher.send(signal=SIGNAL_TASK_NAME_GENERATED,
                             sender=SENDER_GEOSPATIAL_AGENT,
                             event_data=AgentSignal(
                                 event_source=SENDER_GEOSPATIAL_AGENT,
                                 event_message=f"I will use task name {task_name} to gather all generated artifacts.",
                             ))
-
-            data_locations_instructions = self._get_data_locations_instructions(action_summary)
-
-            # INFO: Generating the graph plan to write code
-            graph_plan_code = gen_plan_graph(self.llm,
-                                             task_definition=action_summary.action,
-                                             data_locations_instructions=data_locations_instructions)
-            dispatcher.send(
-                signal=SIGNAL_GRAPH_CODE_GENERATED,
-                sender=SENDER_GEOSPATIAL_AGENT,
-                event_data=AgentSignal(
-                    event_source=SENDER_GEOSPATIAL_AGENT,
-                    event_message=f'Generated plan graph code.',
-                    event_type=EventType.PythonCode,
-                    event_data=graph_plan_code
-                ))
-
-            # INFO: Executing the graph plan code and get the graph object and the repl output
-            graph, repl_output = self._execute_plan_graph_code(graph_plan_code)
             graph_file_abs_path = self._write_local_graph_file(graph, session_id=session_id, task_name=task_name)
 
             solver = Solver(
-                llm=self.llm,
+                llm=None,
                 graph=graph,
                 graph_code=graph_plan_code,
                 session_id=session_id,
                 storage_mode=self.storage_mode,
                 task_definition=action_summary.action,
                 task_name=task_name,
-                data_locations_instructions=data_locations_instructions)
+                data_locations_instructions=data_locations_instructions,
+                llm_factory=self.llm_factory,
+                requirement_selector=self.requirement_selector,
+                geometry_file_urls=[file_summary.file_url for file_summary in action_summary.file_summaries
+                                    if file_summary.has_geometry()])
 
             op_defs = solver.solve()
-            assembled_code = solver.assemble()
+            profile_report_path = self._get_operations_profile_path(session_id=session_id, task_name=task_name) \
+                if self.profile_operations else None
+            assembled_code = solver.assemble(profile_report_path=profile_report_path)
 
             dispatcher.send(signal=SIGNAL_ASSEMBLED_CODE_EXECUTING,
                             sender=SENDER_GEOSPATIAL_AGENT,
@@ -96,14 +121,25 @@ class GeospatialAgent:
             code_file_abs_path = self._write_local_code_file(assembled_code=assembled_code, session_id=session_id,
                                                              task_name=task_name)
 
-            code_output, _ = execute_assembled_code(assembled_code)
-            if code_output is not None:
-                dispatcher.send(signal=SIGNAL_ASSEMBLED_CODE_EXECUTED,
-                                sender=SENDER_GEOSPATIAL_AGENT,
-                                event_data=AgentSignal(
-                                    event_source=SENDER_GEOSPATIAL_AGENT,
-                                    event_message=code_output
-                                ))
+            # INFO: Output of the assembled code is sent as it is printed, the executed signal only has the totals.
+            output_sender = CodeOutputSender(SENDER_GEOSPATIAL_AGENT, "Output of assembled code")
+            try:
+                execution_result = self.code_executor.execute(assembled_code, filename=code_file_abs_path,
+                                                              on_output=output_sender)
+            finally:
+                output_sender.close()
+
+            code_output = execution_result.output
+            dispatcher.send(signal=SIGNAL_ASSEMBLED_CODE_EXECUTED,
+                            sender=SENDER_GEOSPATIAL_AGENT,
+                            event_data=AgentSignal(
+                                event_source=SENDER_GEOSPATIAL_AGENT,
+                                event_message=f"Executed assembled code in {execution_result.duration_seconds:.1f} "
+                                              f"seconds. {self._get_peak_memory_message(execution_result)}"
+                            ))
+
+            if profile_report_path is not None:
+                self._send_operations_profile(profile_report_path)
 
             return GISAgentResponse(
                 graph_plan_code=graph_plan_code,
@@ -114,15 +150,72 @@ class GeospatialAgent:
                 assembled_code_output=code_output,
                 assembled_code_file_path=code_file_abs_path,
             )
+        except CodeExecutionLimitExceeded as e:
+            raise GISAgentException(message=f"Generated code was stopped. {e.message}") from e
         except Exception as e:
             raise GISAgentException(message="Error occurred while executing the graph plan code") from e
 
+    def _gen_plan_graph(self, task_definition: str,
+                        data_locations_instructions: str) -> tuple[networkx.DiGraph, str, str]:
+        """
+        Returns the plan graph, its code and the output of running the code. A plan in the JSON plan format is parsed
+        directly, and the code of the graph is generated from it. If the JSON plan can not be generated, the plan is
+        generated as code and the code is executed to get the graph.
+        """
+        llm = self.llm_factory.get_llm(STAGE_PLAN_GRAPH)
+        stop_sequences = self.llm_factory.get_stop_sequences(STAGE_PLAN_GRAPH)
+
+        if self.plan_graph_format == PLAN_GRAPH_FORMAT_JSON:
+            try:
+                graph = gen_structured_plan_graph(llm, task_definition=task_definition,
+                                                  data_locations_instructions=data_locations_instructions,
+                                                  stop_sequences=stop_sequences)
+                graph_plan_code = get_graph_code(graph)
+                self._send_plan_graph_code(graph_plan_code)
+                return graph, graph_plan_code, ""
+            except PlannerException as e:
+                dispatcher.send(signal=SIGNAL_GRAPH_CODE_GENERATED,
+                                sender=SENDER_GEOSPATIAL_AGENT,
+                                event_data=AgentSignal(
+                                    event_source=SENDER_GEOSPATIAL_AGENT,
+                                    event_message=f"{e.message} Generating the plan graph as code instead."
+                                ))
+
+        graph_plan_code = gen_plan_graph(llm, task_definition=task_definition,
+                                         data_locations_instructions=data_locations_instructions,
+                                         stop_sequences=stop_sequences)
+        self._send_plan_graph_code(graph_plan_code)
+
+        # INFO: Executing the graph plan code and get the graph object and the repl output
+        graph, repl_output = self._execute_plan_graph_code(graph_plan_code, self.code_executor)
+        return graph, graph_plan_code, repl_output
+
+    @staticmethod
+    def _get_peak_memory_message(execution_result: CodeExecutionResult) -> str:
+        # INFO: The peak of an execution is only measured in a worker process. In the agent process, other work
+        # shares the memory, so only the peak of the whole process is known.
+        if execution_result.peak_memory_bytes is not None:
+            return f"Peak memory: {format_memory(execution_result.peak_memory_bytes)}"
+        return f"Peak memory of the agent process: {format_memory(execution_result.process_peak_memory_bytes)}"
+
+    @staticmethod
+    def _send_plan_graph_code(graph_plan_code: str):
+        dispatcher.send(
+            signal=SIGNAL_GRAPH_CODE_GENERATED,
+            sender=SENDER_GEOSPATIAL_AGENT,
+            event_data=AgentSignal(
+                event_source=SENDER_GEOSPATIAL_AGENT,
+                event_message=f'Generated plan graph code.',
+                event_type=EventType.PythonCode,
+                event_data=graph_plan_code
+            ))
+
     @staticmethod
     def _get_data_locations_instructions(action_summary):
         # Generating a string for all the data locations from action_summary
         # For each file in action_summary.file_summaries, we will generate a string of:
         # "File Location: <file_url>",
-        # "Column Names: <column_names>",
+        # "Profile: <rendered data profile>" or "Column Names: <column_names>" if the file was not profiled,
         # "Summary: <file_summary>"
         # We will then join these strings with a new line character and return it.
         # We will also add a new line character at the end of the string.
@@ -130,7 +223,10 @@ class GeospatialAgent:
         for file_summary in action_summary.file_summaries:
             instr = ""
             instr += f"File Location: {file_summary.file_url}\n"
-            instr += f"Column Names: {file_summary.column_names}\n"
+            if file_summary.profile is not None:
+                instr += f"Profile:\n{render_profile(file_summary.profile)}\n"
+            else:
+                instr += f"Column Names: {file_summary.column_names}\n"
             instr += f"Summary: {file_summary.file_summary}\n"
             data_locations_instructions += instr
         return data_locations_instructions
@@ -154,9 +250,29 @@ class GeospatialAgent:
             content=assembled_code
         )
 
+    def _get_operations_profile_path(self, session_id: str, task_name: str) -> str:
+        return os.path.abspath(self.local_storage.get_generated_file_url(
+            file_path=self._operations_profile_file_name, session_id=session_id, task_name=task_name))
+
+    @staticmethod
+    def _send_operations_profile(profile_report_path: str):
+        report = load_operations_profile_report(profile_report_path)
+        if report is None:
+            return
+        dispatcher.send(signal=SIGNAL_OPERATIONS_PROFILED,
+                        sender=SENDER_GEOSPATIAL_AGENT,
+                        event_data=AgentSignal(
+                            event_source=SENDER_GEOSPATIAL_AGENT,
+                            event_message=f"{render_operations_profile(report)}\n"
+                                          f"Profile report is saved to {profile_report_path}",
+                            event_data=report
+                        ))
+
     @staticmethod
-    def _execute_plan_graph_code(graph_plan_code) -> tuple[networkx.DiGraph, str]:
+    def _execute_plan_graph_code(graph_plan_code,
+                                 code_executor: Optional[CodeExecutor] = None) -> tuple[networkx.DiGraph, str]:
         """Returns the plan graph object by executing the graph plan code."""
-        output, _globals = execute_assembled_code(graph_plan_code)
-        graph: networkx.DiGraph = _globals['G']
-        return graph, output
+        code_executor = code_executor or InProcessCodeExecutor()
+        execution_result = code_executor.execute(graph_plan_code, result_names=['G'])
+        graph: networkx.DiGraph = execution_result.results['G']
+        return graph, execution_result.output
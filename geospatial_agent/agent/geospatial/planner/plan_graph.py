@@ -0,0 +1,95 @@
+import json
+from typing import List, Optional, Tuple
+
+import networkx
+from pydantic import BaseModel, ValidationError
+
+from geospatial_agent.agent.geospatial.solver.constants import NODE_TYPE_ATTRIBUTE, NODE_TYPE_OPERATION, \
+    NODE_TYPE_DATA, NODE_DESCRIPTION_ATTRIBUTE, NODE_DATA_PATH_ATTRIBUTE, NODE_TYPE_OPERATION_TYPE
+
+PLAN_GRAPH_FORMAT_JSON = "json"
+PLAN_GRAPH_FORMAT_CODE = "code"
+
+
+class PlanGraphException(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class PlanNode(BaseModel):
+    name: str
+    node_type: str
+    description: str
+    data_path: Optional[str] = None
+    operation_type: Optional[str] = None
+
+
+class PlanGraph(BaseModel):
+    """A plan graph in the JSON plan format. Edges are pairs of node names, from the first node to the second."""
+    nodes: List[PlanNode]
+    edges: List[Tuple[str, str]]
+
+
+def parse_plan_graph(plan_json: str) -> networkx.DiGraph:
+    """
+    Returns the plan graph of a plan in the JSON plan format. Raises PlanGraphException with every problem found if
+    the plan is not a valid plan graph.
+    """
+    try:
+        plan = PlanGraph(**json.loads(plan_json))
+    except (json.JSONDecodeError, TypeError) as e:
+        raise PlanGraphException(f"Plan graph is not a JSON object: {e}") from e
+    except ValidationError as e:
+        raise PlanGraphException(f"Plan graph does not match the plan format: {e}") from e
+
+    graph = networkx.DiGraph()
+    problems = []
+    for node in plan.nodes:
+        if not node.name.isidentifier():
+            problems.append(f"Node name {node.name!r} is not a valid Python name")
+        if node.node_type not in (NODE_TYPE_DATA, NODE_TYPE_OPERATION):
+            problems.append(f"Node {node.name} has unknown node type {node.node_type!r}")
+        if node.name in graph.nodes:
+            problems.append(f"Node {node.name} is defined more than once")
+
+        # INFO: Node attributes are the ones the plan graph code sets, data paths only on data nodes and operation
+        # types only on operation nodes.
+        attributes = {NODE_TYPE_ATTRIBUTE: node.node_type, NODE_DESCRIPTION_ATTRIBUTE: node.description}
+        if node.node_type == NODE_TYPE_DATA and node.data_path:
+            attributes[NODE_DATA_PATH_ATTRIBUTE] = node.data_path
+        if node.node_type == NODE_TYPE_OPERATION:
+            attributes[NODE_TYPE_OPERATION_TYPE] = node.operation_type or ""
+        graph.add_node(node.name, **attributes)
+
+    for from_node, to_node in plan.edges:
+        unknown_nodes = [name for name in (from_node, to_node) if name not in graph.nodes]
+        if unknown_nodes:
+            problems.append(f"Edge {from_node} -> {to_node} refers to unknown nodes {', '.join(unknown_nodes)}")
+            continue
+        if graph.nodes[from_node][NODE_TYPE_ATTRIBUTE] == graph.nodes[to_node][NODE_TYPE_ATTRIBUTE]:
+            problems.append(f"Edge {from_node} -> {to_node} connects two {graph.nodes[to_node][NODE_TYPE_ATTRIBUTE]} "
+                            f"nodes, edges must connect data and operation nodes")
+        graph.add_edge(from_node, to_node)
+
+    problems.extend(_get_graph_problems(graph))
+    if problems:
+        raise PlanGraphException("Plan graph is not valid. " + "; ".join(problems))
+    return graph
+
+
+def _get_graph_problems(graph: networkx.DiGraph) -> List[str]:
+    if graph.number_of_nodes() == 0:
+        return ["Plan graph has no nodes"]
+
+    problems = []
+    if not networkx.is_directed_acyclic_graph(graph):
+        problems.append("Plan graph has a cycle")
+    if not networkx.is_weakly_connected(graph):
+        problems.append("Plan graph has disconnected components")
+    for node_name, node_type in graph.nodes(data=NODE_TYPE_ATTRIBUTE):
+        if node_type == NODE_TYPE_OPERATION and graph.in_degree(node_name) == 0:
+            problems.append(f"Operation {node_name} has no input data node")
+        if node_type == NODE_TYPE_OPERATION and graph.out_degree(node_name) == 0:
+            problems.append(f"Operation {node_name} has no output data node")
+    return problems
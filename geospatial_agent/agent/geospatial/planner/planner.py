@@ -1,13 +1,29 @@
+import re
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
 
-from langchain import PromptTemplate, LLMChain
+import networkx
 from langchain.llms.base import LLM
 
+from geospatial_agent.agent.geospatial.planner.plan_graph import PlanGraphException, parse_plan_graph
 from geospatial_agent.agent.geospatial.planner.prompts import _graph_generation_instructions, \
     _graph_reply_example, _task_name_generation_prompt, _graph_requirement_list, \
-    _planning_graph_task_prompt_template
+    _planning_graph_task_prompt_template, _graph_json_reply_example, _graph_json_requirement_list
+from geospatial_agent.agent.shared import SENDER_GEOSPATIAL_AGENT, get_code_chunk_sender
+from geospatial_agent.shared.prompt_template import CompiledPrompt
 from geospatial_agent.shared.prompts import GIS_AGENT_ROLE_INTRO, HUMAN_STOP_SEQUENCE
-from geospatial_agent.shared.utils import extract_code
+from geospatial_agent.shared.streaming import predict_block
+from geospatial_agent.shared.utils import extract_code, extract_content_xml
+
+
+# Seconds to wait for a task name generated in the background before falling back to gen_task_name_slug.
+TASK_NAME_TIMEOUT_SECONDS = 30
+
+_TASK_NAME_MAX_WORDS = 6
+_TASK_NAME_MAX_LENGTH = 60
+
+_task_name_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="task-name")
 
 
 class PlannerException(Exception):
@@ -16,47 +32,112 @@ class PlannerException(Exception):
         super().__init__(self.message)
 
 
-def gen_task_name(llm: LLM, task: str) -> str:
+def gen_task_name(llm: LLM, task: str, stop_sequences: Optional[List[str]] = None) -> str:
     """Returns a task name for creating unix folders from task description using LLM"""
-    task_name_gen_prompt_template: PromptTemplate = PromptTemplate.from_template(_task_name_generation_prompt)
-    task_name_gen_prompt = task_name_gen_prompt_template.format(human_role="Human",
-                                                                assistant_role="Assistant",
-                                                                task_definition=task)
-    task_name = llm.predict(text=task_name_gen_prompt, stop=[HUMAN_STOP_SEQUENCE]).strip()
+    task_name_gen_prompt = _TASK_NAME_PROMPT.render(task_definition=task)
+    task_name = llm.predict(text=task_name_gen_prompt, stop=stop_sequences or [HUMAN_STOP_SEQUENCE]).strip()
+    task_name = _to_folder_name(task_name) or _to_folder_name(task)
     task_name = f'{int(time.time())}_{task_name}'
     return task_name
 
 
-def gen_plan_graph(llm: LLM, task_definition: str, data_locations_instructions: str) -> str:
+def gen_task_name_slug(task: str) -> str:
+    """Returns a task name for creating unix folders from the first words of the task description, without LLM"""
+    return f'{int(time.time())}_{_to_folder_name(task) or "task"}'
+
+
+def gen_task_name_async(llm: LLM, task: str, stop_sequences: Optional[List[str]] = None) -> Future:
+    """Starts generating a task name with gen_task_name in the background. Use resolve_task_name to get it."""
+    return _task_name_executor.submit(gen_task_name, llm, task, stop_sequences)
+
+
+def resolve_task_name(task_name_future: Future, task: str, timeout: float = TASK_NAME_TIMEOUT_SECONDS) -> str:
+    """
+    Returns the task name generated in the background. Falls back to gen_task_name_slug if the LLM call failed or did
+    not finish in time, so a task name never blocks or fails the task.
+    """
+    try:
+        return task_name_future.result(timeout=timeout)
+    except Exception:
+        task_name_future.cancel()
+        return gen_task_name_slug(task)
+
+
+def gen_plan_graph(llm: LLM, task_definition: str, data_locations_instructions: str,
+                   stop_sequences: Optional[List[str]] = None) -> str:
     """Returns a plan graph in the form of python code from a task definition."""
     try:
-        graph_plan_code = _gen_plan_graph_code(llm, task_definition, data_locations_instructions)
+        graph_plan_code = _gen_plan_graph_code(llm, task_definition, data_locations_instructions,
+                                               stop_sequences or [HUMAN_STOP_SEQUENCE])
         return graph_plan_code
     except Exception as e:
         raise PlannerException(f"Failed to generate graph plan code for task") from e
 
 
-def _gen_plan_graph_code(llm: LLM, task_definition: str, data_locations_instructions: str):
+def gen_structured_plan_graph(llm: LLM, task_definition: str, data_locations_instructions: str,
+                              stop_sequences: Optional[List[str]] = None) -> networkx.DiGraph:
+    """
+    Returns a plan graph from a task definition, generated in the JSON plan format and validated without running any
+    generated code.
+    """
+    graph_gen_prompt = _PLAN_GRAPH_JSON_PROMPT.render(task_definition=task_definition.strip("\n").strip(),
+                                                      data_locations_instructions=data_locations_instructions)
+    try:
+        graph_plan_response = predict_block(llm=llm, prompt=graph_gen_prompt,
+                                            stop=stop_sequences or [HUMAN_STOP_SEQUENCE], xml_tag="json",
+                                            on_partial=get_code_chunk_sender(SENDER_GEOSPATIAL_AGENT,
+                                                                             "Generating plan graph"))
+        return parse_plan_graph(extract_content_xml("json", graph_plan_response))
+    except PlanGraphException as e:
+        raise PlannerException(f"Failed to generate a valid plan graph for task. {e.message}") from e
+    except Exception as e:
+        raise PlannerException(f"Failed to generate plan graph for task") from e
+
+
+def _gen_plan_graph_code(llm: LLM, task_definition: str, data_locations_instructions: str,
+                         stop_sequences: List[str]):
     # Generating a graph plan python code using the LLM.
-    graph_requirements = _get_graph_requirements()
-    graph_gen_prompt_template: PromptTemplate = PromptTemplate.from_template(_planning_graph_task_prompt_template)
-    chain = LLMChain(llm=llm, prompt=graph_gen_prompt_template)
-    graph_plan_response = chain.run(human_role="Human",
-                                    planner_role_intro=GIS_AGENT_ROLE_INTRO,
-                                    graph_generation_instructions=_graph_generation_instructions,
-                                    task_definition=task_definition.strip("\n").strip(),
-                                    graph_requirements=graph_requirements,
-                                    graph_reply_example=_graph_reply_example,
-                                    data_locations_instructions=data_locations_instructions,
-                                    assistant_role="Assistant",
-                                    stop=[HUMAN_STOP_SEQUENCE])
+    graph_gen_prompt = _PLAN_GRAPH_PROMPT.render(task_definition=task_definition.strip("\n").strip(),
+                                                 data_locations_instructions=data_locations_instructions)
+    graph_plan_response = predict_block(llm=llm, prompt=graph_gen_prompt, stop=stop_sequences,
+                                        on_partial=get_code_chunk_sender(SENDER_GEOSPATIAL_AGENT,
+                                                                         "Generating plan graph"))
     # Use the LLM to generate a plan graph code
     graph_plan_code = extract_code(graph_plan_response)
     return graph_plan_code
 
 
+def _to_folder_name(text: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    return "_".join(words[:_TASK_NAME_MAX_WORDS])[:_TASK_NAME_MAX_LENGTH].strip("_")
+
+
 def _get_graph_requirements() -> str:
     """Returns planning graph requirements list"""
     requirements = _graph_requirement_list.copy()
     graph_requirement_str = '\n'.join([f"{idx + 1}. {line}" for idx, line in enumerate(requirements)])
     return graph_requirement_str
+
+
+_TASK_NAME_PROMPT = CompiledPrompt("task_name", _task_name_generation_prompt).partial(
+    human_role="Human",
+    assistant_role="Assistant"
+)
+
+_PLAN_GRAPH_JSON_PROMPT = CompiledPrompt("plan_graph_json", _planning_graph_task_prompt_template).partial(
+    human_role="Human",
+    planner_role_intro=GIS_AGENT_ROLE_INTRO,
+    graph_generation_instructions=_graph_generation_instructions,
+    graph_requirements='\n'.join([f"{idx + 1}. {line}" for idx, line in enumerate(_graph_json_requirement_list)]),
+    graph_reply_example=_graph_json_reply_example,
+    assistant_role="Assistant"
+)
+
+_PLAN_GRAPH_PROMPT = CompiledPrompt("plan_graph", _planning_graph_task_prompt_template).partial(
+    human_role="Human",
+    planner_role_intro=GIS_AGENT_ROLE_INTRO,
+    graph_generation_instructions=_graph_generation_instructions,
+    graph_requirements=_get_graph_requirements(),
+    graph_reply_example=_graph_reply_example,
+    assistant_role="Assistant"
+)
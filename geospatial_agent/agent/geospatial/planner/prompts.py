@@ -40,6 +40,43 @@ _graph_requirement_list = [
     "Put your reply into a Python code block enclosed by ```python and ```."
 ]
 
+_graph_json_reply_example = r"""
+<json>
+{
+  "nodes": [
+    {"name": "covid_19_shp_url", "node_type": "data", "data_path": "agent://covid_19_shapefile.zip", "description": "Covid 19 shapefile URI"},
+    {"name": "load_covid_19_shp", "node_type": "operation", "operation_type": "load", "description": "Load Covid 19 shapefile"},
+    {"name": "covid_19_gdf", "node_type": "data", "description": "Covid 19 shapefile GeoDataFrame"},
+    ...
+  ],
+  "edges": [
+    ["covid_19_shp_url", "load_covid_19_shp"],
+    ["load_covid_19_shp", "covid_19_gdf"],
+    ...
+  ]
+}
+</json>
+"""
+
+_graph_json_requirement_list = [
+    "Reply with a single JSON object with two keys: nodes and edges. Put the JSON object into a <json></json> block.",
+    "Each node is a JSON object with these keys: name, node_type (data or operation), data_path (only for data nodes), operation_type (only for operation nodes), and description.",
+    "Each edge is a list of two node names, from the first node to the second node.",
+    "No disconnected components are allowed.",
+    "There are two types of nodes: operation node and data node.",
+    "A data node is always followed by an operation node. An operation node is always followed by a data node.",
+    "Operation node accepts data nodes as parameters and writes data nodes as outputs to next operation.",
+    "Input of an Operation node is the data node output of previous operations, except for data loading or collection.",
+    "First operations are data loading or collection, and the last operation output is the final answer.",
+    "Use goepandas for spatial data if the goal is to make a map or visualization.",
+    "Succinctly name all nodes. Node names are valid Python variable names.",
+    "Produce a concise graph with minimum amount of steps.",
+    "operation_type is a single word tag to categorize the operations. For example, visualization, map, plot, load, transform, and spatial_join.",
+    "Do not generate code to implement the steps.",
+    "Only use the provided data. Use external, only from Github if needed.",
+    "Only use columns or attributes noted in Data locations section. Do NOT assume attributes or columns.",
+]
+
 _planning_graph_task_prompt_template = r"""
 {human_role}:
 Your Role: {planner_role_intro}
@@ -0,0 +1,192 @@
+import ast
+import math
+import os
+from typing import Dict, List, Optional, Sequence
+
+from geospatial_agent.agent.geospatial.solver.constants import NODE_DATA_PATH_ATTRIBUTE, NODE_DESCRIPTION_ATTRIBUTE
+from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser, OperationNode
+from geospatial_agent.shared.utils import get_graph_code
+
+ENV_OPERATION_PROMPT_CONTEXT_TOKENS = "OPERATION_PROMPT_CONTEXT_TOKENS"
+
+# Token budget of the plan context in the code generation prompt of one operation.
+DEFAULT_OPERATION_PROMPT_CONTEXT_TOKENS = 3000
+
+# Rough number of characters per token, prompt sizes are estimated without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_DATA_LOCATION_PREFIX = "File Location: "
+_TRUNCATION_MARKER = "\n...(truncated)"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def get_context_token_budget_from_env() -> int:
+    budget = os.environ.get(ENV_OPERATION_PROMPT_CONTEXT_TOKENS)
+    return int(budget) if budget else DEFAULT_OPERATION_PROMPT_CONTEXT_TOKENS
+
+
+class OperationPromptContext:
+    """The parts of the plan an operation code generation prompt is given."""
+
+    def __init__(self,
+                 graph_code: str,
+                 data_locations_instructions: str,
+                 ancestor_operation_code: str,
+                 descendant_operations_definition: str):
+        self.graph_code = graph_code
+        self.data_locations_instructions = data_locations_instructions
+        self.ancestor_operation_code = ancestor_operation_code
+        self.descendant_operations_definition = descendant_operations_definition
+
+    def get_section_tokens(self) -> Dict[str, int]:
+        return {name: estimate_tokens(text) for name, text in self.__dict__.items()}
+
+    def get_total_tokens(self) -> int:
+        return sum(self.get_section_tokens().values())
+
+
+class OperationPromptContextBuilder:
+    """
+    Builds the plan context of an operation code generation prompt from the direct neighbors of the operation: the
+    signatures, docstrings and return values of operations producing its inputs, the definitions of operations
+    reading its outputs, and the data locations whose data flows into it. The context is reduced until it fits the
+    token budget.
+    """
+
+    def __init__(self,
+                 operation_parser: OperationsParser,
+                 graph_code: str,
+                 data_locations_instructions: str,
+                 token_budget: Optional[int] = None):
+        self.operation_parser = operation_parser
+        self.graph = operation_parser.graph
+        self.graph_code = graph_code
+        self.data_locations_instructions = data_locations_instructions
+        self.data_locations = split_data_locations(data_locations_instructions)
+        self.token_budget = token_budget or get_context_token_budget_from_env()
+
+    def build(self, op_node: OperationNode) -> OperationPromptContext:
+        ancestors = self.operation_parser.get_direct_ancestors(op_node.node_name)
+        descendants = self.operation_parser.get_direct_descendants(op_node.node_name)
+
+        context = OperationPromptContext(
+            graph_code=self.graph_code,
+            data_locations_instructions=self._get_data_locations_instructions(op_node),
+            ancestor_operation_code="\n\n".join(
+                [self._summarize_operation_code(ancestor, with_docs=True) for ancestor in ancestors]),
+            descendant_operations_definition="\n\n".join(
+                [self._get_operation_definition(descendant) for descendant in descendants]))
+
+        # INFO: The least needed part is reduced first. The plan graph code is replaced by the code of the part of the
+        # graph around the operation, then docstrings and comments of ancestors are dropped, and if the context still
+        # does not fit, parts are truncated.
+        if context.get_total_tokens() > self.token_budget:
+            context.graph_code = self._get_neighborhood_graph_code(op_node, ancestors, descendants)
+        if context.get_total_tokens() > self.token_budget:
+            context.ancestor_operation_code = "\n\n".join(
+                [self._summarize_operation_code(ancestor, with_docs=False) for ancestor in ancestors])
+        for section in ["graph_code", "descendant_operations_definition", "ancestor_operation_code",
+                        "data_locations_instructions"]:
+            excess_tokens = context.get_total_tokens() - self.token_budget
+            if excess_tokens <= 0:
+                break
+            text = getattr(context, section)
+            setattr(context, section, _truncate(text, max(estimate_tokens(text) - excess_tokens, 0)))
+
+        return context
+
+    def _get_data_locations_instructions(self, op_node: OperationNode) -> str:
+        """Returns the data locations read by op_node or by any operation its inputs come from."""
+        if not self.data_locations:
+            return self.data_locations_instructions
+
+        data_paths = set()
+        for node in list(self.operation_parser.get_ancestors(op_node.node_name)) + [op_node]:
+            for param_name in node.param_names:
+                data_path = self.graph.nodes[param_name].get(NODE_DATA_PATH_ATTRIBUTE, "")
+                if data_path:
+                    data_paths.add(_get_file_name(data_path))
+
+        return "".join([instructions for file_url, instructions in self.data_locations.items()
+                        if _get_file_name(file_url) in data_paths])
+
+    def _summarize_operation_code(self, op_node: OperationNode, with_docs: bool) -> str:
+        """
+        Returns the signature, docstring, leading comments and return statements of the generated function of an
+        operation, and the descriptions of the data it returns. Code that can not be parsed is returned as is, and the
+        definition from the plan is returned for operations without generated code.
+        """
+        try:
+            module = ast.parse(op_node.operation_code)
+        except SyntaxError:
+            return op_node.operation_code
+
+        function = next((node for node in module.body
+                         if isinstance(node, ast.FunctionDef) and node.name == op_node.node_name), None)
+        if function is None:
+            return op_node.operation_code or self._get_operation_definition(op_node)
+
+        returns = f" -> {ast.unparse(function.returns)}" if function.returns else ""
+        lines = [f"def {function.name}({ast.unparse(function.args)}){returns}:"]
+        if with_docs:
+            docstring = ast.get_docstring(function)
+            if docstring:
+                lines.append(f'    """{docstring}"""')
+            code_lines = op_node.operation_code.splitlines()
+            for line in code_lines[function.lineno:function.body[0].lineno - 1]:
+                if line.strip().startswith("#"):
+                    lines.append(f"    {line.strip()}")
+        lines.append("    ...")
+
+        return_lines = []
+        for node in ast.walk(function):
+            if isinstance(node, ast.Return) and node.value is not None:
+                return_line = f"    return {ast.unparse(node.value)}"
+                if return_line not in return_lines:
+                    return_lines.append(return_line)
+        lines.extend(return_lines)
+
+        for return_name in op_node.return_names:
+            lines.append(f"    # Returns {return_name}: "
+                         f"{self.graph.nodes[return_name].get(NODE_DESCRIPTION_ATTRIBUTE, '')}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _get_operation_definition(op_node: OperationNode) -> str:
+        return f"def {op_node.function_definition}:\n" \
+               f"    # {op_node.description}\n" \
+               f"    {op_node.return_line}"
+
+    def _get_neighborhood_graph_code(self, op_node: OperationNode, ancestors: Sequence[OperationNode],
+                                     descendants: Sequence[OperationNode]) -> str:
+        """Returns networkx code building the part of the plan graph from the direct ancestors to the direct
+        descendants of op_node."""
+        node_names = [neighbor.node_name for neighbor in ancestors] + \
+                     list(self.graph.predecessors(op_node.node_name)) + [op_node.node_name] + \
+                     list(self.graph.successors(op_node.node_name)) + [neighbor.node_name for neighbor in descendants]
+        return get_graph_code(self.graph.subgraph(node_names))
+
+
+def split_data_locations(data_locations_instructions: str) -> Dict[str, str]:
+    """Returns the instructions of every data location by its file URL, in the order of the instructions."""
+    data_locations: Dict[str, str] = {}
+    current_lines: List[str] = []
+    for line in data_locations_instructions.splitlines(keepends=True):
+        if line.startswith(_DATA_LOCATION_PREFIX):
+            current_lines = []
+            data_locations[line.removeprefix(_DATA_LOCATION_PREFIX).strip()] = current_lines
+        current_lines.append(line)
+    return {file_url: "".join(lines) for file_url, lines in data_locations.items()}
+
+
+def _get_file_name(file_url: str) -> str:
+    return os.path.basename(file_url.removeprefix("agent://").rstrip("/"))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(max_tokens * CHARS_PER_TOKEN - len(_TRUNCATION_MARKER), 0)] + _TRUNCATION_MARKER
@@ -1,4 +1,4 @@
-from typing import Sequence
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence
 
 import networkx
 
@@ -13,12 +13,13 @@ class OperationNode:
                  description: str,
                  node_name: str,
                  param_names: set,
-                 return_names: set,
+                 return_names: List[str],
                  operation_type: str = "",
                  code_gen_response: str = "",
                  operation_code: str = "",
                  reviewed_code: str = "",
-                 operation_prompt: str = ""):
+                 operation_prompt: str = "",
+                 operation_requirements: Optional[List[str]] = None):
         self.function_definition = function_definition
         self.return_line = return_line
         self.description = description
@@ -30,6 +31,7 @@ class OperationNode:
         self.operation_code = operation_code
         self.reviewed_code = reviewed_code
         self.operation_prompt = operation_prompt
+        self.operation_requirements = operation_requirements
 
 
 # An exception class for OperationsParser with a message
@@ -40,51 +42,83 @@ class OperationsParserException(Exception):
 
 
 class OperationsParser:
+    """
+    Parses operation nodes of a plan graph and indexes them. Operation ancestors and descendants of every node are
+    computed once, in topological order, so lookups do not walk the graph again. Raises OperationsParserException if
+    the graph has a cycle.
+    """
+
     def __init__(self, graph: networkx.DiGraph):
         self.graph = graph
 
         self.op_node_names = self._get_operation_node_names()
         self.operation_nodes = self._get_operation_nodes(self.op_node_names)
+        self.operation_nodes_by_name: Dict[str, OperationNode] = {op_node.node_name: op_node
+                                                                  for op_node in self.operation_nodes}
         self.output_node_names = self._get_output_node_names()
         self.input_node_names = self._get_input_node_names()
 
-    def get_ancestors(self, node_name) -> Sequence[OperationNode]:
-        ancestor_node_names = networkx.ancestors(self.graph, node_name)
+        self._op_bits = {op_node.node_name: 1 << idx for idx, op_node in enumerate(self.operation_nodes)}
+        self._topological_order = self._get_topological_order()
+        self._ancestor_masks = self._get_operation_closure_masks(self._topological_order, self.graph.predecessors)
+        self._descendant_masks = self._get_operation_closure_masks(list(reversed(self._topological_order)),
+                                                                   self.graph.successors)
 
-        ancestor_operation_names = []
-        for node_name in ancestor_node_names:
-            if node_name in self.op_node_names:
-                ancestor_operation_names.append(node_name)
+    def get_ancestors(self, node_name) -> Sequence[OperationNode]:
+        """Returns operation nodes node_name depends on, in plan order."""
+        return self._get_operation_nodes_of_mask(self._ancestor_masks[node_name])
 
-        ancestor_operation_functions = []
-        for op_node in self.operation_nodes:
-            op_node_name = op_node.node_name
-            if op_node_name in ancestor_operation_names:
-                ancestor_operation_functions.append(op_node)
+    def get_descendants(self, node_name) -> Sequence[OperationNode]:
+        """Returns operation nodes depending on node_name, in plan order."""
+        return self._get_operation_nodes_of_mask(self._descendant_masks[node_name])
 
-        return ancestor_operation_functions
+    def get_direct_ancestors(self, node_name) -> Sequence[OperationNode]:
+        """Returns operation nodes producing the inputs of node_name, in plan order."""
+        return self._get_operation_nodes_of_mask(self._get_neighbor_operations_mask(
+            node_name, self.graph.predecessors))
 
-    def get_descendants(self, node_name) -> Sequence[OperationNode]:
-        descendant_operation_names = []
-        descendant_node_names = networkx.descendants(self.graph, node_name)
+    def get_direct_descendants(self, node_name) -> Sequence[OperationNode]:
+        """Returns operation nodes reading the outputs of node_name, in plan order."""
+        return self._get_operation_nodes_of_mask(self._get_neighbor_operations_mask(
+            node_name, self.graph.successors))
 
-        for descendant in descendant_node_names:
-            if descendant in self.op_node_names:
-                descendant_operation_names.append(descendant)
+    def get_operations_in_execution_order(self) -> List[OperationNode]:
+        """
+        Returns every operation node once, in a topological order of the graph. Operations come after all operations
+        producing their inputs, ties are broken by the order of operations in the plan graph.
+        """
+        return [self.operation_nodes_by_name[node_name] for node_name in self._topological_order
+                if node_name in self.operation_nodes_by_name]
 
-        descendant_operation_nodes = []
+    def get_operation_levels(self) -> List[List[OperationNode]]:
+        """
+        Returns operation nodes grouped by topological level. Level 0 holds operations without operation ancestors,
+        level N holds operations whose deepest operation ancestor sits on level N - 1.
+        """
+        # INFO: Depth counts operation nodes only, data nodes pass the depth of their predecessors through.
+        depths = {}
+        for node_name in self._topological_order:
+            depth = max((depths[pred] for pred in self.graph.predecessors(node_name)), default=0)
+            if node_name in self.operation_nodes_by_name:
+                depth += 1
+            depths[node_name] = depth
+
+        levels: List[List[OperationNode]] = []
         for op_node in self.operation_nodes:
-            op_name = op_node.node_name
-            if op_name in descendant_operation_names:
-                descendant_operation_nodes.append(op_node)
+            level = depths[op_node.node_name] - 1
+            while len(levels) <= level:
+                levels.append([])
+            levels[level].append(op_node)
 
-        return descendant_operation_nodes
+        return levels
 
     def stringify_nodes(self, nodes: Sequence[OperationNode]) -> str:
         """Returns all operation nodes attributes stringified as a new line delimited string"""
         op_def_list = []
         for op_node in nodes:
-            op_node_dict = op_node.__dict__
+            # INFO: Selected requirements of other operations are not relevant for code generation of an operation.
+            op_node_dict = {key: value for key, value in op_node.__dict__.items()
+                            if key != "operation_requirements"}
             op_def_list.append(str(op_node_dict))
 
         defs = '\n'.join(op_def_list)
@@ -111,7 +145,8 @@ class OperationsParser:
                 operation_type=node_dict.get(NODE_TYPE_OPERATION_TYPE, ""),
                 node_name=op,
                 param_names=param_names,
-                return_names=set(successors)
+                # INFO: Return names keep the order of the return line, so call sites unpack them in the same order.
+                return_names=successors
             )
 
             op_nodes.append(op_node)
@@ -125,27 +160,68 @@ class OperationsParser:
                 op_nodes.append(node_name)
         return op_nodes
 
-    def _get_output_node_names(self):
-        """Returns output nodes from the graph. Output nodes have 'output' attribute set to True"""
+    def _get_output_node_names(self) -> FrozenSet[str]:
+        """Returns output nodes from the graph. Output nodes are data nodes without successors"""
         output_nodes = []
-        for node_name in self.graph.nodes():
-            node = self.graph.nodes[node_name]
-            if len(list(self.graph.successors(node_name))) == 0:
-                if node[NODE_TYPE_ATTRIBUTE] != NODE_TYPE_DATA:
+        for node_name, out_degree in self.graph.out_degree():
+            if out_degree == 0:
+                if self.graph.nodes[node_name][NODE_TYPE_ATTRIBUTE] != NODE_TYPE_DATA:
                     raise OperationsParserException(f"Node {node_name} is not an {NODE_TYPE_DATA} node")
                 output_nodes.append(node_name)
-        return output_nodes
+        return frozenset(output_nodes)
 
-    def _get_input_node_names(self):
-        """Returns input nodes from the graph. Input nodes have 'input' attribute set to True"""
+    def _get_input_node_names(self) -> FrozenSet[str]:
+        """Returns input nodes from the graph. Input nodes are data nodes without predecessors"""
         input_nodes = []
-        for node_name in self.graph.nodes():
-            node = self.graph.nodes[node_name]
-            if len(list(self.graph.predecessors(node_name))) == 0:
-                if node[NODE_TYPE_ATTRIBUTE] != NODE_TYPE_DATA:
+        for node_name, in_degree in self.graph.in_degree():
+            if in_degree == 0:
+                if self.graph.nodes[node_name][NODE_TYPE_ATTRIBUTE] != NODE_TYPE_DATA:
                     raise OperationsParserException(f"Node {node_name} is not an {NODE_TYPE_DATA} node")
                 input_nodes.append(node_name)
-        return input_nodes
+        return frozenset(input_nodes)
+
+    def _get_topological_order(self) -> List[str]:
+        """Returns all node names in a topological order, ties are broken by the order of nodes in the plan graph."""
+        plan_order = {node_name: idx for idx, node_name in enumerate(self.graph.nodes)}
+        try:
+            return list(networkx.lexicographical_topological_sort(self.graph, key=plan_order.get))
+        except networkx.NetworkXUnfeasible as e:
+            raise OperationsParserException("Operation graph has a cycle") from e
+
+    def _get_operation_closure_masks(self, node_order: List[str],
+                                     get_neighbors: Callable[[str], Iterable[str]]) -> Dict[str, int]:
+        """
+        Returns, for every node, the operations reachable through get_neighbors as a bit mask. Bit i stands for the
+        i-th operation in plan order. node_order must list the neighbors of a node before the node itself.
+        """
+        # INFO: Masks are Python integers, so a closure takes one bit per operation instead of a set entry, and
+        # merging the closures of neighbors is a bitwise or.
+        masks: Dict[str, int] = {}
+        for node_name in node_order:
+            mask = 0
+            for neighbor in get_neighbors(node_name):
+                mask |= masks[neighbor] | self._op_bits.get(neighbor, 0)
+            masks[node_name] = mask
+        return masks
+
+    def _get_neighbor_operations_mask(self, node_name: str, get_neighbors: Callable[[str], Iterable[str]]) -> int:
+        """Returns the operations next to node_name as a bit mask, looking through data nodes in between."""
+        mask = 0
+        for neighbor in get_neighbors(node_name):
+            if neighbor in self._op_bits:
+                mask |= self._op_bits[neighbor]
+            else:
+                for next_neighbor in get_neighbors(neighbor):
+                    mask |= self._op_bits.get(next_neighbor, 0)
+        return mask
+
+    def _get_operation_nodes_of_mask(self, mask: int) -> List[OperationNode]:
+        op_nodes = []
+        while mask:
+            lowest_bit = mask & -mask
+            op_nodes.append(self.operation_nodes[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+        return op_nodes
 
     def _get_func_def_str(self, node):
         """
@@ -0,0 +1,118 @@
+import json
+import os
+import time
+import tracemalloc
+from functools import wraps
+from typing import Any, Callable, List, Optional
+
+import pandas
+from pydantic import BaseModel
+
+
+class OutputProfile(BaseModel):
+    name: str
+    type: str
+    rows: Optional[int] = None
+    memory_bytes: Optional[int] = None
+
+
+class OperationProfile(BaseModel):
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_memory_delta_bytes: int
+    outputs: List[OutputProfile] = []
+    error: Optional[str] = None
+
+
+class OperationsProfileReport(BaseModel):
+    operations: List[OperationProfile] = []
+    total_wall_seconds: float = 0.0
+
+
+class OperationProfiler:
+    """
+    Records wall time, CPU time, traced peak memory and the size of returned data frames of every wrapped operation
+    call of an assembled script, and writes them as JSON to report_path. Memory is traced with tracemalloc, which slows
+    down allocation heavy operations, so the profiler is only used when profiling is asked for.
+    """
+
+    def __init__(self, report_path: str):
+        self.report_path = report_path
+        self.report = OperationsProfileReport()
+        self._start = time.perf_counter()
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def wrap(self, func: Callable, return_names: List[str]) -> Callable:
+        @wraps(func)
+        def profiled(*args, **kwargs):
+            tracemalloc.reset_peak()
+            memory_before, _ = tracemalloc.get_traced_memory()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+            error = None
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                _, memory_peak = tracemalloc.get_traced_memory()
+                self.report.operations.append(OperationProfile(
+                    name=func.__name__,
+                    wall_seconds=time.perf_counter() - wall_start,
+                    cpu_seconds=time.process_time() - cpu_start,
+                    peak_memory_delta_bytes=max(memory_peak - memory_before, 0),
+                    outputs=[] if error else _profile_outputs(result, return_names),
+                    error=error))
+
+        return profiled
+
+    def write_report(self):
+        self.report.total_wall_seconds = time.perf_counter() - self._start
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        report_dir = os.path.dirname(self.report_path)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+        with open(self.report_path, "w") as report_file:
+            report_file.write(self.report.model_dump_json(indent=2))
+
+
+def load_operations_profile_report(report_path: str) -> Optional[OperationsProfileReport]:
+    """Returns the profile report written by an assembled script, or None if the script did not write one."""
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path) as report_file:
+        return OperationsProfileReport(**json.load(report_file))
+
+
+def render_operations_profile(report: OperationsProfileReport, top: int = 5) -> str:
+    """Renders the slowest operations of a profile report, one line per operation."""
+    slowest = sorted(report.operations, key=lambda operation: operation.wall_seconds, reverse=True)[:top]
+    lines = [f"Operations took {report.total_wall_seconds:.2f} seconds in total. Slowest operations:"]
+    for operation in slowest:
+        outputs = ", ".join(f"{output.name} {output.rows} rows {output.memory_bytes / 1024 / 1024:.1f} MB"
+                            for output in operation.outputs if output.rows is not None)
+        lines.append(f"{operation.name}: {operation.wall_seconds:.2f} s wall, {operation.cpu_seconds:.2f} s CPU, "
+                     f"{operation.peak_memory_delta_bytes / 1024 / 1024:.1f} MB peak"
+                     + (f", {outputs}" if outputs else "")
+                     + (f", failed with {operation.error}" if operation.error else ""))
+    return "\n".join(lines)
+
+
+def _profile_outputs(result: Any, return_names: List[str]) -> List[OutputProfile]:
+    values = result if isinstance(result, tuple) and len(return_names) > 1 else (result,)
+    outputs = []
+    for name, value in zip(return_names, values):
+        output = OutputProfile(name=name, type=type(value).__name__)
+        if isinstance(value, pandas.DataFrame):
+            output.rows = len(value)
+            output.memory_bytes = int(value.memory_usage(deep=True).sum())
+        outputs.append(output)
+    return outputs
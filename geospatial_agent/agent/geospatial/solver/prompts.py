@@ -9,27 +9,49 @@ shim_instructions = [
     "When visualizing something with pydeck,use a built-in function named location_map_style() to return map_style. Do not add import statement for this function.",
 ]
 
+# Requirements are named, so requirement rules pick them by name instead of by their position in the list.
+REQUIREMENT_KEEP_GRAPH_NAMES = "Do not change the given variable names and paths from the graph."
+REQUIREMENT_IMPORTS = "Write code with necessary import statements of necessary libraries. Do not add imports for built-in functions. Follow Pep8 styling."
+REQUIREMENT_CODE_BLOCK = 'Write code into a Python code block(enclosed by ```python and ```).'
+REQUIREMENT_PYDECK_FOR_MAPS = "For visualization that requires a map, always use pydeck library unless otherwise specified."
+REQUIREMENT_PYDECK_HTML = "For visualization, if pydeck is used, save the pydeck deck to a HTML file."
+REQUIREMENT_PLOTTING_LIBRARIES = "For visualization that does not require a map, use other plotting libraries such as matplotlib, and pyplot."
+REQUIREMENT_READ_ZIPPED_SHAPEFILE = "When using GeoPandas to load a zipped shapefile from a URL, use gpd.read_file(URL). Do not download and unzip the file."
+REQUIREMENT_SAME_PROJECTION = "When doing spatial analysis, if necessary, and if there are multiple layers ONLY, convert all involved spatial layers into the same map projection."
+REQUIREMENT_PROJECT_GEODATAFRAMES_ONLY = "Conduct map projection conversion only for spatial data layers defined with geopandas GeoDataFrame. Do not do map projection with pandas DataFrame"
+REQUIREMENT_JOIN_ON_COMMON_COLUMNS = "While joining DataFrame and GeoDataFrame, use common columns. Do not to convert DataFrame to GeoDataFrame."
+REQUIREMENT_JOIN_COLUMN_TYPES = "When joining tables, convert the involved columns to string type without leading zeros. Convert integers to floats if necessary."
+REQUIREMENT_SHOW_UNITS = "Show units for graphs or maps."
+REQUIREMENT_KEEP_GEOMETRY_COLUMN = "When doing spatial joins, retain at least 1 geometry column"
+REQUIREMENT_SJOIN_ARGUMENTS = "While using GeoPandas for spatial joining, remind the arguements. The arguments are: geopandas.sjoin(left_df, right_df, how='inner', predicate='intersects', lsuffix='left', rsuffix='right', **kwargs)"
+REQUIREMENT_NO_MAIN_GUARD = "Do not to write a main function with 'if __name__ == '__main__:'"
+REQUIREMENT_SINGLE_FUNCTION = "Only a single python function is to be written in this task. Do not write tests or a main function."
+REQUIREMENT_NO_FAKE_BUILT_INS = "Use the built-in functions or attribute. Do not to make up fake built-in functions."
+REQUIREMENT_NO_UNNECESSARY_LIBRARIES = "Do not to use any library or package that is not necessary for the task."
+REQUIREMENT_RETHROW_EXCEPTIONS = "Do not to use try except block without re-throwing the exception."
+REQUIREMENT_SHAPELY_POINT = "Point function requires importing shapely library."
+
 predefined_operation_requirements = [
-    "Do not change the given variable names and paths from the graph.",
-    "Write code with necessary import statements of necessary libraries. Do not add imports for built-in functions. Follow Pep8 styling.",
-    'Write code into a Python code block(enclosed by ```python and ```).',
-    "For visualization that requires a map, always use pydeck library unless otherwise specified.",
-    "For visualization, if pydeck is used, save the pydeck deck to a HTML file.",
-    "For visualization that does not require a map, use other plotting libraries such as matplotlib, and pyplot.",
-    "When using GeoPandas to load a zipped shapefile from a URL, use gpd.read_file(URL). Do not download and unzip the file.",
-    "When doing spatial analysis, if necessary, and if there are multiple layers ONLY, convert all involved spatial layers into the same map projection.",
-    "Conduct map projection conversion only for spatial data layers defined with geopandas GeoDataFrame. Do not do map projection with pandas DataFrame",
-    "While joining DataFrame and GeoDataFrame, use common columns. Do not to convert DataFrame to GeoDataFrame.",
-    "When joining tables, convert the involved columns to string type without leading zeros. Convert integers to floats if necessary.",
-    "Show units for graphs or maps.",
-    "When doing spatial joins, retain at least 1 geometry column",
-    "While using GeoPandas for spatial joining, remind the arguements. The arguments are: geopandas.sjoin(left_df, right_df, how='inner', predicate='intersects', lsuffix='left', rsuffix='right', **kwargs)",
-    "Do not to write a main function with 'if __name__ == '__main__:'",
-    "Only a single python function is to be written in this task. Do not write tests or a main function.",
-    "Use the built-in functions or attribute. Do not to make up fake built-in functions.",
-    "Do not to use any library or package that is not necessary for the task.",
-    "Do not to use try except block without re-throwing the exception.",
-    "Point function requires importing shapely library."
+    REQUIREMENT_KEEP_GRAPH_NAMES,
+    REQUIREMENT_IMPORTS,
+    REQUIREMENT_CODE_BLOCK,
+    REQUIREMENT_PYDECK_FOR_MAPS,
+    REQUIREMENT_PYDECK_HTML,
+    REQUIREMENT_PLOTTING_LIBRARIES,
+    REQUIREMENT_READ_ZIPPED_SHAPEFILE,
+    REQUIREMENT_SAME_PROJECTION,
+    REQUIREMENT_PROJECT_GEODATAFRAMES_ONLY,
+    REQUIREMENT_JOIN_ON_COMMON_COLUMNS,
+    REQUIREMENT_JOIN_COLUMN_TYPES,
+    REQUIREMENT_SHOW_UNITS,
+    REQUIREMENT_KEEP_GEOMETRY_COLUMN,
+    REQUIREMENT_SJOIN_ARGUMENTS,
+    REQUIREMENT_NO_MAIN_GUARD,
+    REQUIREMENT_SINGLE_FUNCTION,
+    REQUIREMENT_NO_FAKE_BUILT_INS,
+    REQUIREMENT_NO_UNNECESSARY_LIBRARIES,
+    REQUIREMENT_RETHROW_EXCEPTIONS,
+    REQUIREMENT_SHAPELY_POINT
 ]
 
 operation_requirement_gen_task_prefix = r"""
@@ -132,13 +154,13 @@ Your reply example: {operation_reply_example}
 Pydeck usage example:
 {operation_pydeck_example}
 
-This function is a operation node in a solution graph for the question/task, the Python code to build the graph is:
+This function is a operation node in a solution graph for the question/task, the Python code to build the graph (or the part of the graph around this function) is:
 {graph_code}
 
-The ancestor function code is below. Follow the generated file names and attribute names:
+The ancestor functions producing the inputs of this function are below. Follow the generated file names and attribute names:
 {ancestor_operation_code}
 
-The descendant function (if any) definitions for the question are (node_name is function name):
+The descendant function (if any) definitions for the question are:
 {descendant_operations_definition}
 
 
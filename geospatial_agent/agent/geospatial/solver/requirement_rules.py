@@ -0,0 +1,245 @@
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Set
+
+from geospatial_agent.agent.geospatial.solver.prompts import predefined_operation_requirements, \
+    REQUIREMENT_KEEP_GRAPH_NAMES, REQUIREMENT_IMPORTS, REQUIREMENT_CODE_BLOCK, REQUIREMENT_PYDECK_FOR_MAPS, \
+    REQUIREMENT_PYDECK_HTML, REQUIREMENT_PLOTTING_LIBRARIES, REQUIREMENT_READ_ZIPPED_SHAPEFILE, \
+    REQUIREMENT_SAME_PROJECTION, REQUIREMENT_PROJECT_GEODATAFRAMES_ONLY, REQUIREMENT_JOIN_ON_COMMON_COLUMNS, \
+    REQUIREMENT_JOIN_COLUMN_TYPES, REQUIREMENT_SHOW_UNITS, REQUIREMENT_KEEP_GEOMETRY_COLUMN, \
+    REQUIREMENT_SJOIN_ARGUMENTS, REQUIREMENT_NO_MAIN_GUARD, REQUIREMENT_SINGLE_FUNCTION, \
+    REQUIREMENT_NO_FAKE_BUILT_INS, REQUIREMENT_NO_UNNECESSARY_LIBRARIES, REQUIREMENT_RETHROW_EXCEPTIONS, \
+    REQUIREMENT_SHAPELY_POINT
+
+ENV_REQUIREMENT_SELECTION_RECORD_PATH = "REQUIREMENT_SELECTION_RECORD_PATH"
+
+# Selections below this confidence are handed to the LLM requirement selector.
+DEFAULT_MIN_RULES_CONFIDENCE = 0.5
+
+# Confidence of a selection by whether rules for the operation type or its description matched.
+_MATCHED_KNOWN_TYPE_CONFIDENCE = 1.0
+_MATCHED_UNKNOWN_TYPE_CONFIDENCE = 0.6
+_UNMATCHED_KNOWN_TYPE_CONFIDENCE = 0.4
+_UNMATCHED_UNKNOWN_TYPE_CONFIDENCE = 0.3
+_AMBIGUOUS_VISUALIZATION_PENALTY = 0.3
+
+RULE_ALWAYS = "always"
+RULE_LOAD = "load"
+RULE_ZIPPED_SHAPEFILE = "zipped_shapefile"
+RULE_MAP_VISUALIZATION = "map_visualization"
+RULE_PLOT_VISUALIZATION = "plot_visualization"
+RULE_MULTIPLE_LAYERS = "multiple_layers"
+RULE_PROJECTION = "projection"
+RULE_TABLE_JOIN = "table_join"
+RULE_SPATIAL_JOIN = "spatial_join"
+RULE_POINT = "point"
+
+# Predefined operation requirements each rule selects.
+RULE_REQUIREMENTS: Dict[str, List[str]] = {
+    RULE_ALWAYS: [REQUIREMENT_KEEP_GRAPH_NAMES, REQUIREMENT_IMPORTS, REQUIREMENT_CODE_BLOCK, REQUIREMENT_NO_MAIN_GUARD,
+                  REQUIREMENT_SINGLE_FUNCTION, REQUIREMENT_NO_FAKE_BUILT_INS, REQUIREMENT_NO_UNNECESSARY_LIBRARIES,
+                  REQUIREMENT_RETHROW_EXCEPTIONS],
+    RULE_LOAD: [],
+    RULE_ZIPPED_SHAPEFILE: [REQUIREMENT_READ_ZIPPED_SHAPEFILE],
+    RULE_MAP_VISUALIZATION: [REQUIREMENT_PYDECK_FOR_MAPS, REQUIREMENT_PYDECK_HTML, REQUIREMENT_SHOW_UNITS],
+    RULE_PLOT_VISUALIZATION: [REQUIREMENT_PLOTTING_LIBRARIES, REQUIREMENT_SHOW_UNITS],
+    RULE_MULTIPLE_LAYERS: [REQUIREMENT_SAME_PROJECTION],
+    RULE_PROJECTION: [REQUIREMENT_PROJECT_GEODATAFRAMES_ONLY],
+    RULE_TABLE_JOIN: [REQUIREMENT_JOIN_ON_COMMON_COLUMNS, REQUIREMENT_JOIN_COLUMN_TYPES],
+    RULE_SPATIAL_JOIN: [REQUIREMENT_KEEP_GEOMETRY_COLUMN, REQUIREMENT_SJOIN_ARGUMENTS,
+                        REQUIREMENT_PROJECT_GEODATAFRAMES_ONLY],
+    RULE_POINT: [REQUIREMENT_SHAPELY_POINT],
+}
+
+_LOAD_KEYWORDS = {"load", "read", "import", "fetch", "download", "open", "collect"}
+_MAP_KEYWORDS = {"map", "maps", "heatmap", "choropleth", "pydeck", "deck", "hexagon", "basemap"}
+_PLOT_KEYWORDS = {"plot", "chart", "graph", "histogram", "bar", "pie", "line", "series", "pyplot", "matplotlib"}
+_VISUALIZATION_KEYWORDS = {"visualize", "visualise", "visualization", "visualisation", "draw", "display", "render",
+                           "show"}
+_SPATIAL_JOIN_KEYWORDS = {"sjoin", "intersect", "intersects", "within", "contains", "overlay",
+                          "clip", "overlap"}
+_JOIN_KEYWORDS = {"join", "merge", "combine", "attach", "link"}
+_PROJECTION_KEYWORDS = {"project", "reproject", "projection", "crs", "epsg", "buffer", "distance", "area",
+                        "nearest"}
+_POINT_KEYWORDS = {"point", "points", "latitude", "longitude", "lat", "lon", "lng", "coordinate", "coordinates",
+                   "xy"}
+
+# Operation types suggested by the planner prompt, and some common variations.
+_KNOWN_OPERATION_TYPES = {"load", "transform", "filter", "aggregate", "aggregation", "calculate", "compute", "clean",
+                          "visualization", "visualize", "map", "plot", "join", "merge", "spatial_join", "sjoin",
+                          "projection", "reproject", "geocode", "summarize", "analysis", "group", "groupby"}
+
+_record_lock = threading.Lock()
+
+
+class OperationRequirementFeatures:
+    """Everything the rules look at to select requirements for an operation."""
+
+    def __init__(self,
+                 description: str,
+                 operation_type: str = "",
+                 task_definition: str = "",
+                 input_count: int = 1,
+                 input_data_paths: Sequence[str] = (),
+                 has_geometry: bool = False):
+        self.description = description
+        self.operation_type = operation_type
+        self.task_definition = task_definition
+        self.input_count = input_count
+        self.input_data_paths = list(input_data_paths)
+        self.has_geometry = has_geometry
+
+
+class RequirementSelection:
+    def __init__(self, requirements: List[str], confidence: float, matched_rules: List[str]):
+        self.requirements = requirements
+        self.confidence = confidence
+        self.matched_rules = matched_rules
+
+
+class RequirementAgreement:
+    def __init__(self,
+                 record_count: int,
+                 exact_match_rate: float,
+                 mean_jaccard: float,
+                 mean_precision: float,
+                 mean_recall: float,
+                 fallback_rate: float,
+                 false_positives: Dict[str, int],
+                 false_negatives: Dict[str, int]):
+        self.record_count = record_count
+        self.exact_match_rate = exact_match_rate
+        self.mean_jaccard = mean_jaccard
+        self.mean_precision = mean_precision
+        self.mean_recall = mean_recall
+        self.fallback_rate = fallback_rate
+        self.false_positives = false_positives
+        self.false_negatives = false_negatives
+
+
+def select_operation_requirements(features: OperationRequirementFeatures) -> RequirementSelection:
+    """Returns predefined operation requirements relevant for an operation, without calling an LLM."""
+    op_words = _tokenize(f"{features.description} {features.operation_type}")
+    task_words = _tokenize(features.task_definition)
+    operation_type = features.operation_type.strip().lower()
+
+    matched_rules: List[str] = []
+    is_known_type = operation_type in _KNOWN_OPERATION_TYPES
+    confidence = _MATCHED_KNOWN_TYPE_CONFIDENCE if is_known_type else _MATCHED_UNKNOWN_TYPE_CONFIDENCE
+
+    is_load = bool(op_words & _LOAD_KEYWORDS)
+    if is_load:
+        matched_rules.append(RULE_LOAD)
+        data_refs = " ".join(features.input_data_paths).lower() + " " + features.description.lower()
+        if ".zip" in data_refs or "shapefile" in data_refs or ".shp" in data_refs:
+            matched_rules.append(RULE_ZIPPED_SHAPEFILE)
+
+    is_map = bool(op_words & _MAP_KEYWORDS)
+    is_plot = bool(op_words & _PLOT_KEYWORDS)
+    if not is_map and not is_plot and op_words & _VISUALIZATION_KEYWORDS:
+        # INFO: A generic visualization step. The task decides whether a map or a plot is drawn.
+        is_map = bool(task_words & _MAP_KEYWORDS)
+        is_plot = bool(task_words & _PLOT_KEYWORDS)
+        if not is_map and not is_plot:
+            is_map = is_plot = True
+            confidence -= _AMBIGUOUS_VISUALIZATION_PENALTY
+    if is_map:
+        matched_rules.append(RULE_MAP_VISUALIZATION)
+    if is_plot:
+        matched_rules.append(RULE_PLOT_VISUALIZATION)
+
+    is_spatial_join = bool(op_words & _SPATIAL_JOIN_KEYWORDS) or operation_type in {"spatial_join", "sjoin"} or \
+        ("spatial" in op_words and bool(op_words & _JOIN_KEYWORDS))
+    if is_spatial_join:
+        matched_rules.append(RULE_SPATIAL_JOIN)
+    elif op_words & _JOIN_KEYWORDS:
+        matched_rules.append(RULE_TABLE_JOIN)
+
+    is_projection = bool(op_words & _PROJECTION_KEYWORDS)
+    if is_projection:
+        matched_rules.append(RULE_PROJECTION)
+
+    if (is_spatial_join or is_projection) and features.input_count > 1:
+        matched_rules.append(RULE_MULTIPLE_LAYERS)
+
+    needs_points = bool(op_words & _POINT_KEYWORDS) or \
+        (is_load and not features.has_geometry and bool(task_words & (_MAP_KEYWORDS | _POINT_KEYWORDS)))
+    if needs_points:
+        matched_rules.append(RULE_POINT)
+
+    if not matched_rules:
+        # INFO: Only the generic requirements were selected, so the rules do not cover this operation, whatever its
+        # type is. Such selections are handed to the LLM with the default minimum confidence.
+        confidence = _UNMATCHED_KNOWN_TYPE_CONFIDENCE if is_known_type else _UNMATCHED_UNKNOWN_TYPE_CONFIDENCE
+
+    selected: Set[str] = set(RULE_REQUIREMENTS[RULE_ALWAYS])
+    for rule in matched_rules:
+        selected.update(RULE_REQUIREMENTS[rule])
+    requirements = [requirement for requirement in predefined_operation_requirements if requirement in selected]
+    return RequirementSelection(requirements=requirements, confidence=round(confidence, 2),
+                                matched_rules=matched_rules)
+
+
+def record_requirement_selection(features: OperationRequirementFeatures, llm_requirements: List[str],
+                                 record_path: Optional[str]):
+    """Appends an LLM requirement selection to a JSON lines file for comparing selectors later."""
+    if not record_path:
+        return
+
+    record = dict(features.__dict__, llm_requirements=llm_requirements)
+    with _record_lock:
+        with open(record_path, "a") as record_file:
+            record_file.write(json.dumps(record) + "\n")
+
+
+def compare_requirement_selections(records: Sequence[dict],
+                                   min_confidence: float = DEFAULT_MIN_RULES_CONFIDENCE) -> RequirementAgreement:
+    """
+    Measures how closely the rules agree with recorded LLM requirement selections. Each record holds the
+    OperationRequirementFeatures attributes and the LLM selected requirements under llm_requirements.
+    """
+    predefined = set(predefined_operation_requirements)
+    false_positives: Dict[str, int] = {}
+    false_negatives: Dict[str, int] = {}
+    exact_matches = 0
+    fallbacks = 0
+    jaccard_sum = precision_sum = recall_sum = 0.0
+
+    for record in records:
+        features = OperationRequirementFeatures(
+            **{key: value for key, value in record.items() if key != "llm_requirements"})
+        selection = select_operation_requirements(features)
+
+        # INFO: Requirements the LLM made up on its own can not be picked by the rules, they are not compared.
+        expected = set(record["llm_requirements"]) & predefined
+        actual = set(selection.requirements)
+
+        union = expected | actual
+        intersection = expected & actual
+        jaccard_sum += len(intersection) / len(union) if union else 1.0
+        precision_sum += len(intersection) / len(actual) if actual else 1.0
+        recall_sum += len(intersection) / len(expected) if expected else 1.0
+        exact_matches += int(expected == actual)
+        fallbacks += int(selection.confidence < min_confidence)
+
+        for requirement in actual - expected:
+            false_positives[requirement] = false_positives.get(requirement, 0) + 1
+        for requirement in expected - actual:
+            false_negatives[requirement] = false_negatives.get(requirement, 0) + 1
+
+    count = len(records)
+    return RequirementAgreement(
+        record_count=count,
+        exact_match_rate=exact_matches / count if count else 0.0,
+        mean_jaccard=jaccard_sum / count if count else 0.0,
+        mean_precision=precision_sum / count if count else 0.0,
+        mean_recall=recall_sum / count if count else 0.0,
+        fallback_rate=fallbacks / count if count else 0.0,
+        false_positives=false_positives,
+        false_negatives=false_negatives,
+    )
+
+
+def _tokenize(text: str) -> Set[str]:
+    return set(re.split(r"[^a-z0-9]+", text.lower().replace("_", " "))) - {""}
@@ -1,33 +1,72 @@
 import json
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 
 import networkx
-from langchain import PromptTemplate, LLMChain
 from langchain.llms.base import LLM
 from pydispatch import dispatcher
 
-from geospatial_agent.agent.geospatial.solver.constants import NODE_TYPE_ATTRIBUTE, NODE_TYPE_OPERATION
+from geospatial_agent.agent.geospatial.solver.constants import NODE_DATA_PATH_ATTRIBUTE
+from geospatial_agent.agent.geospatial.solver.op_context import OperationPromptContextBuilder, estimate_tokens
 from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser, OperationNode
+from geospatial_agent.agent.geospatial.solver.op_profiler import OperationProfiler
 from geospatial_agent.agent.geospatial.solver.prompts import operation_code_gen_intro, \
     operation_task_prefix, operation_reply_example, operation_code_gen_prompt_template, \
     operation_pydeck_example, operation_requirement_gen_task_prefix, predefined_operation_requirements, \
     shim_instructions
+from geospatial_agent.agent.geospatial.solver.requirement_rules import select_operation_requirements, \
+    record_requirement_selection, OperationRequirementFeatures, DEFAULT_MIN_RULES_CONFIDENCE, \
+    ENV_REQUIREMENT_SELECTION_RECORD_PATH
 from geospatial_agent.agent.shared import SIGNAL_OPERATION_CODE_GENERATED, SENDER_GEOSPATIAL_AGENT, AgentSignal, \
-    EventType, SIGNAL_TAIL_CODE_GENERATED
-from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE, HUMAN_STOP_SEQUENCE
+    EventType, SIGNAL_TAIL_CODE_GENERATED, get_code_chunk_sender
+from geospatial_agent.shared.llm_stages import StageLLMFactory, STAGE_OP_CODE, STAGE_OP_REQUIREMENTS
+from geospatial_agent.shared.prompt_template import CompiledPrompt
+from geospatial_agent.shared.prompts import HUMAN_ROLE, ASSISTANT_ROLE
 from geospatial_agent.shared.shim import get_shim_imports
+from geospatial_agent.shared.streaming import predict_block
 from geospatial_agent.shared.utils import extract_code, extract_content_xml
 
-from typing import List
+from typing import List, Dict, Optional, Sequence
+
+# Maximum number of operations for which code is generated at the same time.
+DEFAULT_MAX_CONCURRENT_OPERATIONS = 4
+
+# Requirement selectors. The rules selector falls back to the LLM when it is not confident.
+REQUIREMENT_SELECTOR_RULES = "rules"
+REQUIREMENT_SELECTOR_LLM = "llm"
+REQUIREMENT_SELECTORS = (REQUIREMENT_SELECTOR_RULES, REQUIREMENT_SELECTOR_LLM)
+
+# Name of the operation profiler in assembled scripts that profile their operations.
+_OPERATION_PROFILER_NAME = "_operation_profiler"
+
+_OPERATION_REQUIREMENT_PROMPT = CompiledPrompt("operation_requirements", operation_requirement_gen_task_prefix).partial(
+    human_role=HUMAN_ROLE,
+    operation_req_gen_intro=operation_code_gen_intro,
+    pre_requirements='\n'.join(
+        [f"{idx + 1}. {line}" for idx, line in enumerate(predefined_operation_requirements)]),
+    assistant_role=ASSISTANT_ROLE
+)
+
+_OPERATION_CODE_PROMPT = CompiledPrompt("operation_code", operation_code_gen_prompt_template).partial(
+    human_role=HUMAN_ROLE,
+    operation_code_gen_intro=operation_code_gen_intro,
+    operation_task_prefix=operation_task_prefix,
+    operation_reply_example=operation_reply_example,
+    operation_pydeck_example=operation_pydeck_example,
+    assistant_role=ASSISTANT_ROLE
+)
 
 
 class OperationCodeGenOutput:
     def __init__(self,
                  operation_prompt: str,
                  operation_code_gen_response: str,
-                 operation_code: str):
+                 operation_code: str,
+                 context_tokens: Optional[Dict[str, int]] = None):
         self.operation_prompt = operation_prompt
         self.operation_code_gen_response = operation_code_gen_response
         self.operation_code = operation_code
+        self.context_tokens = context_tokens or {}
 
 
 class InvalidStateError(Exception):
@@ -38,15 +77,23 @@ class InvalidStateError(Exception):
 
 class Solver:
     def __init__(self,
-                 llm: LLM,
+                 llm: Optional[LLM],
                  graph: networkx.DiGraph,
                  graph_code: str,
                  session_id: str,
                  storage_mode: str,
                  task_definition: str,
                  task_name: str,
-                 data_locations_instructions: str):
-        self.llm = llm
+                 data_locations_instructions: str,
+                 max_workers: int = DEFAULT_MAX_CONCURRENT_OPERATIONS,
+                 requirement_selector: str = REQUIREMENT_SELECTOR_RULES,
+                 min_rules_confidence: float = DEFAULT_MIN_RULES_CONFIDENCE,
+                 llm_factory: Optional[StageLLMFactory] = None,
+                 context_token_budget: Optional[int] = None,
+                 geometry_file_urls: Optional[Sequence[str]] = None):
+        # INFO: Without a stage LLM factory, the given LLM is used for both requirement and code generation.
+        self.llm_factory = llm_factory or StageLLMFactory.from_llm(llm)
+        self.llm = self.llm_factory.get_llm(STAGE_OP_CODE)
         self.graph = graph
         self.graph_code = graph_code
         self.session_id = session_id
@@ -54,53 +101,136 @@ class Solver:
         self.task_def = task_definition
         self.task_name = task_name
         self.data_locations_instructions = data_locations_instructions
+        # File URLs of data files whose profile has a geometry column.
+        self.geometry_file_urls = set(geometry_file_urls or [])
         self.operation_parser = OperationsParser(graph)
+        self.max_workers = max_workers
+        self.requirement_selector = requirement_selector
+        self.min_rules_confidence = min_rules_confidence
+        self.context_builder = OperationPromptContextBuilder(self.operation_parser, graph_code,
+                                                             data_locations_instructions, context_token_budget)
+        # Estimated tokens of the code generation prompt of every generated operation.
+        self.prompt_tokens: Dict[str, int] = {}
 
     def solve(self):
+        """
+        Generates code for all operation nodes. Operations are scheduled in topological levels on a bounded
+        worker pool. An operation starts as soon as its requirements are selected and all ancestors whose code
+        goes into its prompt are generated. Requirements are selected ahead, in the same order, on workers that no
+        ready operation is waiting for.
+        """
         op_nodes = self.operation_parser.operation_nodes
-
-        for idx, op_node in enumerate(op_nodes):
-            operation_code_gen_output = self.gen_operation_code(op_node)
-            dispatcher.send(signal=SIGNAL_OPERATION_CODE_GENERATED,
-                            sender=SENDER_GEOSPATIAL_AGENT,
-                            event_data=AgentSignal(
-                                event_source=SENDER_GEOSPATIAL_AGENT,
-                                event_message=f"{idx + 1} / {len(op_nodes)}: Generated code for operation {op_node.node_name}",
-                                event_data=operation_code_gen_output.operation_code,
-                                event_type=EventType.PythonCode
-                            ))
-
-            # INFO: Updating Operation Nodes with generated code
-            op_node.operation_prompt = operation_code_gen_output.operation_prompt
-            op_node.code_gen_response = operation_code_gen_output.operation_code_gen_response
-            op_node.operation_code = operation_code_gen_output.operation_code
+        op_levels = self.operation_parser.get_operation_levels()
+
+        # INFO: Ready operations are submitted by level first, and then by their order in the plan graph.
+        submit_order = {op_node.node_name: idx for idx, op_node in
+                        enumerate([op_node for level in op_levels for op_node in level])}
+        waiting_on = {op_node.node_name: {ancestor.node_name for ancestor in self._get_code_dependencies(op_node)}
+                      for op_node in op_nodes}
+        op_nodes_by_name = {op_node.node_name: op_node for op_node in op_nodes}
+
+        # INFO: An operation waits on its own name until its requirements are selected. An operation can not be its
+        # own ancestor, so the name is never confused with a code dependency.
+        pending_requirements = sorted([op_node for op_node in op_nodes if op_node.operation_requirements is None],
+                                      key=lambda op_node: submit_order[op_node.node_name])
+        for op_node in pending_requirements:
+            waiting_on[op_node.node_name].add(op_node.node_name)
+
+        generated_count = 0
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            running: Dict[Future, OperationNode] = {}
+            running_requirements: Dict[Future, OperationNode] = {}
+            while waiting_on or running or running_requirements:
+                ready_names = sorted([name for name, deps in waiting_on.items() if not deps],
+                                     key=lambda name: submit_order[name])
+                for name in ready_names:
+                    del waiting_on[name]
+                    op_node = op_nodes_by_name[name]
+                    running[executor.submit(self.gen_operation_code, op_node)] = op_node
+
+                # INFO: Requirement selections only take free workers, so they never queue ahead of the code
+                # generation of ready operations, which is on the critical path.
+                free_workers = self.max_workers - len(running) - len(running_requirements)
+                if free_workers > 0 and pending_requirements:
+                    submitting, pending_requirements = \
+                        pending_requirements[:free_workers], pending_requirements[free_workers:]
+                    running_requirements.update(self._submit_operation_requirements(executor, submitting))
+
+                if not running and not running_requirements:
+                    raise InvalidStateError(
+                        f"Operations {list(waiting_on.keys())} are waiting on operations that can not be generated")
+
+                done, _ = wait(list(running.keys()) + list(running_requirements.keys()),
+                               return_when=FIRST_COMPLETED)
+
+                for future in [f for f in done if f in running_requirements]:
+                    op_node = running_requirements.pop(future)
+                    op_node.operation_requirements = future.result()
+                    waiting_on[op_node.node_name].discard(op_node.node_name)
+
+                for future in sorted([f for f in done if f in running],
+                                     key=lambda f: submit_order[running[f].node_name]):
+                    op_node = running.pop(future)
+                    operation_code_gen_output = future.result()
+                    generated_count += 1
+
+                    # INFO: Updating Operation Nodes with generated code
+                    op_node.operation_prompt = operation_code_gen_output.operation_prompt
+                    op_node.code_gen_response = operation_code_gen_output.operation_code_gen_response
+                    op_node.operation_code = operation_code_gen_output.operation_code
+                    self.prompt_tokens[op_node.node_name] = estimate_tokens(operation_code_gen_output.operation_prompt)
+
+                    dispatcher.send(signal=SIGNAL_OPERATION_CODE_GENERATED,
+                                    sender=SENDER_GEOSPATIAL_AGENT,
+                                    event_data=AgentSignal(
+                                        event_source=SENDER_GEOSPATIAL_AGENT,
+                                        event_message=f"{generated_count} / {len(op_nodes)}: Generated code for operation {op_node.node_name} "
+                                                  f"from a prompt of about {self.prompt_tokens[op_node.node_name]} tokens",
+                                        event_data=operation_code_gen_output.operation_code,
+                                        event_type=EventType.PythonCode
+                                    ))
+
+                    for deps in waiting_on.values():
+                        deps.discard(op_node.node_name)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
         return op_nodes
 
-    def assemble(self):
-        output_node_names = self.operation_parser.output_node_names
-        operation_nodes = self.operation_parser.operation_nodes
+    def _submit_operation_requirements(self, executor: Executor,
+                                       op_nodes: Sequence[OperationNode]) -> Dict[Future, OperationNode]:
+        """Submits requirement selection for operation nodes that do not have cached requirements yet."""
+        return {executor.submit(self.get_operation_requirement, op_node): op_node
+                for op_node in op_nodes if op_node.operation_requirements is None}
+
+    def _get_code_dependencies(self, op_node: OperationNode) -> Sequence[OperationNode]:
+        """Returns operation nodes whose generated code is embedded in the code generation prompt of op_node."""
+        return self.operation_parser.get_direct_ancestors(op_node.node_name)
+
+    def assemble(self, profile_report_path: Optional[str] = None):
+        """
+        Returns the assembled script of all generated operations. Every operation is defined and called once, in a
+        topological order of the plan graph, so an operation feeding several outputs does not run again for each of
+        them. If profile_report_path is given, every operation call of the script is profiled and the profile report
+        is written to profile_report_path as JSON.
+        """
+        op_nodes = self.operation_parser.get_operations_in_execution_order()
 
         # The head end of the code
-        head = ""
+        head = "".join(["\n" + op_node.operation_code + "\n" for op_node in op_nodes])
 
         # The tail end of the code
-        tail = ""
-
-        reverse_graph = self.graph.reverse(copy=True)
+        tail = "".join([self._get_operation_call(op_node, profile=profile_report_path is not None)
+                        for op_node in op_nodes])
 
-        for idx, output_node in enumerate(output_node_names):
-            bfs_edges = networkx.bfs_edges(reverse_graph, source=output_node)
-            for bfs_edge in bfs_edges:
-                from_node_name, _ = bfs_edge
-                current_nx_node = self.graph.nodes[from_node_name]
-
-                if current_nx_node.get(NODE_TYPE_ATTRIBUTE, None) == NODE_TYPE_OPERATION:
-                    op_node: OperationNode = next(
-                        (op_node for op_node in operation_nodes if op_node.node_name == from_node_name), None)
-
-                    head = "\n" + op_node.operation_code + "\n" + head
-                    tail = f'{", ".join(op_node.return_names)}={op_node.function_definition}\n' + tail
+        if profile_report_path is not None and tail:
+            tail = f'from {OperationProfiler.__module__} import {OperationProfiler.__name__}\n' + \
+                   f'{_OPERATION_PROFILER_NAME} = {OperationProfiler.__name__}(report_path={profile_report_path!r})\n' + \
+                   'try:\n' + \
+                   ''.join(f'    {line}\n' for line in tail.splitlines()) + \
+                   'finally:\n' + \
+                   f'    {_OPERATION_PROFILER_NAME}.write_report()\n'
 
         # Adding the session id and task name to the code
         tail = f'\nsession_id = "{self.session_id}"\n' + \
@@ -121,7 +251,57 @@ class Solver:
         assembled_code = f'{get_shim_imports()}\n{assembled_code}'
         return assembled_code
 
+    @staticmethod
+    def _get_operation_call(op_node: OperationNode, profile: bool) -> str:
+        if not profile:
+            return f'{", ".join(op_node.return_names)}={op_node.function_definition}\n'
+
+        # INFO: The function definition starts with the operation name, the profiled call replaces the name with the
+        # wrapped operation and keeps the arguments.
+        arguments = op_node.function_definition[len(op_node.node_name):]
+        return f'{", ".join(op_node.return_names)}=' \
+               f'{_OPERATION_PROFILER_NAME}.wrap({op_node.node_name}, {op_node.return_names!r}){arguments}\n'
+
     def get_operation_requirement(self, op_node: OperationNode) -> list[str]:
+        """
+        Returns requirements for an operation. With the rules selector, the LLM is only asked when the rules are not
+        confident about their selection. With the LLM selector, every selection is recorded for comparing the
+        selectors.
+        """
+        features = self._get_requirement_features(op_node)
+        if self.requirement_selector == REQUIREMENT_SELECTOR_RULES:
+            selection = select_operation_requirements(features)
+            if selection.confidence >= self.min_rules_confidence:
+                return shim_instructions + selection.requirements
+
+        operation_requirement_list = self._gen_operation_requirement(op_node)
+        # INFO: Fallbacks of the rules selector are not recorded. They are only the operations the rules do not
+        # cover, and comparing with them alone would not tell how well the rules do on all operations.
+        if self.requirement_selector == REQUIREMENT_SELECTOR_LLM:
+            record_requirement_selection(features, operation_requirement_list,
+                                         os.environ.get(ENV_REQUIREMENT_SELECTION_RECORD_PATH))
+        return shim_instructions + operation_requirement_list
+
+    def _get_requirement_features(self, op_node: OperationNode) -> OperationRequirementFeatures:
+        input_data_paths = [self.graph.nodes[param_name].get(NODE_DATA_PATH_ATTRIBUTE, "")
+                            for param_name in op_node.param_names]
+        input_data_paths = [data_path for data_path in input_data_paths if data_path]
+        # INFO: An operation reading data files has geometry if one of its files has. Other operations work on the
+        # outputs of earlier operations, which may have geometry if any of the data files has.
+        if input_data_paths:
+            has_geometry = any(data_path in self.geometry_file_urls for data_path in input_data_paths)
+        else:
+            has_geometry = len(self.geometry_file_urls) > 0
+        return OperationRequirementFeatures(
+            description=op_node.description,
+            operation_type=op_node.operation_type,
+            task_definition=self.task_def.strip("\n").strip(),
+            input_count=len(op_node.param_names),
+            input_data_paths=input_data_paths,
+            has_geometry=has_geometry
+        )
+
+    def _gen_operation_requirement(self, op_node: OperationNode) -> list[str]:
         node_name = op_node.node_name
 
         task_def = self.task_def.strip("\n").strip()
@@ -134,39 +314,30 @@ class Solver:
         op_properties_str = '\n'.join(
             [f"{idx + 1}. {line}" for idx, line in enumerate(op_properties)])
 
-        operation_requirement_str = '\n'.join(
-            [f"{idx + 1}. {line}" for idx, line in enumerate(predefined_operation_requirements)])
-
-        op_req_gen_prompt_template: PromptTemplate = PromptTemplate.from_template(operation_requirement_gen_task_prefix)
-
-        chain = LLMChain(llm=self.llm, prompt=op_req_gen_prompt_template)
-        req_gen_response = chain.run(
-            human_role=HUMAN_ROLE,
-            operation_req_gen_intro=operation_code_gen_intro,
+        op_req_gen_prompt = _OPERATION_REQUIREMENT_PROMPT.render(
             operation_name=node_name,
-            pre_requirements=operation_requirement_str,
-            operation_properties=op_properties_str,
-            assistant_role=ASSISTANT_ROLE,
-            stop=[HUMAN_STOP_SEQUENCE]
-        ).strip()
+            operation_properties=op_properties_str
+        )
+        req_gen_response = predict_block(
+            llm=self.llm_factory.get_llm(STAGE_OP_REQUIREMENTS),
+            prompt=op_req_gen_prompt,
+            stop=self.llm_factory.get_stop_sequences(STAGE_OP_REQUIREMENTS),
+            xml_tag="json").strip()
 
         operation_requirement_json = extract_content_xml("json", req_gen_response)
         operation_requirement_list: List[str] = json.loads(operation_requirement_json)
-        operation_requirement_list = shim_instructions + operation_requirement_list
         return operation_requirement_list
 
     def gen_operation_code(self, op_node: OperationNode) -> OperationCodeGenOutput:
-        operation_requirement_list = self.get_operation_requirement(op_node)
+        operation_requirement_list = op_node.operation_requirements
+        if operation_requirement_list is None:
+            operation_requirement_list = self.get_operation_requirement(op_node)
 
         node_name = op_node.node_name
 
-        # Get ancestors operations functions. For operations that has ancestors, this will also come with LLM
-        # generated code for the operations.
-        ancestor_op_nodes = self.operation_parser.get_ancestors(node_name)
-        ancestor_op_nodes_code = '\n'.join([op_node.operation_code for op_node in ancestor_op_nodes])
-
-        descendant_op_node = self.operation_parser.get_descendants(node_name)
-        descendant_op_node_defs = self.operation_parser.stringify_nodes(descendant_op_node)
+        # INFO: The prompt only gets the part of the plan around the operation: summaries of the generated code of
+        # direct ancestors, definitions of direct descendants and the data locations the operation reads from.
+        context = self.context_builder.build(op_node)
 
         pre_requirements = [
             f'The function description is: {op_node.description}',
@@ -177,45 +348,24 @@ class Solver:
         operation_requirements_str = '\n'.join(
             [f"{idx + 1}. {line}" for idx, line in enumerate(pre_requirements + operation_requirement_list)])
 
-        op_code_gen_prompt_template: PromptTemplate = PromptTemplate.from_template(operation_code_gen_prompt_template)
-        op_code_gen_prompt = op_code_gen_prompt_template.format(
-            human_role=HUMAN_ROLE,
-            operation_code_gen_intro=operation_code_gen_intro,
-            operation_task_prefix=operation_task_prefix,
+        op_code_gen_prompt = _OPERATION_CODE_PROMPT.render(
             operation_description=op_node.description,
             task_definition=self.task_def.strip("\n").strip(),
-            graph_code=self.graph_code,
-            data_locations_instructions=self.data_locations_instructions,
+            graph_code=context.graph_code,
+            data_locations_instructions=context.data_locations_instructions,
             session_id=self.session_id,
             task_name=self.task_name,
             storage_mode=self.storage_mode,
-            operation_reply_example=operation_reply_example,
-            operation_pydeck_example=operation_pydeck_example,
             operation_requirements=operation_requirements_str,
-            ancestor_operation_code=ancestor_op_nodes_code,
-            descendant_operations_definition=str(descendant_op_node_defs),
-            assistant_role=ASSISTANT_ROLE
+            ancestor_operation_code=context.ancestor_operation_code,
+            descendant_operations_definition=context.descendant_operations_definition
         )
 
-        chain = LLMChain(llm=self.llm, prompt=op_code_gen_prompt_template)
-        code_gen_response = chain.run(
-            human_role=HUMAN_ROLE,
-            operation_code_gen_intro=operation_code_gen_intro,
-            operation_task_prefix=operation_task_prefix,
-            operation_description=op_node.description,
-            task_definition=self.task_def.strip("\n").strip(),
-            graph_code=self.graph_code,
-            data_locations_instructions=self.data_locations_instructions,
-            session_id=self.session_id,
-            task_name=self.task_name,
-            storage_mode=self.storage_mode,
-            operation_reply_example=operation_reply_example,
-            operation_pydeck_example=operation_pydeck_example,
-            operation_requirements=operation_requirements_str,
-            ancestor_operation_code=ancestor_op_nodes_code,
-            descendant_operations_definition=str(descendant_op_node_defs),
-            assistant_role=ASSISTANT_ROLE,
-            stop=[HUMAN_STOP_SEQUENCE]
+        code_gen_response = predict_block(
+            llm=self.llm,
+            prompt=op_code_gen_prompt,
+            stop=self.llm_factory.get_stop_sequences(STAGE_OP_CODE),
+            on_partial=get_code_chunk_sender(SENDER_GEOSPATIAL_AGENT, f"Generating code for operation {node_name}")
         ).strip()
 
         operation_code = extract_code(code_gen_response)
@@ -223,5 +373,6 @@ class Solver:
         return OperationCodeGenOutput(
             operation_prompt=op_code_gen_prompt,
             operation_code_gen_response=code_gen_response,
-            operation_code=operation_code
+            operation_code=operation_code,
+            context_tokens=context.get_section_tokens()
         )
@@ -1,19 +1,28 @@
+import builtins
+import gc
 import sys
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
 from enum import Enum, auto
 from io import StringIO
-from typing import TypeVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, TypeVar
 from datetime import datetime
 
 from pydantic import BaseModel, Field
+from pydispatch import dispatcher
 
 from uuid import uuid4
 
+from geospatial_agent.agent.execution_limits import ExecutionLimits, enforce_limits
+
 SENDER_ACTION_SUMMARIZER = "action_summarizer"
 SENDER_GEOSPATIAL_AGENT = "geospatial_agent"
 SENDER_GEO_CHAT_AGENT = "geo_chat_agent"
 
 SIGNAL_ASSEMBLED_CODE_EXECUTING = "assembled_code_executing"
 SIGNAL_ASSEMBLED_CODE_EXECUTED = "assembled_code_executed"
+SIGNAL_OPERATIONS_PROFILED = "operations_profiled"
 SIGNAL_GRAPH_CODE_GENERATED = "plan_graph_code_generated"
 SIGNAL_TASK_NAME_GENERATED = "task_name_generated"
 SIGNAL_OPERATION_CODE_GENERATED = "operation_code_generated"
@@ -21,7 +30,10 @@ SIGNAL_CODE_REVIEW_GENERATED = "operation_code_review_generated"
 SIGNAL_ACTION_CONTEXT_GENERATED = "action_context_generated"
 SIGNAL_FILE_READ_CODE_GENERATED = "file_read_code_generated"
 SIGNAL_FILE_READ_CODE_EXECUTED = "file_read_code_executed"
+SIGNAL_FILE_SUMMARY_FAILED = "file_summary_failed"
+SIGNAL_FILE_SUMMARIES_CACHED = "file_summaries_cached"
 SIGNAL_TAIL_CODE_GENERATED = "tail_code_generated"
+SIGNAL_CODE_CHUNK_GENERATED = "code_chunk_generated"
 
 SIGNAL_GEO_CHAT_INITIATED = "geo_chat_initiated"
 SIGNAL_GEO_CHAT_RESPONSE_COMPLETE = "geo_chat_response_complete"
@@ -29,6 +41,7 @@ SIGNAL_GEO_CHAT_RESPONSE_COMPLETE = "geo_chat_response_complete"
 ALL_SIGNALS = [
     SIGNAL_ASSEMBLED_CODE_EXECUTING,
     SIGNAL_ASSEMBLED_CODE_EXECUTED,
+    SIGNAL_OPERATIONS_PROFILED,
     SIGNAL_GRAPH_CODE_GENERATED,
     SIGNAL_TASK_NAME_GENERATED,
     SIGNAL_OPERATION_CODE_GENERATED,
@@ -36,7 +49,10 @@ ALL_SIGNALS = [
     SIGNAL_ACTION_CONTEXT_GENERATED,
     SIGNAL_FILE_READ_CODE_GENERATED,
     SIGNAL_FILE_READ_CODE_EXECUTED,
+    SIGNAL_FILE_SUMMARY_FAILED,
+    SIGNAL_FILE_SUMMARIES_CACHED,
     SIGNAL_TAIL_CODE_GENERATED,
+    SIGNAL_CODE_CHUNK_GENERATED,
     SIGNAL_GEO_CHAT_INITIATED,
     SIGNAL_GEO_CHAT_RESPONSE_COMPLETE
 ]
@@ -45,6 +61,8 @@ ALL_SIGNALS = [
 # enum for event types - CodePython, Message, Error
 class EventType(Enum):
     PythonCode = auto()
+    PythonCodeChunk = auto()
+    CodeOutputChunk = auto()
     Message = auto()
     Error = auto()
 
@@ -62,16 +80,281 @@ class AgentSignal(BaseModel):
     is_final: bool = Field(default=False)
 
 
-def execute_assembled_code(assembled_code):
-    """Executes the assembled code and returns the output."""
-    old_stdout = sys.stdout
-    redirected_output = sys.stdout = StringIO()
+def get_code_chunk_sender(sender: str, stream_name: str) -> Callable[[str], None]:
+    """Returns a callback that sends partially generated code of stream_name as SIGNAL_CODE_CHUNK_GENERATED signals."""
+
+    def send_code_chunk(code_chunk: str):
+        dispatcher.send(signal=SIGNAL_CODE_CHUNK_GENERATED,
+                        sender=sender,
+                        event_data=AgentSignal(
+                            event_source=sender,
+                            event_message=stream_name,
+                            event_data=code_chunk,
+                            event_type=EventType.PythonCodeChunk
+                        ))
+
+    return send_code_chunk
+
+
+# Output of executing code is sent at most this often, or once this many characters are buffered.
+DEFAULT_OUTPUT_FLUSH_INTERVAL_SECONDS = 0.5
+DEFAULT_OUTPUT_BUFFER_CHARS = 4096
+
+# Name of the module the executed code runs as. It is not __main__, so "if __name__ == '__main__'" blocks do not run.
+EXECUTED_CODE_MODULE_NAME = "__assembled_code__"
+EXECUTED_CODE_FILE_NAME = "<assembled_code>"
+
+
+class CodeExecutionResult(BaseModel):
+    output: str
+    results: Dict[str, Any] = Field(default_factory=dict)
+    peak_memory_bytes: Optional[int] = None
+    process_peak_memory_bytes: Optional[int] = None
+    duration_seconds: float = 0.0
+
+
+# Turns the results of executed code into what is returned to the caller, where the code was executed.
+ResultProcessor = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def execute_assembled_code(assembled_code: str,
+                           result_names: Optional[List[str]] = None,
+                           filename: str = EXECUTED_CODE_FILE_NAME,
+                           on_output: Optional[Callable[[str], None]] = None,
+                           limits: Optional[ExecutionLimits] = None,
+                           owns_process: bool = False,
+                           result_processor: Optional[ResultProcessor] = None) -> CodeExecutionResult:
+    """
+    Executes the assembled code in a fresh namespace and returns its output, and the values of result_names it
+    defined. Everything else the code created is released afterwards, and matplotlib figures it opened are closed.
+    Everything the code writes to sys.stdout in this thread is collected, including output of libraries it calls.
+    While executions run, sys.stdout is a proxy that sends writes of each executing thread to the output of its
+    execution, and writes of other threads to the original sys.stdout, so executions in different threads do not mix
+    their output. The code also gets its own print, so what it prints from threads it starts is collected too. If
+    on_output is given, it is called with the output as it is written. If limits are given, the code is stopped with
+    CodeExecutionLimitExceeded once it exceeds them. If result_processor is given, the results are replaced by what it
+    returns for them, before the namespace is released.
+
+    owns_process is set when nothing else runs in this process, like in a code executor worker. Only then CPU and
+    memory limits are applied and the peak memory of the execution is measured, as both apply to the whole process,
+    and sys.stdout of all threads is captured. Otherwise only the peak memory of the whole process lifetime is
+    reported.
+    """
+    redirected_output = _ForwardingOutput(on_output)
+    namespace = {"__name__": EXECUTED_CODE_MODULE_NAME, "__builtins__": builtins,
+                 "print": _get_print(redirected_output)}
+    memory_meter = PeakMemoryMeter(reset=owns_process)
+    figure_numbers = _get_figure_numbers()
+    captured_output = redirect_stdout(redirected_output) if owns_process else _capture_thread_stdout(redirected_output)
+    start = time.perf_counter()
     try:
-        exec(assembled_code, globals(), globals())
-    except Exception as e:
-        raise e
+        compiled_code = compile(assembled_code, filename, "exec")
+        with captured_output, enforce_limits(limits, filename, owns_process):
+            exec(compiled_code, namespace)
+        results = {name: namespace[name] for name in (result_names or []) if name in namespace}
+        if result_processor is not None:
+            results = result_processor(results)
     finally:
-        sys.stdout = old_stdout
+        duration = time.perf_counter() - start
+        peak_memory_bytes = memory_meter.get_peak_bytes()
+        _release_namespace(namespace, figure_numbers)
 
     output = redirected_output.getvalue()
-    return output, globals()
+    return CodeExecutionResult(output=output, results=results, peak_memory_bytes=peak_memory_bytes,
+                               process_peak_memory_bytes=PeakMemoryMeter.get_process_peak_bytes(),
+                               duration_seconds=duration)
+
+
+def format_memory(memory_bytes: Optional[int]) -> str:
+    return "unknown" if memory_bytes is None else f"{memory_bytes / 1024 / 1024:.1f} MB"
+
+
+class PeakMemoryMeter:
+    """
+    Measures the peak resident memory of this process from the moment it is created. The peak is reset via
+    /proc/self/clear_refs and read from VmHWM, so it is only available on Linux. The reset applies to the whole process
+    and wipes the peak any other measurement is taking, so reset is only set in a process that runs nothing else.
+    """
+
+    def __init__(self, reset: bool = False):
+        self._is_reset = reset and self._reset_peak()
+
+    def get_peak_bytes(self) -> Optional[int]:
+        """Returns the peak since the meter was created, or None if it could not be reset."""
+        if not self._is_reset:
+            return None
+        peak_kb = _read_proc_status_kb("VmHWM")
+        return peak_kb * 1024 if peak_kb is not None else None
+
+    @staticmethod
+    def get_process_peak_bytes() -> Optional[int]:
+        """Returns the peak resident memory of the whole process lifetime, which clear_refs does not reset."""
+        try:
+            import resource
+        except ImportError:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # INFO: ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    @staticmethod
+    def _reset_peak() -> bool:
+        try:
+            with open("/proc/self/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+            return True
+        except OSError:
+            return False
+
+
+def get_resident_memory_bytes() -> Optional[int]:
+    """Returns the resident memory of this process, or None if it can not be read."""
+    rss_kb = _read_proc_status_kb("VmRSS")
+    return rss_kb * 1024 if rss_kb is not None else None
+
+
+class CodeOutputSender:
+    """
+    Sends output of executing code as SIGNAL_ASSEMBLED_CODE_EXECUTING signals of stream_name. Output is buffered and
+    sent in whole lines at most every flush_interval_seconds, or as soon as max_buffer_chars are buffered. close sends
+    what is left.
+    """
+
+    def __init__(self, sender: str, stream_name: str, max_buffer_chars: int = DEFAULT_OUTPUT_BUFFER_CHARS,
+                 flush_interval_seconds: float = DEFAULT_OUTPUT_FLUSH_INTERVAL_SECONDS):
+        self.sender = sender
+        self.stream_name = stream_name
+        self.max_buffer_chars = max_buffer_chars
+        self.flush_interval_seconds = flush_interval_seconds
+        self._buffer: List[str] = []
+        self._buffer_chars = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str):
+        with self._lock:
+            self._buffer.append(text)
+            self._buffer_chars += len(text)
+            if self._buffer_chars >= self.max_buffer_chars:
+                self._flush("".join(self._buffer))
+            elif "\n" in text and time.monotonic() - self._last_flush >= self.flush_interval_seconds:
+                buffered = "".join(self._buffer)
+                complete, rest = buffered.rsplit("\n", 1)
+                self._flush(complete + "\n", rest)
+
+    def close(self):
+        with self._lock:
+            if self._buffer_chars > 0:
+                self._flush("".join(self._buffer))
+
+    def _flush(self, text: str, rest: str = ""):
+        self._buffer, self._buffer_chars = ([rest], len(rest)) if rest else ([], 0)
+        self._last_flush = time.monotonic()
+        dispatcher.send(signal=SIGNAL_ASSEMBLED_CODE_EXECUTING,
+                        sender=self.sender,
+                        event_data=AgentSignal(
+                            event_source=self.sender,
+                            event_message=self.stream_name,
+                            event_data=text,
+                            event_type=EventType.CodeOutputChunk
+                        ))
+
+
+class _ForwardingOutput(StringIO):
+    """Collects written output, and passes every write on to on_output."""
+
+    def __init__(self, on_output: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self._on_output = on_output
+
+    def write(self, text: str) -> int:
+        if self._on_output is not None and text:
+            self._on_output(text)
+        return super().write(text)
+
+
+class _ThreadStdout:
+    """Sends writes of threads with a registered output there, and writes of all other threads to original."""
+
+    def __init__(self, original):
+        self.original = original
+        self.outputs: Dict[int, Any] = {}
+
+    def get_target(self):
+        return self.outputs.get(threading.get_ident(), self.original)
+
+    def write(self, text: str) -> int:
+        return self.get_target().write(text)
+
+    def flush(self):
+        self.get_target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.get_target(), name)
+
+
+_thread_stdout: Optional[_ThreadStdout] = None
+_thread_stdout_lock = threading.Lock()
+
+
+@contextmanager
+def _capture_thread_stdout(output) -> Iterator:
+    # INFO: sys.stdout is only replaced while executions run, and put back once the last running execution is done.
+    global _thread_stdout
+    thread_id = threading.get_ident()
+    with _thread_stdout_lock:
+        if _thread_stdout is None or sys.stdout is not _thread_stdout:
+            _thread_stdout = _ThreadStdout(sys.stdout)
+            sys.stdout = _thread_stdout
+        proxy = _thread_stdout
+        previous_output = proxy.outputs.get(thread_id)
+        proxy.outputs[thread_id] = output
+    try:
+        yield
+    finally:
+        with _thread_stdout_lock:
+            if previous_output is not None:
+                proxy.outputs[thread_id] = previous_output
+            else:
+                del proxy.outputs[thread_id]
+            if not proxy.outputs and sys.stdout is proxy:
+                sys.stdout = proxy.original
+                _thread_stdout = None
+
+
+def _get_print(output: StringIO) -> Callable:
+    def print_to_output(*values, sep: Optional[str] = None, end: Optional[str] = None, file=None, flush: bool = False):
+        # INFO: Printing to sys.stdout explicitly also goes to the output of the execution, also from other threads.
+        if file is None or file is sys.stdout or file is _thread_stdout:
+            file = output
+        builtins.print(*values, sep=sep, end=end, file=file, flush=flush)
+
+    return print_to_output
+
+
+def _read_proc_status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _get_figure_numbers() -> Set[int]:
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    return set(pyplot.get_fignums()) if pyplot is not None else set()
+
+
+def _release_namespace(namespace: dict, figure_numbers_before: Set[int]):
+    # INFO: Functions defined by the code reference the namespace through their globals, so it is cleared to break
+    # the cycle, and collected right away so memory of large data frames is reclaimed before the next execution.
+    # Only figures opened by the code are closed, figures of the caller or of other executions stay open.
+    namespace.clear()
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is not None:
+        for figure_number in set(pyplot.get_fignums()) - figure_numbers_before:
+            pyplot.close(figure_number)
+    gc.collect()
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 import click
 import langchain
@@ -26,11 +27,13 @@ def set_langchain_verbose(is_verbose: bool):
     langchain.verbose = is_verbose
 
 
-def get_chatbot_response(user_input: str, session_id: str, verbose: bool, storage_mode: str):
+def get_chatbot_response(user_input: str, session_id: str, verbose: bool, storage_mode: str,
+                         geo_chat_agent: Optional[GeoChatAgent] = None):
     try:
         set_langchain_verbose(verbose)
 
-        geo_chat_agent = GeoChatAgent()
+        if geo_chat_agent is None:
+            geo_chat_agent = GeoChatAgent()
         response = geo_chat_agent.invoke(agent_input=user_input, storage_mode=storage_mode, session_id=session_id)
         return response
 
@@ -63,7 +66,20 @@ def chat(session_id: str, verbose: bool, profile: str):
         os.environ["AWS_PROFILE"] = profile
         click.echo(f"Agent: Using AWS profile: {profile}")
 
+    # INFO: Name of the code stream the last chunk belonged to, a header is printed whenever the stream changes.
+    last_code_stream = {"name": None}
+
     def print_signal(sender, event_data):
+        if isinstance(event_data, AgentSignal) and \
+                event_data.event_type in (EventType.PythonCodeChunk, EventType.CodeOutputChunk):
+            if last_code_stream["name"] != event_data.event_message:
+                last_code_stream["name"] = event_data.event_message
+                click.echo(click.style(f"\n{sender}: \n{event_data.event_message}", fg="cyan"))
+            click.echo(event_data.event_data, nl=False)
+            return
+
+        last_code_stream["name"] = None
+
         # Check if event_data is instance of Exception
         if isinstance(event_data, Exception):
             exception_message = get_exception_messages(event_data)
@@ -82,6 +98,9 @@ def chat(session_id: str, verbose: bool, profile: str):
     for signal in ALL_SIGNALS:
         dispatcher.connect(receiver=print_signal, signal=signal)
 
+    # INFO: One agent serves the whole conversation, so its tools and clients are reused across turns.
+    geo_chat_agent = GeoChatAgent()
+
     while True:
         user_input = click.prompt("You", type=str)
         if user_input.lower() == 'exit':
@@ -89,7 +108,8 @@ def chat(session_id: str, verbose: bool, profile: str):
             break
 
         response = get_chatbot_response(
-            user_input=user_input, session_id=session_id, verbose=verbose, storage_mode=LOCAL_STORAGE_MODE)
+            user_input=user_input, session_id=session_id, verbose=verbose, storage_mode=LOCAL_STORAGE_MODE,
+            geo_chat_agent=geo_chat_agent)
         if response:
             click.echo(f"Agent: {response}")
 
@@ -1,25 +1,49 @@
-import boto3
 from botocore.client import BaseClient
 from botocore.config import Config
 from langchain.llms import Bedrock
+from langchain_core.caches import BaseCache
 
 import os
+from typing import Optional
 
+from geospatial_agent.shared.clients import get_client_registry
+from geospatial_agent.shared.llm_cache import get_llm_response_cache
+from geospatial_agent.shared.streaming import ENV_LLM_STREAMING
+
+
+CLAUDE_V2_MODEL_ID = "anthropic.claude-v2"
+
+
+def get_claude_v2(max_tokens_to_sample=8100, temperature=0.001, cache: Optional[BaseCache] = None,
+                  streaming: Optional[bool] = None):
+    """
+    Returns Claude V2 LLM from Bedrock. Responses are cached if a cache is given, or if LLM_CACHE_PATH environment
+    variable is set. Responses are streamed if streaming is True, or if LLM_STREAMING environment variable is true.
+    """
+    return get_bedrock_llm(model_id=CLAUDE_V2_MODEL_ID, max_tokens=max_tokens_to_sample, temperature=temperature,
+                           cache=cache, streaming=streaming)
+
+
+def get_bedrock_llm(model_id: str, max_tokens: int, temperature=0.001, cache: Optional[BaseCache] = None,
+                    streaming: Optional[bool] = None) -> Bedrock:
+    """Returns an Anthropic text completion model from Bedrock, cached and streamed the same way as get_claude_v2."""
+    if streaming is None:
+        streaming = os.environ.get(ENV_LLM_STREAMING, "").lower() in ("1", "true", "yes")
 
-def get_claude_v2(max_tokens_to_sample=8100, temperature=0.001):
     client = get_bedrock_client()
-    llm = Bedrock(model_id="anthropic.claude-v2",
+    llm = Bedrock(model_id=model_id,
                   client=client,
                   model_kwargs={
-                      "max_tokens_to_sample": max_tokens_to_sample,
+                      "max_tokens_to_sample": max_tokens,
                       "temperature": temperature
-                  })
+                  },
+                  cache=cache or get_llm_response_cache(model_id),
+                  streaming=streaming)
     return llm
 
 
 def get_bedrock_client() -> BaseClient:
-    profile = os.environ.get("AWS_PROFILE", None)
-    session = boto3.Session(profile_name=profile)
+    """Returns the process wide Bedrock runtime client of the current AWS profile."""
     cfg = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
-    client: BaseClient = session.client("bedrock-runtime", region_name="us-east-1", config=cfg)
+    client: BaseClient = get_client_registry().get_client("bedrock-runtime", region_name="us-east-1", config=cfg)
     return client
@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_MAX_SIZE_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Stores by namespace and path, shared by every cache of a namespace that is configured with the same path.
+_stores: Dict[Tuple[str, str], "PersistentLRUCache"] = {}
+_stores_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+class PersistentLRUCache:
+    """
+    A key value cache stored in a SQLite file. Entries expire after ttl_seconds, and the least recently used entries
+    are evicted once the total size of values grows over max_size_bytes. The cache is safe to share between threads
+    and processes.
+    """
+
+    def __init__(self,
+                 path: str,
+                 max_size_bytes: int = DEFAULT_CACHE_MAX_SIZE_BYTES,
+                 ttl_seconds: Optional[float] = DEFAULT_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        parent_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT value, created_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+
+            if row is not None and self._is_expired(row[1], now):
+                connection.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            connection.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+            self._evict(connection, now)
+
+    def delete(self, key: str):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM cache_entries")
+
+    def size_bytes(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size_bytes": self.size_bytes()}
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        if self.ttl_seconds is not None:
+            expired = connection.execute(
+                "DELETE FROM cache_entries WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            self.evictions += expired
+
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        # INFO: Evicting least recently used entries until the cache fits into max_size_bytes again.
+        rows = connection.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at ASC").fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+
+        connection.executemany("DELETE FROM cache_entries WHERE key = ?", evicted_keys)
+        self.evictions += len(evicted_keys)
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and created_at < now - self.ttl_seconds
+
+    def _connect(self) -> "_ClosingConnection":
+        return _ClosingConnection(self.path)
+
+
+def get_persistent_cache_from_env(env_prefix: str, namespace: str) -> Optional[PersistentLRUCache]:
+    """
+    Returns the store of namespace at the path in the <env_prefix>_PATH environment variable, or None if it is not set.
+    Its size and TTL are read from <env_prefix>_MAX_SIZE_MB and <env_prefix>_TTL_SECONDS. Stores of the same namespace
+    and path are shared, so hit and miss counters cover the whole process.
+    """
+    cache_path = os.environ.get(f"{env_prefix}_PATH")
+    if not cache_path:
+        return None
+
+    with _stores_lock:
+        if (namespace, cache_path) not in _stores:
+            max_size_mb = os.environ.get(f"{env_prefix}_MAX_SIZE_MB")
+            ttl_seconds = os.environ.get(f"{env_prefix}_TTL_SECONDS")
+            _stores[(namespace, cache_path)] = PersistentLRUCache(
+                path=cache_path,
+                max_size_bytes=int(float(max_size_mb) * 1024 * 1024) if max_size_mb else DEFAULT_CACHE_MAX_SIZE_BYTES,
+                ttl_seconds=float(ttl_seconds) if ttl_seconds else DEFAULT_CACHE_TTL_SECONDS)
+        return _stores[(namespace, cache_path)]
+
+
+class _ClosingConnection:
+    """Opens a SQLite connection that commits and closes when the with block exits."""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, timeout=30)
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self._connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self._connection.commit()
+            else:
+                self._connection.rollback()
+        finally:
+            self._connection.close()
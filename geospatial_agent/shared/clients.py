@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+import boto3
+from botocore.client import BaseClient
+from botocore.config import Config
+
+# Sized for concurrent operation code generation and summaries on top of the chat agent.
+DEFAULT_MAX_POOL_CONNECTIONS = 32
+
+T = TypeVar('T')
+
+
+class ClientRegistry:
+    """
+    Creates boto3 clients lazily, once per service, profile, region and config, and shares them across the process.
+    boto3 clients are thread safe once created, creating them is not, so creation is serialized.
+    """
+
+    def __init__(self, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+        self.max_pool_connections = max_pool_connections
+        self._sessions: Dict[Optional[str], boto3.Session] = {}
+        self._clients: Dict[Tuple[str, Optional[str], Optional[str], str], BaseClient] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, service_name: str, region_name: Optional[str] = None,
+                   config: Optional[Config] = None) -> BaseClient:
+        profile_name = os.environ.get("AWS_PROFILE", None)
+
+        with self._lock:
+            session = self._sessions.get(profile_name)
+            if session is None:
+                session = boto3.Session(profile_name=profile_name)
+                self._sessions[profile_name] = session
+
+            region_name = region_name or session.region_name
+            key = (service_name, profile_name, region_name, _get_config_key(config))
+            client = self._clients.get(key)
+            if client is None:
+                pool_config = Config(max_pool_connections=self.max_pool_connections, tcp_keepalive=True)
+                client = session.client(service_name, region_name=region_name,
+                                        config=pool_config.merge(config) if config else pool_config)
+                self._clients[key] = client
+
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+
+
+def _get_config_key(config: Optional[Config]) -> str:
+    """Returns a stable form of all options of a botocore config, so equal configs share a client."""
+    if config is None:
+        return ""
+    options = {name: getattr(config, name, None) for name in Config.OPTION_DEFAULTS}
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+class TTLValue:
+    """Caches the value returned by a loader for ttl_seconds. Each key is loaded separately."""
+
+    def __init__(self, loader: Callable[[Hashable], T], ttl_seconds: float):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[Hashable, Tuple[float, T]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> T:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        # INFO: Loading outside the lock, so a slow API call does not block readers of other keys.
+        value = self.loader(key)
+        with self._lock:
+            self._values[key] = (now + self.ttl_seconds, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+_client_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    return _client_registry
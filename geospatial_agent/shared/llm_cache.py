@@ -0,0 +1,66 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.outputs import Generation
+
+from geospatial_agent.shared.cache import PersistentLRUCache, get_persistent_cache_from_env
+
+ENV_LLM_CACHE_PREFIX = "LLM_CACHE"
+ENV_LLM_CACHE_PATH = f"{ENV_LLM_CACHE_PREFIX}_PATH"
+ENV_LLM_CACHE_MAX_SIZE_MB = f"{ENV_LLM_CACHE_PREFIX}_MAX_SIZE_MB"
+ENV_LLM_CACHE_TTL_SECONDS = f"{ENV_LLM_CACHE_PREFIX}_TTL_SECONDS"
+
+_LLM_CACHE_NAMESPACE = "llm_responses"
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain LLM cache backed by a PersistentLRUCache. Entries are content addressed by the model id, the LLM string
+    (model kwargs and stop sequences) and the rendered prompt.
+    """
+
+    def __init__(self, store: PersistentLRUCache, model_id: str):
+        self.store = store
+        self.model_id = model_id
+
+    @property
+    def hits(self) -> int:
+        return self.store.hits
+
+    @property
+    def misses(self) -> int:
+        return self.store.misses
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self.store.get(self._get_key(prompt, llm_string))
+        if value is None:
+            return None
+
+        generations = json.loads(value)
+        return [Generation(text=generation["text"], generation_info=generation.get("generation_info"))
+                for generation in generations]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        generations = [{"text": generation.text, "generation_info": generation.generation_info}
+                       for generation in return_val]
+        self.store.set(self._get_key(prompt, llm_string), json.dumps(generations).encode("utf-8"))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def _get_key(self, prompt: str, llm_string: str) -> str:
+        key_source = json.dumps([self.model_id, llm_string, prompt])
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def get_llm_response_cache(model_id: str) -> Optional[LLMResponseCache]:
+    """
+    Returns a response cache for model_id if LLM_CACHE_PATH environment variable is set. Caches of the same path
+    share one store, so hit and miss counters cover the whole process.
+    """
+    store = get_persistent_cache_from_env(ENV_LLM_CACHE_PREFIX, _LLM_CACHE_NAMESPACE)
+    if store is None:
+        return None
+    return LLMResponseCache(store=store, model_id=model_id)
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.llms.base import LLM
+from pydantic import BaseModel, Field
+
+from geospatial_agent.shared.bedrock import get_bedrock_llm
+from geospatial_agent.shared.prompts import HUMAN_STOP_SEQUENCE
+
+STAGE_TASK_NAME = "task_name"
+STAGE_ACTION_CONTEXT = "action_context"
+STAGE_FILE_READ_CODE = "file_read_code"
+STAGE_DATA_SUMMARY = "data_summary"
+STAGE_PLAN_GRAPH = "plan_graph"
+STAGE_OP_REQUIREMENTS = "op_requirements"
+STAGE_OP_CODE = "op_code"
+STAGE_CHAT = "chat"
+
+ALL_STAGES = [
+    STAGE_TASK_NAME,
+    STAGE_ACTION_CONTEXT,
+    STAGE_FILE_READ_CODE,
+    STAGE_DATA_SUMMARY,
+    STAGE_PLAN_GRAPH,
+    STAGE_OP_REQUIREMENTS,
+    STAGE_OP_CODE,
+    STAGE_CHAT,
+]
+
+# Model used by every stage unless LLM_MODEL_ID or LLM_<STAGE>_MODEL_ID says otherwise.
+ENV_LLM_MODEL_ID = "LLM_MODEL_ID"
+ENV_STAGE_MODEL_ID = "LLM_{stage}_MODEL_ID"
+ENV_STAGE_MAX_TOKENS = "LLM_{stage}_MAX_TOKENS"
+ENV_STAGE_STOP_SEQUENCES = "LLM_{stage}_STOP_SEQUENCES"
+
+DEFAULT_MODEL_ID = "anthropic.claude-v2"
+
+
+class StageLLMConfig(BaseModel):
+    model_id: str = Field(default=DEFAULT_MODEL_ID)
+    max_tokens: int = Field()
+    temperature: float = Field(default=0.001)
+    stop_sequences: List[str] = Field(default_factory=lambda: [HUMAN_STOP_SEQUENCE])
+
+
+# INFO: Output caps are sized for what each stage replies with. A task name is a single slug, requirements and action
+# context are short JSON documents, and only code generation and the chat agent need long replies.
+DEFAULT_STAGE_CONFIGS: Dict[str, StageLLMConfig] = {
+    STAGE_TASK_NAME: StageLLMConfig(max_tokens=64),
+    STAGE_ACTION_CONTEXT: StageLLMConfig(max_tokens=1024),
+    STAGE_FILE_READ_CODE: StageLLMConfig(max_tokens=4096),
+    STAGE_DATA_SUMMARY: StageLLMConfig(max_tokens=1024),
+    STAGE_PLAN_GRAPH: StageLLMConfig(max_tokens=4096),
+    STAGE_OP_REQUIREMENTS: StageLLMConfig(max_tokens=1024),
+    STAGE_OP_CODE: StageLLMConfig(max_tokens=8100),
+    # INFO: The chat agent passes its own stop sequences to the LLM.
+    STAGE_CHAT: StageLLMConfig(max_tokens=8100, stop_sequences=[]),
+}
+
+
+class StageLLMException(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def _build_bedrock_llm(config: StageLLMConfig) -> LLM:
+    return get_bedrock_llm(model_id=config.model_id, max_tokens=config.max_tokens, temperature=config.temperature)
+
+
+class StageLLMFactory:
+    """
+    Returns the LLM configured for each stage of the agent. Stages with the same model configuration share one LLM
+    instance. llm_builder creates an LLM from a StageLLMConfig, Bedrock is used by default.
+    """
+
+    def __init__(self,
+                 configs: Optional[Dict[str, StageLLMConfig]] = None,
+                 llm_builder: Callable[[StageLLMConfig], LLM] = _build_bedrock_llm):
+        self.configs = dict(DEFAULT_STAGE_CONFIGS)
+        if configs:
+            self.configs.update(configs)
+        self.llm_builder = llm_builder
+        self._llms: Dict[Tuple[str, int, float], LLM] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, llm_builder: Callable[[StageLLMConfig], LLM] = _build_bedrock_llm) -> "StageLLMFactory":
+        """Returns a factory with default stage configurations overridden by LLM_* environment variables."""
+        return cls(configs=get_stage_configs_from_env(), llm_builder=llm_builder)
+
+    @classmethod
+    def from_llm(cls, llm: LLM) -> "StageLLMFactory":
+        """Returns a factory that uses the given LLM for every stage, with the default stop sequences."""
+        return cls(llm_builder=lambda config: llm)
+
+    def get_config(self, stage: str) -> StageLLMConfig:
+        if stage not in self.configs:
+            raise StageLLMException(message=f"Unknown LLM stage {stage}. Known stages are {ALL_STAGES}")
+        return self.configs[stage]
+
+    def get_llm(self, stage: str) -> LLM:
+        config = self.get_config(stage)
+        key = (config.model_id, config.max_tokens, config.temperature)
+        with self._lock:
+            if key not in self._llms:
+                self._llms[key] = self.llm_builder(config)
+            return self._llms[key]
+
+    def get_stop_sequences(self, stage: str) -> List[str]:
+        return list(self.get_config(stage).stop_sequences)
+
+
+def get_stage_configs_from_env() -> Dict[str, StageLLMConfig]:
+    default_model_id = os.environ.get(ENV_LLM_MODEL_ID, DEFAULT_MODEL_ID)
+
+    configs = {}
+    for stage in ALL_STAGES:
+        env_stage = stage.upper()
+        config = DEFAULT_STAGE_CONFIGS[stage].model_copy()
+        config.model_id = os.environ.get(ENV_STAGE_MODEL_ID.format(stage=env_stage), default_model_id)
+
+        max_tokens = os.environ.get(ENV_STAGE_MAX_TOKENS.format(stage=env_stage))
+        if max_tokens:
+            config.max_tokens = int(max_tokens)
+
+        stop_sequences = os.environ.get(ENV_STAGE_STOP_SEQUENCES.format(stage=env_stage))
+        if stop_sequences:
+            config.stop_sequences = json.loads(stop_sequences)
+
+        configs[stage] = config
+    return configs
+
+
+_stage_llm_factory: Optional[StageLLMFactory] = None
+_stage_llm_factory_lock = threading.Lock()
+
+
+def get_stage_llm_factory() -> StageLLMFactory:
+    """Returns the process wide stage LLM factory, configured from environment variables on first use."""
+    global _stage_llm_factory
+    with _stage_llm_factory_lock:
+        if _stage_llm_factory is None:
+            _stage_llm_factory = StageLLMFactory.from_env()
+        return _stage_llm_factory
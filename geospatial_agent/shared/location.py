@@ -1,10 +1,14 @@
 import os
+from typing import Tuple
 
-import boto3
+from geospatial_agent.shared.clients import get_client_registry, TTLValue
 
 ENV_MAP_NAME = "MAP_NAME"
 ENV_PLACE_INDEX_NAME = "PLACE_INDEX_NAME"
 
+# API keys and map style URIs are looked up again after this many seconds.
+LOCATION_RESOURCE_TTL_SECONDS = 15 * 60
+
 
 class LocationConfigurationError(Exception):
     def __init__(self, message: str):
@@ -13,7 +17,8 @@ class LocationConfigurationError(Exception):
 
 
 def get_location_client():
-    return boto3.client("location")
+    """Returns the process wide Amazon Location client of the current AWS profile."""
+    return get_client_registry().get_client("location")
 
 
 def get_place_index_name():
@@ -32,6 +37,20 @@ def get_api_key() -> str:
     if not api_key_arn:
         raise LocationConfigurationError("API_KEY_NAME environment variable is not set")
 
+    return _api_keys.get(_get_profile_scoped_key(api_key_arn))
+
+
+def get_map_style_uri():
+    """Returns map style URI inside the style JSON returned by GetMapStyleDescriptor API of Amazon Location Service"""
+    map_name = os.environ.get(ENV_MAP_NAME)
+    if not map_name:
+        raise LocationConfigurationError("MAP_NAME environment variable is not set")
+
+    return _map_style_uris.get(_get_profile_scoped_key(map_name))
+
+
+def _load_api_key(profile_scoped_api_key_arn: Tuple[str, str]) -> str:
+    _, api_key_arn = profile_scoped_api_key_arn
     try:
         location = get_location_client()
         api_key = location.describe_key(KeyName=api_key_arn)
@@ -41,12 +60,8 @@ def get_api_key() -> str:
     return api_key["Key"]
 
 
-def get_map_style_uri():
-    """Returns map style URI inside the style JSON returned by GetMapStyleDescriptor API of Amazon Location Service"""
-    map_name = os.environ.get(ENV_MAP_NAME)
-    if not map_name:
-        raise LocationConfigurationError("MAP_NAME environment variable is not set")
-
+def _load_map_style_uri(profile_scoped_map_name: Tuple[str, str]) -> str:
+    _, map_name = profile_scoped_map_name
     try:
         client = get_location_client()
         op_path = f'/maps/v0/maps/{map_name}/style-descriptor'
@@ -54,3 +69,11 @@ def get_map_style_uri():
         return style_uri
     except Exception as e:
         raise LocationConfigurationError(f"Error getting map style URI") from e
+
+
+def _get_profile_scoped_key(name: str) -> Tuple[str, str]:
+    return os.environ.get("AWS_PROFILE", ""), name
+
+
+_api_keys = TTLValue(loader=_load_api_key, ttl_seconds=LOCATION_RESOURCE_TTL_SECONDS)
+_map_style_uris = TTLValue(loader=_load_map_style_uri, ttl_seconds=LOCATION_RESOURCE_TTL_SECONDS)
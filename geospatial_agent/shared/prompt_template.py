@@ -0,0 +1,89 @@
+import json
+import os
+import string
+import threading
+from datetime import datetime
+from typing import FrozenSet, List, Optional, Tuple
+
+ENV_PROMPT_TRACE_PATH = "PROMPT_TRACE_PATH"
+
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+_trace_lock = threading.Lock()
+
+# Literal text, and the variable name, conversion and format spec of the placeholder following it.
+_Part = Tuple[str, Optional[str], Optional[str], str]
+
+
+class PromptRenderException(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class CompiledPrompt:
+    """
+    A prompt template in f-string format, the format PromptTemplate.from_template uses, parsed once. Values that are
+    the same for every call can be bound with partial, so rendering only fills in the values of one call.
+    """
+
+    def __init__(self, name: str, template: str):
+        self.name = name
+        self._parts: List[_Part] = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+            if field_name is not None and not field_name.isidentifier():
+                raise ValueError(f"Prompt {name} has an unsupported placeholder {{{field_name}}}")
+            self._parts.append((literal, field_name, conversion, format_spec or ""))
+
+    @property
+    def input_variables(self) -> FrozenSet[str]:
+        return frozenset(field_name for _, field_name, _, _ in self._parts if field_name is not None)
+
+    def partial(self, **values) -> "CompiledPrompt":
+        """Returns a prompt with the given values rendered into its text."""
+        prompt = CompiledPrompt(self.name, "")
+        literal = ""
+        for part_literal, field_name, conversion, format_spec in self._parts:
+            literal += part_literal
+            if field_name is None:
+                continue
+            if field_name in values:
+                literal += _format_value(values[field_name], conversion, format_spec)
+            else:
+                prompt._parts.append((literal, field_name, conversion, format_spec))
+                literal = ""
+        prompt._parts.append((literal, None, None, ""))
+        return prompt
+
+    def render(self, **values) -> str:
+        """Returns the prompt text with values filled in. The text is recorded if PROMPT_TRACE_PATH is set."""
+        missing = self.input_variables - values.keys()
+        if missing:
+            raise PromptRenderException(f"Missing values for prompt {self.name}: {', '.join(sorted(missing))}")
+
+        pieces = []
+        for literal, field_name, conversion, format_spec in self._parts:
+            pieces.append(literal)
+            if field_name is not None:
+                pieces.append(_format_value(values[field_name], conversion, format_spec))
+        prompt = "".join(pieces)
+
+        record_prompt(self.name, prompt, os.environ.get(ENV_PROMPT_TRACE_PATH))
+        return prompt
+
+
+def record_prompt(name: str, prompt: str, trace_path: Optional[str]):
+    """Appends a rendered prompt to a JSON lines file, for tracing what was sent to the LLM."""
+    if not trace_path:
+        return
+
+    record = {"timestamp": datetime.now().isoformat(), "prompt_name": name, "prompt": prompt}
+    with _trace_lock:
+        with open(trace_path, "a") as trace_file:
+            trace_file.write(json.dumps(record) + "\n")
+
+
+def _format_value(value, conversion: Optional[str], format_spec: str) -> str:
+    if conversion:
+        value = _CONVERSIONS[conversion](value)
+    return format(value, format_spec)
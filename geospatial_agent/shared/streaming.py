@@ -0,0 +1,128 @@
+from typing import Callable, List, Optional
+
+from langchain.llms.base import LLM
+from langchain_core.outputs import Generation
+
+ENV_LLM_STREAMING = "LLM_STREAMING"
+
+_CODE_FENCE = "```"
+_CODE_LANGUAGE = "python"
+
+
+class IncrementalBlockExtractor:
+    """
+    Follows a response that arrives in chunks and finds the first fenced python code block in it, or the first xml
+    block when xml_tag is given. Matches the same block as extract_code and extract_content_xml do on the full text.
+    """
+
+    def __init__(self, xml_tag: Optional[str] = None):
+        if xml_tag:
+            self._open, self._close, self._language = f"<{xml_tag}>", f"</{xml_tag}>", ""
+        else:
+            self._open, self._close, self._language = _CODE_FENCE, _CODE_FENCE, _CODE_LANGUAGE
+
+        self.text = ""
+        self.is_complete = False
+        self._content_start: Optional[int] = None
+        self._emitted_until = 0
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk of the response. Returns the part of the block content that became known with it."""
+        if self.is_complete:
+            return ""
+
+        self.text += chunk
+        if self._content_start is None and not self._find_content_start():
+            return ""
+
+        close_idx = self.text.find(self._close, self._content_start)
+        if close_idx >= 0:
+            self.is_complete = True
+            content_end = close_idx
+        else:
+            # INFO: The end of the text may be the first characters of the closing marker, those are held back.
+            content_end = len(self.text) - self._get_partial_close_length()
+
+        if content_end <= self._emitted_until:
+            return ""
+
+        delta = self.text[self._emitted_until:content_end]
+        self._emitted_until = content_end
+        return delta
+
+    def _find_content_start(self) -> bool:
+        open_idx = self.text.find(self._open)
+        if open_idx < 0:
+            return False
+
+        content_start = open_idx + len(self._open)
+        rest = self.text[content_start:]
+        if self._language:
+            # INFO: Waiting until it is known whether the language name follows the opening fence.
+            if len(rest) < len(self._language) and self._language.startswith(rest):
+                return False
+            if rest.startswith(self._language):
+                content_start += len(self._language)
+
+        self._content_start = self._emitted_until = content_start
+        return True
+
+    def _get_partial_close_length(self) -> int:
+        searchable = self.text[self._content_start:]
+        for length in range(len(self._close) - 1, 0, -1):
+            if searchable.endswith(self._close[:length]):
+                return length
+        return 0
+
+
+def predict_block(llm: LLM,
+                  prompt: str,
+                  stop: Optional[List[str]] = None,
+                  xml_tag: Optional[str] = None,
+                  on_partial: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Returns the LLM response to a prompt that is expected to contain a python code block, or an xml block when
+    xml_tag is given. If streaming is enabled on the LLM, the response is streamed, partial block content is passed to
+    on_partial as it arrives, and reading stops as soon as the block is closed.
+    """
+    if not getattr(llm, "streaming", False):
+        return llm.predict(prompt, stop=stop)
+
+    extractor = IncrementalBlockExtractor(xml_tag=xml_tag)
+    cache = llm.cache if hasattr(llm.cache, "lookup") else None
+    block_llm_string = _get_llm_string(llm, stop, block=xml_tag or _CODE_LANGUAGE)
+
+    # INFO: A full completion cached by a non streaming call has the block too, so it is used as well. Responses read
+    # up to the end of the block are only cached under the block key, so non streaming calls never get them back.
+    cached = None
+    if cache:
+        cached = cache.lookup(prompt, block_llm_string) or cache.lookup(prompt, _get_llm_string(llm, stop))
+    if cached:
+        chunks = iter([cached[0].text])
+    else:
+        chunks = llm.stream(prompt, stop=stop)
+
+    try:
+        for chunk in chunks:
+            delta = extractor.feed(chunk)
+            if delta and on_partial:
+                on_partial(delta)
+            if extractor.is_complete:
+                break
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    if cache and not cached:
+        cache.update(prompt, block_llm_string, [Generation(text=extractor.text)])
+
+    return extractor.text
+
+
+def _get_llm_string(llm: LLM, stop: Optional[List[str]], block: Optional[str] = None) -> str:
+    # INFO: Without block, this is the LLM string LangChain uses as cache key for non streaming calls.
+    params = llm.dict()
+    params["stop"] = stop
+    if block is not None:
+        params["streamed_block"] = block
+    return str(sorted([(k, v) for k, v in params.items()]))
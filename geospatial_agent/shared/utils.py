@@ -36,6 +36,17 @@ def get_dot_graph(graph: networkx.DiGraph) -> Dot:
     return graph_dot
 
 
+def get_graph_code(graph: networkx.DiGraph) -> str:
+    """Returns networkx python code that builds graph, in the form of plan graph code."""
+    lines = ["import networkx as nx", "G = nx.DiGraph()"]
+    for node_name, attributes in graph.nodes(data=True):
+        attributes_str = "".join([f", {key}={value!r}" for key, value in attributes.items()])
+        lines.append(f"G.add_node({node_name!r}{attributes_str})")
+    for from_node, to_node in graph.edges:
+        lines.append(f"G.add_edge({from_node!r}, {to_node!r})")
+    return "\n".join(lines)
+
+
 def get_exception_messages(ex: Exception) -> str:
     msg = ""
     while ex:
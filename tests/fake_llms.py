@@ -0,0 +1,41 @@
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from langchain.llms.base import LLM
+
+
+class ConcurrencyTrackingLLM(LLM):
+    """
+    Fake LLM that answers every prompt with respond(prompt) after delay seconds. Records the prompts, and the highest
+    number of calls that were running at the same time.
+    """
+
+    respond: Callable[[str], str]
+    delay: float = 0.0
+    prompts: List[str] = []
+    in_flight: int = 0
+    max_in_flight: int = 0
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.prompts = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-concurrency-tracking"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        with self.lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(self.delay)
+
+        with self.lock:
+            self.in_flight -= 1
+
+        return self.respond(prompt)
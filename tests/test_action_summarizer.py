@@ -1,12 +1,37 @@
+import re
+from typing import Callable
+
 import pandas
 import pytest
 from assertpy import assert_that
 from langchain.llms import FakeListLLM
 from pydantic import ValidationError
+from pydispatch import dispatcher
 
 from geospatial_agent.agent.action_summarizer.action_summarizer \
-    import ActionContext, ActionSummarizer, FileSummary
+    import ActionContext, ActionSummarizer, FileSummary, ActionSummarizerException, _sample_file_summaries
 from geospatial_agent.agent.action_summarizer.prompts import DATA_FRAMES_VARIABLE_NAME
+from geospatial_agent.agent.code_executor import SubprocessCodeExecutorPool
+from geospatial_agent.agent.shared import SIGNAL_FILE_SUMMARY_FAILED
+from tests.fake_llms import ConcurrencyTrackingLLM
+
+
+def _summarize_by_first_column(prompt: str) -> str:
+    column = re.search(r"The table has following columns:\n\['(\w+)'", prompt).group(1)
+    if column == "broken":
+        raise RuntimeError("Bedrock is not available")
+    return f"Summary of {column}"
+
+
+class FakeSummaryLLM(ConcurrencyTrackingLLM):
+    """Fake LLM that summarizes a table by its first column name. Tables with a column named broken fail."""
+
+    respond: Callable[[str], str] = _summarize_by_first_column
+
+
+def _get_file_summary(column: str) -> FileSummary:
+    return FileSummary(file_url=f"agent://{column}.csv", data_frame=pandas.DataFrame({column: [1, 2]}),
+                       column_names=[column])
 
 
 def test_initializing_action_summarizer_does_not_raise_exception():
@@ -121,6 +146,46 @@ def test_code():
     assert_that(file_summaries[0].column_names).is_equal_to(expected_file_summaries[0].column_names)
 
 
+def test_file_summaries_from_executing_code_keep_sample_and_profile_instead_of_whole_data_frame():
+    code = f"""
+import pandas
+
+{DATA_FRAMES_VARIABLE_NAME} = [{{
+    "file_url": "agent://data.csv",
+    "data_frame": pandas.DataFrame({{"a": range(1000)}}),
+    "column_names": ["a"]
+}}]
+    """
+
+    file_summaries = ActionSummarizer._gen_file_summaries_from_executing_code(code=code)
+
+    assert_that(file_summaries[0].data_frame).is_length(3)
+    assert_that(file_summaries[0].profile.row_count).is_equal_to(1000)
+
+
+def test_file_summaries_are_sampled_in_the_worker_that_executes_the_code():
+    code = f"""
+import pandas
+
+{DATA_FRAMES_VARIABLE_NAME} = [{{
+    "file_url": "agent://data.csv",
+    "data_frame": pandas.DataFrame({{"a": range(1000)}}),
+    "column_names": ["a"]
+}}]
+    """
+    pool = SubprocessCodeExecutorPool(workers=1, warm_imports=[])
+    try:
+        execution_result = pool.execute(code, result_names=[DATA_FRAMES_VARIABLE_NAME],
+                                        result_processor=_sample_file_summaries)
+    finally:
+        pool.shutdown()
+
+    file_summary = execution_result.results[DATA_FRAMES_VARIABLE_NAME][0]
+    assert_that(file_summary).is_instance_of(FileSummary)
+    assert_that(file_summary.data_frame).is_length(3)
+    assert_that(file_summary.profile.row_count).is_equal_to(1000)
+
+
 def test_invoking_action_summarizer_does_not_raise_exception():
     user_input = "Build me a heatmap. I have uploaded data.csv"
     session_id = "session_id"
@@ -149,3 +214,36 @@ def test_code():
     action_summarizer = ActionSummarizer(llm=fake_llm)
     action_summary = action_summarizer.invoke(user_input=user_input, session_id=session_id,
                                               storage_mode='test_storage_mode')
+
+
+def test_file_summaries_are_generated_concurrently_in_order():
+    fake_llm = FakeSummaryLLM(delay=0.05)
+    action_summarizer = ActionSummarizer(llm=fake_llm, max_workers=3)
+    columns = ["a", "b", "c", "d", "e"]
+
+    file_summaries = action_summarizer._gen_file_summaries_for_action(
+        "Draw a heatmap", [_get_file_summary(column) for column in columns])
+
+    assert_that([item.file_summary for item in file_summaries]) \
+        .is_equal_to([f"Summary of {column}" for column in columns])
+    assert_that(fake_llm.max_in_flight).is_equal_to(3)
+
+
+def test_file_summary_failures_are_reported_per_file():
+    failed_files = []
+
+    def receiver(sender, event_data):
+        failed_files.append(event_data.event_message)
+
+    dispatcher.connect(receiver=receiver, signal=SIGNAL_FILE_SUMMARY_FAILED)
+    action_summarizer = ActionSummarizer(llm=FakeSummaryLLM())
+    try:
+        with pytest.raises(ActionSummarizerException) as exc_info:
+            action_summarizer._gen_file_summaries_for_action(
+                "Draw a heatmap", [_get_file_summary(column) for column in ["a", "broken", "c"]])
+    finally:
+        dispatcher.disconnect(receiver=receiver, signal=SIGNAL_FILE_SUMMARY_FAILED)
+
+    assert_that(exc_info.value.message).contains("1 of 3 files", "agent://broken.csv")
+    assert_that(failed_files).is_length(1)
+    assert_that(failed_files[0]).contains("agent://broken.csv")
@@ -33,3 +33,25 @@ def test_invoking_geo_chat_agent_does_not_raise_exception(mocker):
         agent_input="test input", session_id="test_session_id", storage_mode="test_storage_mode")
 
     assert_that(output).is_equal_to("The agent has finished running!")
+
+
+def test_invoking_geo_chat_agent_reuses_tools_and_executor_across_turns(mocker):
+    geocode_tool_mock = mocker.patch(
+        f'{GeoChatAgent.__module__}.geocode_tool',
+        return_value=Tool.from_function(func=lambda q: "geocoded response", name=GEOCODE_TOOL,
+                                        description="test description"))
+    gis_work_tool_mock = mocker.patch(
+        f'{GeoChatAgent.__module__}.gis_work_tool',
+        return_value=Tool.from_function(func=lambda q: "gis work complete", name=GIS_WORK_TOOL,
+                                        description="test description"))
+    mocker.patch(f'{GeoChatAgent.__module__}.AgentExecutor.run', return_value="The agent has finished running!")
+
+    geo_chat_agent = GeoChatAgent()
+    for _ in range(3):
+        geo_chat_agent.invoke(agent_input="test input", session_id="test_session_id", storage_mode="test_storage_mode")
+
+    assert_that(geocode_tool_mock.call_count).is_equal_to(1)
+    assert_that(gis_work_tool_mock.call_count).is_equal_to(1)
+
+    geo_chat_agent.invoke(agent_input="test input", session_id="other_session_id", storage_mode="test_storage_mode")
+    assert_that(gis_work_tool_mock.call_count).is_equal_to(2)
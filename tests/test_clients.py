@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from assertpy import assert_that
+from botocore.config import Config
+from botocore.stub import Stubber
+
+from geospatial_agent.shared import location
+from geospatial_agent.shared.bedrock import get_bedrock_client
+from geospatial_agent.shared.clients import ClientRegistry, TTLValue
+from geospatial_agent.shared.location import get_location_client, get_api_key
+
+test_api_key_name = 'test_api_key_name'
+
+
+def test_client_registry_creates_one_client_per_service_and_region():
+    registry = ClientRegistry()
+
+    first = registry.get_client("location", region_name="us-east-1")
+    second = registry.get_client("location", region_name="us-east-1")
+    other_region = registry.get_client("location", region_name="us-west-2")
+
+    assert_that(first).is_same_as(second)
+    assert_that(other_region).is_not_same_as(first)
+
+
+def test_client_registry_creates_one_client_per_config():
+    registry = ClientRegistry()
+
+    default = registry.get_client("location", region_name="us-east-1")
+    retrying = registry.get_client("location", region_name="us-east-1",
+                                   config=Config(retries={"max_attempts": 3, "mode": "standard"}))
+    same_retrying = registry.get_client("location", region_name="us-east-1",
+                                        config=Config(retries={"mode": "standard", "max_attempts": 3}))
+    timing_out = registry.get_client("location", region_name="us-east-1", config=Config(read_timeout=5))
+
+    assert_that(retrying).is_not_same_as(default)
+    assert_that(same_retrying).is_same_as(retrying)
+    assert_that(timing_out).is_not_same_as(retrying)
+    assert_that(timing_out.meta.config.read_timeout).is_equal_to(5)
+    assert_that(default.meta.config.read_timeout).is_not_equal_to(5)
+
+
+def test_client_registry_shares_client_between_threads():
+    registry = ClientRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: registry.get_client("location", region_name="us-east-1"), range(16)))
+
+    assert_that({id(client) for client in clients}).is_length(1)
+
+
+def test_client_registry_uses_connection_pool_size():
+    registry = ClientRegistry(max_pool_connections=7)
+
+    client = registry.get_client("location", region_name="us-east-1")
+
+    assert_that(client.meta.config.max_pool_connections).is_equal_to(7)
+
+
+def test_bedrock_and_location_clients_are_reused_across_calls(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    assert_that(get_bedrock_client()).is_same_as(get_bedrock_client())
+    assert_that(get_location_client()).is_same_as(get_location_client())
+
+
+def test_ttl_value_loads_each_key_once_until_expired():
+    loaded_keys = []
+    ttl_value = TTLValue(loader=lambda key: loaded_keys.append(key) or f"value of {key}", ttl_seconds=60)
+
+    assert_that(ttl_value.get("key")).is_equal_to("value of key")
+    assert_that(ttl_value.get("key")).is_equal_to("value of key")
+    assert_that(loaded_keys).is_equal_to(["key"])
+
+    ttl_value.ttl_seconds = -1
+    ttl_value.clear()
+    ttl_value.get("key")
+    ttl_value.get("key")
+    assert_that(loaded_keys).is_equal_to(["key", "key", "key"])
+
+
+def test_api_key_is_described_once_within_ttl(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("API_KEY_NAME", test_api_key_name)
+    location._api_keys.clear()
+
+    stubber = Stubber(get_location_client())
+    stubber.add_response('describe_key', {
+        'Key': 'test-key-value',
+        'KeyArn': 'arn:aws:geo:us-east-1:123456789012:api-key/test',
+        'KeyName': test_api_key_name,
+        'Restrictions': {'AllowActions': ['geo:GetMap*'], 'AllowResources': ['*']},
+        'CreateTime': '2023-01-01T00:00:00Z',
+        'ExpireTime': '2024-01-01T00:00:00Z',
+        'UpdateTime': '2023-01-01T00:00:00Z',
+    }, {'KeyName': test_api_key_name})
+    stubber.activate()
+
+    first = get_api_key()
+    second = get_api_key()
+
+    stubber.assert_no_pending_responses()
+    stubber.deactivate()
+    location._api_keys.clear()
+
+    assert_that(first).is_equal_to('test-key-value')
+    assert_that(second).is_equal_to('test-key-value')
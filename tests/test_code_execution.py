@@ -0,0 +1,195 @@
+import os
+import sys
+import threading
+
+import pytest
+from assertpy import assert_that
+from pydispatch import dispatcher
+
+from geospatial_agent.agent import shared
+from geospatial_agent.agent.shared import execute_assembled_code, format_memory, CodeOutputSender, EventType, \
+    SIGNAL_ASSEMBLED_CODE_EXECUTING
+
+
+def test_executed_code_output_and_requested_results_are_returned():
+    result = execute_assembled_code("import networkx\nG = networkx.DiGraph()\nG.add_node('a')\nprint('done')",
+                                    result_names=["G", "missing"])
+
+    assert_that(result.output).is_equal_to("done\n")
+    assert_that(result.results).contains_only("G")
+    assert_that(list(result.results["G"].nodes)).is_equal_to(["a"])
+    assert_that(result.duration_seconds).is_greater_than_or_equal_to(0)
+
+
+def test_executions_do_not_share_or_leak_names():
+    execute_assembled_code("leaked_value = 42")
+
+    assert_that(vars(shared)).does_not_contain_key("leaked_value")
+    with pytest.raises(NameError):
+        execute_assembled_code("print(leaked_value)")
+
+
+def test_objects_created_by_executed_code_are_released():
+    execute_assembled_code("""
+import weakref
+from tests import test_code_execution
+
+class Data:
+    pass
+
+def read():
+    return data
+
+data = Data()
+test_code_execution.references.append(weakref.ref(data))
+""")
+
+    assert_that(references[-1]()).is_none()
+
+
+def test_main_guard_of_executed_code_does_not_run():
+    result = execute_assembled_code("if __name__ == '__main__':\n    print('main')")
+
+    assert_that(result.output).is_empty()
+
+
+def test_matplotlib_figures_opened_by_executed_code_are_closed_after_execution():
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    pyplot = pytest.importorskip("matplotlib.pyplot")
+    callers_figure = pyplot.figure()
+
+    try:
+        execute_assembled_code("import matplotlib.pyplot as plt\nplt.figure()\nplt.figure()")
+
+        assert_that(pyplot.get_fignums()).is_equal_to([callers_figure.number])
+    finally:
+        pyplot.close(callers_figure)
+
+
+def test_only_process_peak_memory_is_reported_for_executions_sharing_the_process():
+    result = execute_assembled_code("data = bytearray(64 * 1024 * 1024)")
+
+    assert_that(result.peak_memory_bytes).is_none()
+    assert_that(result.process_peak_memory_bytes).is_greater_than(64 * 1024 * 1024)
+    assert_that(format_memory(result.process_peak_memory_bytes)).ends_with(" MB")
+    assert_that(format_memory(None)).is_equal_to("unknown")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="Peak memory is reset via /proc")
+def test_peak_memory_of_execution_is_reported_when_it_owns_the_process():
+    result = execute_assembled_code("data = bytearray(64 * 1024 * 1024)", owns_process=True)
+
+    assert_that(result.peak_memory_bytes).is_greater_than(64 * 1024 * 1024)
+
+
+def test_concurrent_executions_do_not_mix_their_output():
+    outputs = {}
+    code = "from tests.test_code_execution import barrier\nfor i in range(20):\n    barrier.wait(5)\n    print('{}', i)"
+
+    def run(name: str):
+        outputs[name] = execute_assembled_code(code.format(name)).output
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ["first", "second"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name in ["first", "second"]:
+        assert_that(outputs[name].splitlines()).is_equal_to([f"{name} {i}" for i in range(20)])
+
+
+def test_output_of_other_threads_is_not_collected(capsys):
+    executing, printed = threading.Event(), threading.Event()
+    events[:] = [executing, printed]
+    results = []
+    code = "from tests.test_code_execution import events\nprint('inside')\nevents[0].set()\nevents[1].wait(5)"
+
+    execution = threading.Thread(target=lambda: results.append(execute_assembled_code(code)))
+    execution.start()
+    executing.wait(5)
+    print("outside")
+    printed.set()
+    execution.join()
+
+    assert_that(results[0].output).is_equal_to("inside\n")
+    assert_that(capsys.readouterr().out).is_equal_to("outside\n")
+
+
+def test_output_printed_from_threads_started_by_executed_code_is_collected():
+    stdout = sys.stdout
+    chunks = []
+    code = """import sys
+import threading
+
+def report(name):
+    print('from', name)
+    print('explicitly to stdout', file=sys.stdout)
+
+thread = threading.Thread(target=report, args=('thread',))
+thread.start()
+thread.join()
+"""
+
+    result = execute_assembled_code(code, on_output=chunks.append)
+
+    assert_that(result.output).is_equal_to("from thread\nexplicitly to stdout\n")
+    assert_that("".join(chunks)).is_equal_to(result.output)
+    assert_that(sys.stdout).is_same_as(stdout)
+
+
+def test_sys_stdout_is_captured_when_execution_owns_the_process():
+    stdout = sys.stdout
+
+    result = execute_assembled_code("import sys\nsys.stdout.write('written')", owns_process=True)
+
+    assert_that(result.output).is_equal_to("written")
+    assert_that(sys.stdout).is_same_as(stdout)
+
+
+def test_sys_stdout_of_executing_thread_is_captured():
+    stdout = sys.stdout
+    code = """import sys
+import pandas as pd
+
+sys.stdout.write('written\\n')
+pd.DataFrame({'price': [1, 2]}).info()
+"""
+
+    result = execute_assembled_code(code)
+
+    assert_that(result.output).starts_with("written\n<class 'pandas.core.frame.DataFrame'>")
+    assert_that(result.output).contains("price")
+    assert_that(sys.stdout).is_same_as(stdout)
+
+
+def test_code_output_is_sent_in_buffered_lines():
+    received = []
+
+    def receiver(sender, event_data):
+        received.append(event_data)
+
+    dispatcher.connect(receiver=receiver, signal=SIGNAL_ASSEMBLED_CODE_EXECUTING)
+    try:
+        output_sender = CodeOutputSender("test_sender", "Output of test", max_buffer_chars=20,
+                                         flush_interval_seconds=60)
+        output_sender("first")
+        output_sender(" line\n")
+        output_sender("partial")
+        assert_that(received).is_empty()
+
+        output_sender(" line that is too long\n")
+        output_sender("rest")
+        output_sender.close()
+    finally:
+        dispatcher.disconnect(receiver=receiver, signal=SIGNAL_ASSEMBLED_CODE_EXECUTING)
+
+    assert_that([signal.event_data for signal in received]).is_equal_to(
+        ["first line\npartial line that is too long\n", "rest"])
+    assert_that(received[0].event_message).is_equal_to("Output of test")
+    assert_that(received[0].event_type).is_equal_to(EventType.CodeOutputChunk)
+
+references = []
+barrier = threading.Barrier(2)
+events = []
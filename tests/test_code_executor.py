@@ -0,0 +1,61 @@
+import pytest
+from assertpy import assert_that
+
+from geospatial_agent.agent.code_executor import SubprocessCodeExecutorPool, CodeExecutorException, \
+    InProcessCodeExecutor
+
+
+@pytest.fixture
+def pool():
+    pool = SubprocessCodeExecutorPool(workers=1, max_jobs_per_worker=2, warm_imports=["networkx"])
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_returns_output_and_requested_results(pool):
+    result = pool.execute("import networkx\nG = networkx.DiGraph()\nG.add_edge('a', 'b')\nprint('built')",
+                          result_names=["G"])
+
+    assert_that(result.output).is_equal_to("built\n")
+    assert_that(list(result.results["G"].edges)).is_equal_to([("a", "b")])
+    assert_that(result.peak_memory_bytes).is_positive()
+
+
+def test_pool_streams_output_while_code_runs(pool):
+    chunks = []
+
+    pool.execute("print('first')\nprint('second')", on_output=chunks.append)
+
+    assert_that("".join(chunks)).is_equal_to("first\nsecond\n")
+
+
+def test_pool_raises_exception_with_traceback_of_failed_code(pool):
+    with pytest.raises(CodeExecutorException) as e:
+        pool.execute("def read():\n    raise ValueError('broken file')\nread()", filename="assembled_code.py")
+
+    assert_that(e.value.message).starts_with("ValueError: broken file")
+    assert_that(e.value.message).contains('File "assembled_code.py", line 2, in read')
+
+
+def test_pool_recycles_workers_after_max_jobs(pool):
+    pids = [pool.execute("import os\nprint(os.getpid())").output for _ in range(4)]
+
+    assert_that(pids[0]).is_equal_to(pids[1])
+    assert_that(pids[2]).is_not_equal_to(pids[1])
+    assert_that(pool.recycled_workers).is_equal_to(2)
+
+
+def test_pool_replaces_crashed_worker(pool):
+    with pytest.raises(CodeExecutorException) as e:
+        pool.execute("import os\nos._exit(3)")
+
+    assert_that(e.value.message).contains("exited with code 3")
+    assert_that(pool.execute("print('still working')").output).is_equal_to("still working\n")
+
+
+def test_in_process_executor_runs_code_in_fresh_namespace():
+    executor = InProcessCodeExecutor()
+
+    result = executor.execute("value = 42", result_names=["value"])
+
+    assert_that(result.results).is_equal_to({"value": 42})
@@ -0,0 +1,75 @@
+import pytest
+from assertpy import assert_that
+
+from geospatial_agent.agent.code_executor import SubprocessCodeExecutorPool
+from geospatial_agent.agent.execution_limits import ExecutionLimits, CodeExecutionLimitExceeded, LIMIT_WALL_CLOCK, \
+    LIMIT_CPU, LIMIT_MEMORY
+from geospatial_agent.agent.shared import execute_assembled_code
+
+_SPINNING_CODE = """
+def spin():
+    while True:
+        pass
+
+spin()
+"""
+
+
+@pytest.fixture
+def pool():
+    pool = SubprocessCodeExecutorPool(workers=1, warm_imports=[], kill_grace_seconds=0.5)
+    yield pool
+    pool.shutdown()
+
+
+def test_wall_clock_limit_stops_code_and_names_running_operation():
+    with pytest.raises(CodeExecutionLimitExceeded) as e:
+        execute_assembled_code(_SPINNING_CODE, limits=ExecutionLimits(wall_clock_seconds=0.2))
+
+    assert_that(e.value.limit).is_equal_to(LIMIT_WALL_CLOCK)
+    assert_that(e.value.operation).is_equal_to("spin")
+    assert_that(e.value.line_number).is_equal_to(3)
+    assert_that(e.value.message).contains("wall_clock limit of 0.2 seconds exceeded while running spin at line 3")
+
+
+def test_wall_clock_limit_can_not_be_caught_by_executed_code():
+    code = "import time\ntry:\n    time.sleep(5)\nexcept Exception:\n    pass\nprint('done')"
+
+    with pytest.raises(CodeExecutionLimitExceeded):
+        execute_assembled_code(code, limits=ExecutionLimits(wall_clock_seconds=0.2))
+
+
+def test_code_within_limits_runs_normally():
+    result = execute_assembled_code("value = sum(range(10))", result_names=["value"],
+                                    limits=ExecutionLimits(wall_clock_seconds=5))
+
+    assert_that(result.results["value"]).is_equal_to(45)
+
+
+def test_cpu_limit_stops_code_in_worker(pool):
+    with pytest.raises(CodeExecutionLimitExceeded) as e:
+        pool.execute(_SPINNING_CODE, limits=ExecutionLimits(cpu_seconds=1))
+
+    assert_that(e.value.limit).is_equal_to(LIMIT_CPU)
+    assert_that(e.value.operation).is_equal_to("spin")
+    assert_that(pool.execute("print('next job')").output).is_equal_to("next job\n")
+
+
+def test_memory_limit_stops_code_in_worker(pool):
+    with pytest.raises(CodeExecutionLimitExceeded) as e:
+        pool.execute("data = bytearray(2 * 1024 * 1024 * 1024)", limits=ExecutionLimits(memory_mb=100))
+
+    assert_that(e.value.limit).is_equal_to(LIMIT_MEMORY)
+    assert_that(e.value.operation).is_equal_to("top level code")
+    assert_that(pool.execute("data = bytearray(200 * 1024 * 1024)").output).is_empty()
+
+
+def test_worker_ignoring_limits_is_killed(pool):
+    code = "import signal\nsignal.signal(signal.SIGALRM, signal.SIG_IGN)\nwhile True:\n    pass"
+
+    with pytest.raises(CodeExecutionLimitExceeded) as e:
+        pool.execute(code, limits=ExecutionLimits(wall_clock_seconds=0.2))
+
+    assert_that(e.value.limit).is_equal_to(LIMIT_WALL_CLOCK)
+    assert_that(pool.recycled_workers).is_equal_to(1)
+    assert_that(pool.execute("print('next job')").output).is_equal_to("next job\n")
@@ -0,0 +1,101 @@
+from assertpy import assert_that
+from langchain.llms import FakeListLLM
+
+from geospatial_agent.shared.bedrock import get_claude_v2, CLAUDE_V2_MODEL_ID
+from geospatial_agent.shared.cache import PersistentLRUCache, get_persistent_cache_from_env
+from geospatial_agent.shared.llm_cache import LLMResponseCache, ENV_LLM_CACHE_PATH, get_llm_response_cache
+
+
+def test_persistent_cache_returns_stored_values_and_counts_hits_and_misses(tmp_path):
+    cache = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"))
+
+    assert_that(cache.get("key")).is_none()
+    cache.set("key", b"value")
+
+    assert_that(cache.get("key")).is_equal_to(b"value")
+    assert_that(cache.hits).is_equal_to(1)
+    assert_that(cache.misses).is_equal_to(1)
+
+
+def test_persistent_cache_survives_reopening(tmp_path):
+    PersistentLRUCache(path=str(tmp_path / "cache.sqlite")).set("key", b"value")
+
+    cache = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"))
+    assert_that(cache.get("key")).is_equal_to(b"value")
+
+
+def test_persistent_cache_evicts_least_recently_used_entries_over_max_size(tmp_path):
+    cache = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"), max_size_bytes=10)
+    cache.set("first", b"12345")
+    cache.set("second", b"12345")
+    cache.get("first")
+
+    cache.set("third", b"12345")
+
+    assert_that(cache.get("second")).is_none()
+    assert_that(cache.get("first")).is_equal_to(b"12345")
+    assert_that(cache.get("third")).is_equal_to(b"12345")
+    assert_that(cache.evictions).is_equal_to(1)
+
+
+def test_persistent_cache_expires_entries_after_ttl(tmp_path):
+    cache = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=-1)
+    cache.set("key", b"value")
+
+    assert_that(cache.get("key")).is_none()
+
+
+def test_persistent_cache_from_env_is_configured_by_prefix_and_shared_per_namespace(monkeypatch, tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+    monkeypatch.delenv("TEST_CACHE_PATH", raising=False)
+    assert_that(get_persistent_cache_from_env("TEST_CACHE", "first")).is_none()
+
+    monkeypatch.setenv("TEST_CACHE_PATH", cache_path)
+    monkeypatch.setenv("TEST_CACHE_MAX_SIZE_MB", "1")
+    monkeypatch.setenv("TEST_CACHE_TTL_SECONDS", "60")
+    first = get_persistent_cache_from_env("TEST_CACHE", "first")
+
+    assert_that(first.path).is_equal_to(cache_path)
+    assert_that(first.max_size_bytes).is_equal_to(1024 * 1024)
+    assert_that(first.ttl_seconds).is_equal_to(60)
+    assert_that(get_persistent_cache_from_env("TEST_CACHE", "first")).is_same_as(first)
+    assert_that(get_persistent_cache_from_env("TEST_CACHE", "second")).is_not_same_as(first)
+
+
+def test_llm_with_response_cache_does_not_call_model_for_identical_prompt(tmp_path):
+    store = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"))
+    llm = FakeListLLM(responses=["first response", "second response"],
+                      cache=LLMResponseCache(store=store, model_id="test-model"))
+
+    first = llm.predict("prompt", stop=["\n\nHuman"])
+    second = llm.predict("prompt", stop=["\n\nHuman"])
+
+    assert_that(first).is_equal_to("first response")
+    assert_that(second).is_equal_to("first response")
+    assert_that(store.hits).is_equal_to(1)
+
+
+def test_llm_response_cache_keys_include_stop_sequences_and_model_id(tmp_path):
+    store = PersistentLRUCache(path=str(tmp_path / "cache.sqlite"))
+    llm = FakeListLLM(responses=["first response", "second response", "third response"],
+                      cache=LLMResponseCache(store=store, model_id="test-model"))
+    other_model_llm = FakeListLLM(responses=["first response", "second response", "third response"],
+                                  cache=LLMResponseCache(store=store, model_id="other-model"))
+
+    llm.predict("prompt", stop=["\n\nHuman"])
+    with_other_stop = llm.predict("prompt", stop=["</json>"])
+    other_model_llm.predict("prompt", stop=["\n\nHuman"])
+
+    assert_that(with_other_stop).is_equal_to("second response")
+    assert_that(store.hits).is_equal_to(0)
+    assert_that(store.misses).is_equal_to(3)
+
+
+def test_claude_v2_is_not_cached_unless_cache_path_is_set(monkeypatch, tmp_path):
+    monkeypatch.delenv(ENV_LLM_CACHE_PATH, raising=False)
+    assert_that(get_claude_v2().cache).is_none()
+
+    monkeypatch.setenv(ENV_LLM_CACHE_PATH, str(tmp_path / "cache.sqlite"))
+    llm = get_claude_v2()
+    assert_that(llm.cache).is_instance_of(LLMResponseCache)
+    assert_that(llm.cache.store).is_same_as(get_llm_response_cache(CLAUDE_V2_MODEL_ID).store)
@@ -0,0 +1,121 @@
+from typing import Any, List, Optional
+
+import pytest
+from assertpy import assert_that
+
+from geospatial_agent.agent.action_summarizer.action_summarizer import ActionContext, ActionSummarizer
+from geospatial_agent.agent.geospatial.planner.planner import gen_task_name
+from geospatial_agent.agent.geospatial.solver.solver import Solver, REQUIREMENT_SELECTOR_LLM
+from geospatial_agent.shared.llm_stages import StageLLMFactory, StageLLMConfig, StageLLMException, \
+    STAGE_ACTION_CONTEXT, STAGE_OP_CODE, STAGE_OP_REQUIREMENTS, STAGE_TASK_NAME, STAGE_PLAN_GRAPH, \
+    get_stage_configs_from_env, DEFAULT_STAGE_CONFIGS
+from tests.test_solver import FakeOperationLLM, _get_wide_graph
+
+
+class RecordingStageLLM(FakeOperationLLM):
+    """Fake LLM built from a stage configuration. Records the stop sequences of every call."""
+
+    config: Any = None
+    response: Optional[str] = None
+    stops: List[Optional[List[str]]] = []
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        self.stops.append(stop)
+        if self.response is not None:
+            self.prompts.append(prompt)
+            return self.response
+        return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class RecordingLLMBuilder:
+    def __init__(self, response: Optional[str] = None):
+        self.response = response
+        self.llms: List[RecordingStageLLM] = []
+
+    def __call__(self, config: StageLLMConfig) -> RecordingStageLLM:
+        llm = RecordingStageLLM(config=config, response=self.response, stops=[])
+        self.llms.append(llm)
+        return llm
+
+
+def _get_routed_factory(builder: RecordingLLMBuilder) -> StageLLMFactory:
+    return StageLLMFactory(configs={
+        STAGE_TASK_NAME: StageLLMConfig(model_id="fast-model", max_tokens=32, stop_sequences=["\n"]),
+        STAGE_ACTION_CONTEXT: StageLLMConfig(model_id="fast-model", max_tokens=512),
+        STAGE_OP_REQUIREMENTS: StageLLMConfig(model_id="fast-model", max_tokens=512),
+        STAGE_OP_CODE: StageLLMConfig(model_id="large-model", max_tokens=8000),
+    }, llm_builder=builder)
+
+
+def test_stages_with_the_same_configuration_share_an_llm():
+    builder = RecordingLLMBuilder()
+    factory = _get_routed_factory(builder)
+
+    assert_that(factory.get_llm(STAGE_ACTION_CONTEXT)).is_same_as(factory.get_llm(STAGE_OP_REQUIREMENTS))
+    assert_that(factory.get_llm(STAGE_OP_CODE)).is_not_same_as(factory.get_llm(STAGE_OP_REQUIREMENTS))
+    assert_that(builder.llms).is_length(2)
+
+
+def test_getting_an_unknown_stage_raises_exception():
+    factory = StageLLMFactory(llm_builder=RecordingLLMBuilder())
+
+    with pytest.raises(StageLLMException):
+        factory.get_llm("unknown_stage")
+
+
+def test_stage_configs_are_read_from_environment(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_ID", "default-model")
+    monkeypatch.setenv("LLM_TASK_NAME_MODEL_ID", "fast-model")
+    monkeypatch.setenv("LLM_TASK_NAME_MAX_TOKENS", "16")
+    monkeypatch.setenv("LLM_TASK_NAME_STOP_SEQUENCES", '["\\n"]')
+
+    configs = get_stage_configs_from_env()
+
+    assert_that(configs[STAGE_TASK_NAME].model_id).is_equal_to("fast-model")
+    assert_that(configs[STAGE_TASK_NAME].max_tokens).is_equal_to(16)
+    assert_that(configs[STAGE_TASK_NAME].stop_sequences).is_equal_to(["\n"])
+    assert_that(configs[STAGE_PLAN_GRAPH].model_id).is_equal_to("default-model")
+    assert_that(configs[STAGE_PLAN_GRAPH].max_tokens).is_equal_to(DEFAULT_STAGE_CONFIGS[STAGE_PLAN_GRAPH].max_tokens)
+
+
+def test_task_name_stage_uses_its_llm_and_stop_sequences():
+    builder = RecordingLLMBuilder(response="draw_heatmap")
+    factory = _get_routed_factory(builder)
+
+    task_name = gen_task_name(factory.get_llm(STAGE_TASK_NAME), "Draw a heatmap",
+                              stop_sequences=factory.get_stop_sequences(STAGE_TASK_NAME))
+
+    assert_that(task_name).ends_with("_draw_heatmap")
+    llm = builder.llms[0]
+    assert_that(llm.config.max_tokens).is_equal_to(32)
+    assert_that(llm.stops).is_equal_to([["\n"]])
+
+
+def test_action_summarizer_routes_action_context_to_its_stage_llm():
+    builder = RecordingLLMBuilder(response=ActionContext(action="Draw", file_paths=["agent://data.csv"]).json())
+    factory = _get_routed_factory(builder)
+    action_summarizer = ActionSummarizer(llm_factory=factory)
+
+    action_summarizer._extract_action_context(user_input="Draw a heatmap of data.csv")
+
+    assert_that(builder.llms).is_length(1)
+    assert_that(builder.llms[0].config.model_id).is_equal_to("fast-model")
+    assert_that(builder.llms[0].config.max_tokens).is_equal_to(512)
+
+
+def test_solver_routes_requirements_and_code_to_their_stage_llms():
+    builder = RecordingLLMBuilder()
+    factory = _get_routed_factory(builder)
+    solver = Solver(llm=None, graph=_get_wide_graph(), graph_code="", session_id="test_session_id",
+                    storage_mode="test_storage_mode", task_definition="test task", task_name="test_task_name",
+                    data_locations_instructions="", requirement_selector=REQUIREMENT_SELECTOR_LLM,
+                    llm_factory=factory)
+
+    solver.solve()
+
+    llms_by_model = {llm.config.model_id: llm for llm in builder.llms}
+    requirement_prompts = llms_by_model["fast-model"].prompts
+    code_prompts = llms_by_model["large-model"].prompts
+    assert_that(requirement_prompts).is_length(5)
+    assert_that(code_prompts).is_length(5)
+    assert_that(requirement_prompts).is_not_equal_to(code_prompts)
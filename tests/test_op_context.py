@@ -0,0 +1,124 @@
+import networkx
+from assertpy import assert_that
+
+from geospatial_agent.agent.geospatial.solver.op_context import OperationPromptContextBuilder, estimate_tokens, \
+    split_data_locations
+from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser
+
+_GRAPH_CODE = "G = nx.DiGraph()\n" + "G.add_node('some_node', node_type='data')\n" * 200
+
+_DATA_LOCATIONS = """File Location: agent://airbnb.csv
+Column Names: ['id', 'price', 'latitude', 'longitude']
+Summary: Airbnb listings in New York
+File Location: agent://boroughs.geojson
+Column Names: ['boro_name', 'geometry']
+Summary: Borough boundaries of New York
+File Location: agent://subway.csv
+Column Names: ['station', 'latitude', 'longitude']
+Summary: Subway stations
+"""
+
+_LOAD_LISTINGS_CODE = '''import pandas as pd
+
+def load_listings(listings_url='agent://airbnb.csv'):
+    # Description: Load Airbnb listings
+    listings_df = pd.read_csv(get_data_file_url(listings_url, session_id))
+    listings_df = listings_df.dropna()
+    return listings_df
+'''
+
+_LOAD_BOROUGHS_CODE = '''import geopandas as gpd
+
+def load_boroughs(boroughs_url='agent://boroughs.geojson'):
+    """Loads borough boundaries."""
+    boroughs_gdf = gpd.read_file(get_data_file_url(boroughs_url, session_id))
+    return boroughs_gdf
+'''
+
+
+def _add_operation(graph: networkx.DiGraph, op_name: str, inputs, outputs):
+    graph.add_node(op_name, node_type="operation", description=f"Do {op_name}", operation_type="transform")
+    for data_name in inputs + outputs:
+        if data_name not in graph.nodes:
+            graph.add_node(data_name, node_type="data", description=f"The {data_name} data")
+    for data_name in inputs:
+        graph.add_edge(data_name, op_name)
+    for data_name in outputs:
+        graph.add_edge(op_name, data_name)
+
+
+def _get_parser() -> OperationsParser:
+    graph = networkx.DiGraph()
+    _add_operation(graph, "load_listings", ["listings_url"], ["listings_df"])
+    _add_operation(graph, "load_boroughs", ["boroughs_url"], ["boroughs_gdf"])
+    _add_operation(graph, "join_boroughs", ["listings_df", "boroughs_gdf"], ["joined_gdf"])
+    _add_operation(graph, "plot_prices", ["joined_gdf"], ["prices_html"])
+    _add_operation(graph, "load_stations", ["stations_url"], ["stations_df"])
+    _add_operation(graph, "plot_stations", ["stations_df", "joined_gdf"], ["stations_html"])
+    graph.nodes["listings_url"]["data_path"] = "agent://airbnb.csv"
+    graph.nodes["boroughs_url"]["data_path"] = "agent://boroughs.geojson"
+    graph.nodes["stations_url"]["data_path"] = "agent://subway.csv"
+
+    parser = OperationsParser(graph)
+    parser.operation_nodes_by_name["load_listings"].operation_code = _LOAD_LISTINGS_CODE
+    parser.operation_nodes_by_name["load_boroughs"].operation_code = _LOAD_BOROUGHS_CODE
+    return parser
+
+
+def _build_context(op_name: str, token_budget: int = 100_000):
+    parser = _get_parser()
+    builder = OperationPromptContextBuilder(parser, _GRAPH_CODE, _DATA_LOCATIONS, token_budget=token_budget)
+    return builder.build(parser.operation_nodes_by_name[op_name])
+
+
+def test_ancestors_are_summarized_by_signature_docs_and_return_values():
+    context = _build_context("join_boroughs")
+
+    assert_that(context.ancestor_operation_code).contains(
+        "def load_listings(listings_url='agent://airbnb.csv'):",
+        "    # Description: Load Airbnb listings",
+        "    return listings_df",
+        "    # Returns listings_df: The listings_df data",
+        "def load_boroughs(boroughs_url='agent://boroughs.geojson'):",
+        '    """Loads borough boundaries."""')
+    assert_that(context.ancestor_operation_code).does_not_contain("dropna", "import pandas")
+
+
+def test_only_direct_neighbors_are_included():
+    context = _build_context("plot_prices")
+
+    assert_that(context.ancestor_operation_code).starts_with("def join_boroughs(")
+    assert_that(context.ancestor_operation_code).does_not_contain("load_listings")
+    assert_that(_build_context("join_boroughs").descendant_operations_definition).is_equal_to(
+        "def plot_prices(joined_gdf):\n    # Do plot_prices\n    return prices_html\n\n"
+        "def plot_stations(stations_df, joined_gdf):\n    # Do plot_stations\n    return stations_html")
+
+
+def test_only_data_locations_flowing_into_the_operation_are_included():
+    context = _build_context("plot_prices")
+
+    assert_that(context.data_locations_instructions).contains("agent://airbnb.csv", "agent://boroughs.geojson")
+    assert_that(context.data_locations_instructions).does_not_contain("agent://subway.csv")
+    assert_that(_build_context("load_stations").data_locations_instructions) \
+        .is_equal_to(split_data_locations(_DATA_LOCATIONS)["agent://subway.csv"])
+
+
+def test_plan_graph_code_is_replaced_by_the_graph_around_the_operation_over_the_token_budget():
+    full_context = _build_context("join_boroughs")
+    context = _build_context("join_boroughs", token_budget=500)
+
+    assert_that(full_context.graph_code).is_equal_to(_GRAPH_CODE)
+    assert_that(context.graph_code).does_not_contain("some_node", "load_stations", "stations_df")
+    assert_that(context.graph_code).contains("G.add_edge('load_boroughs', 'boroughs_gdf')",
+                                             "G.add_edge('boroughs_gdf', 'join_boroughs')",
+                                             "G.add_edge('joined_gdf', 'plot_prices')")
+    assert_that(context.ancestor_operation_code).is_equal_to(full_context.ancestor_operation_code)
+    assert_that(context.get_total_tokens()).is_less_than_or_equal_to(500)
+
+
+def test_context_is_truncated_to_fit_a_small_token_budget():
+    context = _build_context("join_boroughs", token_budget=150)
+
+    assert_that(context.ancestor_operation_code).does_not_contain("# Description")
+    assert_that(context.get_total_tokens()).is_less_than_or_equal_to(150 + estimate_tokens("\n...(truncated)"))
+    assert_that(context.get_section_tokens()).contains_key("graph_code", "ancestor_operation_code")
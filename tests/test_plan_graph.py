@@ -0,0 +1,161 @@
+import json
+
+import pytest
+from assertpy import assert_that
+from langchain.llms import FakeListLLM
+
+from geospatial_agent.agent.code_executor import InProcessCodeExecutor
+from geospatial_agent.agent.geospatial.agent import GeospatialAgent
+from geospatial_agent.agent.geospatial.planner.plan_graph import parse_plan_graph, PlanGraphException, \
+    PLAN_GRAPH_FORMAT_JSON
+from geospatial_agent.agent.geospatial.planner.planner import gen_structured_plan_graph, PlannerException
+from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser
+from geospatial_agent.shared.llm_stages import StageLLMFactory
+from geospatial_agent.shared.utils import get_graph_code
+
+
+def _get_plan() -> dict:
+    return {
+        "nodes": [
+            {"name": "listings_url", "node_type": "data", "data_path": "agent://airbnb.csv",
+             "description": "Airbnb listings URI"},
+            {"name": "load_listings", "node_type": "operation", "operation_type": "load",
+             "description": "Load Airbnb listings"},
+            {"name": "listings_df", "node_type": "data", "description": "Airbnb listings data frame"},
+            {"name": "plot_heatmap", "node_type": "operation", "operation_type": "visualization",
+             "description": "Plot a heatmap of prices"},
+            {"name": "heatmap_html", "node_type": "data", "description": "Heatmap of prices"},
+        ],
+        "edges": [
+            ["listings_url", "load_listings"],
+            ["load_listings", "listings_df"],
+            ["listings_df", "plot_heatmap"],
+            ["plot_heatmap", "heatmap_html"],
+        ]
+    }
+
+
+def _get_plan_graph_code() -> str:
+    return """```python
+import networkx as nx
+G = nx.DiGraph()
+G.add_node("listings_url", node_type="data", data_path="agent://airbnb.csv", description="Airbnb listings URI")
+G.add_node("load_listings", node_type="operation", operation_type="load", description="Load Airbnb listings")
+G.add_node("listings_df", node_type="data", description="Airbnb listings data frame")
+G.add_edge("listings_url", "load_listings")
+G.add_edge("load_listings", "listings_df")
+```"""
+
+
+def test_valid_plan_is_parsed_into_a_plan_graph():
+    graph = parse_plan_graph(json.dumps(_get_plan()))
+
+    assert_that(list(graph.nodes)).is_equal_to(
+        ["listings_url", "load_listings", "listings_df", "plot_heatmap", "heatmap_html"])
+    assert_that(graph.nodes["listings_url"]).is_equal_to(
+        {"node_type": "data", "description": "Airbnb listings URI", "data_path": "agent://airbnb.csv"})
+    assert_that(graph.nodes["plot_heatmap"]).contains_entry({"operation_type": "visualization"})
+
+    parser = OperationsParser(graph)
+    assert_that([op.node_name for op in parser.get_operations_in_execution_order()]) \
+        .is_equal_to(["load_listings", "plot_heatmap"])
+
+
+def test_plan_graph_code_builds_the_same_graph():
+    graph = parse_plan_graph(json.dumps(_get_plan()))
+    namespace = {}
+    exec(get_graph_code(graph), namespace)
+
+    assert_that(dict(namespace["G"].nodes(data=True))).is_equal_to(dict(graph.nodes(data=True)))
+    assert_that(list(namespace["G"].edges)).is_equal_to(list(graph.edges))
+
+
+@pytest.mark.parametrize("plan_json, problem", [
+    ("G = nx.DiGraph()", "is not a JSON object"),
+    ('{"nodes": []}', "does not match the plan format"),
+    ('{"nodes": [], "edges": []}', "has no nodes"),
+])
+def test_plans_not_in_the_plan_format_raise_error(plan_json, problem):
+    with pytest.raises(PlanGraphException) as e:
+        parse_plan_graph(plan_json)
+
+    assert_that(e.value.message).contains(problem)
+
+
+def _break_plan(plan: dict, breakage: str):
+    if breakage == "name":
+        plan["nodes"][2]["name"] = "listings df"
+        plan["edges"][1][1] = plan["edges"][2][0] = "listings df"
+    elif breakage == "node_type":
+        plan["nodes"][4]["node_type"] = "output"
+    elif breakage == "duplicate":
+        plan["nodes"].append(plan["nodes"][2])
+    elif breakage == "unknown_node":
+        plan["edges"].append(["heatmap_html", "save_heatmap"])
+    elif breakage == "same_type_edge":
+        plan["edges"].append(["listings_url", "listings_df"])
+    elif breakage == "cycle":
+        plan["edges"].append(["heatmap_html", "load_listings"])
+    elif breakage == "disconnected":
+        plan["nodes"].append({"name": "boroughs_url", "node_type": "data", "description": "Boroughs URI"})
+    elif breakage == "no_output":
+        plan["edges"].pop()
+    return plan
+
+
+@pytest.mark.parametrize("breakage, problem", [
+    ("name", "Node name 'listings df' is not a valid Python name"),
+    ("node_type", "Node heatmap_html has unknown node type 'output'"),
+    ("duplicate", "Node listings_df is defined more than once"),
+    ("unknown_node", "Edge heatmap_html -> save_heatmap refers to unknown nodes save_heatmap"),
+    ("same_type_edge", "Edge listings_url -> listings_df connects two data nodes"),
+    ("cycle", "Plan graph has a cycle"),
+    ("disconnected", "Plan graph has disconnected components"),
+    ("no_output", "Operation plot_heatmap has no output data node"),
+])
+def test_invalid_plan_graphs_raise_error_naming_the_problem(breakage, problem):
+    with pytest.raises(PlanGraphException) as e:
+        parse_plan_graph(json.dumps(_break_plan(_get_plan(), breakage)))
+
+    assert_that(e.value.message).contains(problem)
+
+
+def test_structured_plan_graph_is_generated_from_json_reply():
+    llm = FakeListLLM(responses=[f"Here is the plan.\n<json>\n{json.dumps(_get_plan())}\n</json>\nDone."])
+
+    graph = gen_structured_plan_graph(llm, "Draw a heatmap of prices", "File Location: agent://airbnb.csv")
+
+    assert_that(graph.number_of_nodes()).is_equal_to(5)
+    assert_that(list(graph.successors("listings_df"))).is_equal_to(["plot_heatmap"])
+
+
+def test_invalid_structured_plan_graph_raises_planner_error():
+    llm = FakeListLLM(responses=[f"<json>\n{json.dumps(_break_plan(_get_plan(), 'cycle'))}\n</json>"])
+
+    with pytest.raises(PlannerException) as e:
+        gen_structured_plan_graph(llm, "Draw a heatmap of prices", "File Location: agent://airbnb.csv")
+
+    assert_that(e.value.message).contains("Plan graph has a cycle")
+
+
+def test_agent_uses_structured_plan_graph_without_running_code():
+    llm = FakeListLLM(responses=[f"<json>\n{json.dumps(_get_plan())}\n</json>"])
+    agent = GeospatialAgent(storage_mode="local", llm_factory=StageLLMFactory.from_llm(llm),
+                            code_executor=InProcessCodeExecutor(), plan_graph_format=PLAN_GRAPH_FORMAT_JSON)
+
+    graph, graph_plan_code, repl_output = agent._gen_plan_graph("Draw a heatmap of prices", "")
+
+    assert_that(graph.number_of_nodes()).is_equal_to(5)
+    assert_that(graph_plan_code).contains("G.add_edge('listings_df', 'plot_heatmap')")
+    assert_that(repl_output).is_empty()
+
+
+def test_agent_falls_back_to_plan_graph_code_when_structured_plan_is_invalid():
+    llm = FakeListLLM(responses=["<json>\n{\"nodes\": [\n</json>", _get_plan_graph_code()])
+    agent = GeospatialAgent(storage_mode="local", llm_factory=StageLLMFactory.from_llm(llm),
+                            code_executor=InProcessCodeExecutor(), plan_graph_format=PLAN_GRAPH_FORMAT_JSON)
+
+    graph, graph_plan_code, _ = agent._gen_plan_graph("Load listings", "")
+
+    assert_that(graph_plan_code).starts_with("import networkx as nx")
+    assert_that(list(graph.nodes)).is_equal_to(["listings_url", "load_listings", "listings_df"])
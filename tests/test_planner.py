@@ -0,0 +1,77 @@
+import threading
+from typing import Any, List, Optional
+
+from assertpy import assert_that
+from langchain.llms import FakeListLLM
+from langchain.llms.base import LLM
+
+from geospatial_agent.agent.geospatial.planner.planner import gen_task_name, gen_task_name_slug, \
+    gen_task_name_async, resolve_task_name
+
+_TASK_NAME_PATTERN = r"^\d+_[a-z0-9_]+$"
+
+
+class BlockingLLM(LLM):
+    """Fake LLM that answers once released, or fails if should_fail is set."""
+
+    release: Any = None
+    should_fail: bool = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-blocking"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        self.release.wait(timeout=5)
+        if self.should_fail:
+            raise RuntimeError("Bedrock is not available")
+        return "heatmap_of_prices"
+
+
+def test_generated_task_name_is_a_timestamped_folder_name():
+    llm = FakeListLLM(responses=[" Heatmap of /prices\\ \n"])
+
+    task_name = gen_task_name(llm, "Draw a heatmap of prices")
+
+    assert_that(task_name).matches(_TASK_NAME_PATTERN)
+    assert_that(task_name).ends_with("_heatmap_of_prices")
+
+
+def test_task_name_slug_uses_first_words_of_task():
+    task_name = gen_task_name_slug("Draw a heatmap of Airbnb listing prices in New York City!")
+
+    assert_that(task_name).matches(_TASK_NAME_PATTERN)
+    assert_that(task_name).ends_with("_draw_a_heatmap_of_airbnb_listing")
+
+
+def test_task_name_is_generated_without_blocking_the_caller():
+    llm = BlockingLLM()
+
+    task_name_future = gen_task_name_async(llm, "Draw a heatmap of prices")
+    assert_that(task_name_future.done()).is_false()
+
+    llm.release.set()
+    assert_that(resolve_task_name(task_name_future, "Draw a heatmap of prices")).ends_with("_heatmap_of_prices")
+
+
+def test_resolving_task_name_falls_back_to_slug_when_llm_fails():
+    llm = BlockingLLM(should_fail=True)
+    llm.release.set()
+
+    task_name = resolve_task_name(gen_task_name_async(llm, "Draw a heatmap"), "Draw a heatmap")
+
+    assert_that(task_name).matches(_TASK_NAME_PATTERN)
+    assert_that(task_name).ends_with("_draw_a_heatmap")
+
+
+def test_resolving_task_name_falls_back_to_slug_on_timeout():
+    llm = BlockingLLM()
+
+    task_name = resolve_task_name(gen_task_name_async(llm, "Draw a heatmap"), "Draw a heatmap", timeout=0.01)
+    llm.release.set()
+
+    assert_that(task_name).ends_with("_draw_a_heatmap")
@@ -0,0 +1,74 @@
+import geopandas
+import numpy
+import pandas
+from assertpy import assert_that
+from shapely.geometry import Point, Polygon
+
+from geospatial_agent.agent.action_summarizer.profiler import DataProfiler, profile_data_frame, render_profile, \
+    render_sample_rows
+
+
+def _get_listings() -> geopandas.GeoDataFrame:
+    return geopandas.GeoDataFrame({
+        "price": [100.0, 200.0, None, 400.0],
+        "room_type": ["Entire home", "Private room", "Entire home", "Entire home"],
+    }, geometry=[Point(0, 0), Point(1, 2), None, Polygon([(0, 0), (3, 0), (3, 3)])], crs="EPSG:4326")
+
+
+def test_profile_reports_counts_ranges_categories_and_geometry():
+    profile = profile_data_frame(_get_listings())
+    columns = {column.name: column for column in profile.columns}
+
+    assert_that(profile.row_count).is_equal_to(4)
+    assert_that(profile.crs).is_equal_to("EPSG:4326")
+    assert_that(profile.bounds).is_equal_to([0.0, 0.0, 3.0, 3.0])
+
+    assert_that(columns["price"].null_count).is_equal_to(1)
+    assert_that(columns["price"].min).is_equal_to(100.0)
+    assert_that(columns["price"].max).is_equal_to(400.0)
+    assert_that(columns["price"].quantiles).is_equal_to([150.0, 200.0, 300.0])
+
+    assert_that(columns["room_type"].distinct_count).is_equal_to(2)
+    assert_that(columns["room_type"].top_values).is_equal_to({"Entire home": 0.75, "Private room": 0.25})
+
+    assert_that(columns["geometry"].null_count).is_equal_to(1)
+    assert_that(columns["geometry"].geometry_types).is_equal_to({"Point": 2, "Polygon": 1})
+
+
+def test_profile_has_geometry_only_with_a_geometry_column():
+    assert_that(profile_data_frame(_get_listings()).has_geometry).is_true()
+    assert_that(profile_data_frame(pandas.DataFrame({"geometry_wkt": ["POINT (1 2)"]})).has_geometry).is_false()
+
+
+def test_profile_of_chunks_keeps_exact_counts_and_ranges():
+    values = numpy.arange(1000, dtype=float)
+    values[::10] = numpy.nan
+    data_frame = pandas.DataFrame({"value": values})
+    profiler = DataProfiler(sample_rows=50)
+    for start in range(0, 1000, 100):
+        profiler.add(data_frame.iloc[start:start + 100])
+
+    column = profiler.profile().columns[0]
+
+    assert_that(column.null_count).is_equal_to(100)
+    assert_that(column.min).is_equal_to(1.0)
+    assert_that(column.max).is_equal_to(999.0)
+    assert_that(column.distinct_count_is_estimate).is_true()
+
+
+def test_rendered_profile_is_smaller_than_json_table():
+    data_frame = pandas.DataFrame({"id": range(1000), "city": ["New York", "Boston"] * 500})
+    rendered = render_profile(profile_data_frame(data_frame))
+
+    assert_that(rendered).contains("id | int64 | 0 | 1000 | 0 | 999", "city | object | 0 | 2 |")
+    assert_that(len(rendered)).is_less_than(len(data_frame.to_json()) // 10)
+
+
+def test_rendered_sample_rows_shorten_geometries():
+    polygon = Polygon([(x, x * x) for x in numpy.linspace(0, 1, 100)])
+    data_frame = geopandas.GeoDataFrame({"name": ["park"]}, geometry=[polygon])
+
+    rendered = render_sample_rows(data_frame)
+
+    assert_that(rendered).starts_with('name,geometry\npark,"POLYGON ((0 0,')
+    assert_that(len(rendered)).is_less_than(60)
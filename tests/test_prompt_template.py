@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from assertpy import assert_that
+from langchain_core.prompts import PromptTemplate
+
+from geospatial_agent.agent.action_summarizer.prompts import _ACTION_SUMMARY_PROMPT, _READ_FILE_PROMPT, \
+    _DATA_SUMMARY_PROMPT
+from geospatial_agent.agent.geospatial.planner.prompts import _task_name_generation_prompt, \
+    _planning_graph_task_prompt_template
+from geospatial_agent.agent.geospatial.solver.prompts import operation_requirement_gen_task_prefix, \
+    operation_code_gen_prompt_template
+from geospatial_agent.shared.prompt_template import CompiledPrompt, PromptRenderException, ENV_PROMPT_TRACE_PATH
+
+_TEMPLATES = [_ACTION_SUMMARY_PROMPT, _READ_FILE_PROMPT, _DATA_SUMMARY_PROMPT, _task_name_generation_prompt,
+              _planning_graph_task_prompt_template, operation_requirement_gen_task_prefix,
+              operation_code_gen_prompt_template]
+
+
+@pytest.mark.parametrize("template", _TEMPLATES)
+def test_compiled_prompts_render_like_prompt_templates(template):
+    prompt_template = PromptTemplate.from_template(template)
+    values = {name: f"<{name} {{value}}>" for name in prompt_template.input_variables}
+    compiled_prompt = CompiledPrompt("test", template)
+
+    assert_that(compiled_prompt.input_variables).is_equal_to(frozenset(prompt_template.input_variables))
+    assert_that(compiled_prompt.render(**values)).is_equal_to(prompt_template.format(**values))
+
+
+def test_partial_prompts_render_bound_values_once():
+    compiled_prompt = CompiledPrompt("test", "{role}: Do {task} with {columns}. {role}")
+    partial_prompt = compiled_prompt.partial(role="Human", columns=["id", "price"])
+
+    assert_that(partial_prompt.input_variables).is_equal_to(frozenset(["task"]))
+    assert_that(partial_prompt.render(task="a heatmap")) \
+        .is_equal_to("Human: Do a heatmap with ['id', 'price']. Human")
+    assert_that(compiled_prompt.input_variables).is_equal_to(frozenset(["role", "task", "columns"]))
+
+
+def test_rendering_without_all_values_raises_error():
+    with pytest.raises(PromptRenderException) as e:
+        CompiledPrompt("test", "{role}: Do {task}").render(role="Human")
+
+    assert_that(e.value.message).contains("task")
+
+
+def test_rendered_prompts_are_traced_when_trace_path_is_set(tmp_path, monkeypatch):
+    trace_path = str(tmp_path / "prompts.jsonl")
+    compiled_prompt = CompiledPrompt("task_name", "Name the task {task}")
+
+    compiled_prompt.render(task="a")
+    monkeypatch.setenv(ENV_PROMPT_TRACE_PATH, trace_path)
+    compiled_prompt.render(task="b")
+
+    with open(trace_path) as trace_file:
+        records = [json.loads(line) for line in trace_file]
+    assert_that(records).is_length(1)
+    assert_that(records[0]).contains_entry({"prompt_name": "task_name"}, {"prompt": "Name the task b"})
@@ -0,0 +1,207 @@
+import json
+from typing import List, Optional
+
+import networkx
+import pytest
+from assertpy import assert_that
+
+from geospatial_agent.agent.code_executor import InProcessCodeExecutor
+from geospatial_agent.agent.geospatial.agent import GeospatialAgent, GISAgentException, ENV_REQUIREMENT_SELECTOR
+from geospatial_agent.agent.geospatial.solver.prompts import predefined_operation_requirements, shim_instructions, \
+    REQUIREMENT_PYDECK_FOR_MAPS as _PYDECK_REQUIREMENT, REQUIREMENT_PLOTTING_LIBRARIES as _MATPLOTLIB_REQUIREMENT, \
+    REQUIREMENT_READ_ZIPPED_SHAPEFILE as _ZIPPED_SHAPEFILE_REQUIREMENT, \
+    REQUIREMENT_SAME_PROJECTION as _MULTI_LAYER_REQUIREMENT, REQUIREMENT_SJOIN_ARGUMENTS as _SJOIN_REQUIREMENT, \
+    REQUIREMENT_SHAPELY_POINT as _POINT_REQUIREMENT
+from geospatial_agent.agent.geospatial.solver.requirement_rules import OperationRequirementFeatures, \
+    select_operation_requirements, compare_requirement_selections, DEFAULT_MIN_RULES_CONFIDENCE, RULE_REQUIREMENTS, \
+    RULE_ALWAYS, RULE_LOAD, RULE_ZIPPED_SHAPEFILE, RULE_MAP_VISUALIZATION, RULE_PLOT_VISUALIZATION, \
+    RULE_MULTIPLE_LAYERS, RULE_PROJECTION, RULE_TABLE_JOIN, RULE_SPATIAL_JOIN, RULE_POINT, \
+    ENV_REQUIREMENT_SELECTION_RECORD_PATH
+from geospatial_agent.agent.geospatial.solver.solver import Solver, REQUIREMENT_SELECTOR_RULES, \
+    REQUIREMENT_SELECTOR_LLM
+from geospatial_agent.shared.llm_stages import StageLLMFactory
+from tests.test_solver import FakeOperationLLM, _REQUIREMENT_PROMPT_PATTERN, _TEST_REQUIREMENT
+
+# Words of the text of every requirement each rule selects, in the order of the predefined requirements.
+_RULE_REQUIREMENT_TEXTS = {
+    RULE_ALWAYS: ["variable names and paths", "import statements", "Python code block", "__main__",
+                  "single python function", "fake built-in functions", "not necessary for the task",
+                  "re-throwing the exception"],
+    RULE_LOAD: [],
+    RULE_ZIPPED_SHAPEFILE: ["zipped shapefile"],
+    RULE_MAP_VISUALIZATION: ["requires a map, always use pydeck", "pydeck deck to a HTML file", "Show units"],
+    RULE_PLOT_VISUALIZATION: ["does not require a map", "Show units"],
+    RULE_MULTIPLE_LAYERS: ["multiple layers ONLY"],
+    RULE_PROJECTION: ["only for spatial data layers defined with geopandas GeoDataFrame"],
+    RULE_TABLE_JOIN: ["joining DataFrame and GeoDataFrame, use common columns", "When joining tables"],
+    RULE_SPATIAL_JOIN: ["only for spatial data layers", "retain at least 1 geometry column", "geopandas.sjoin"],
+    RULE_POINT: ["Point function requires importing shapely"],
+}
+
+
+def test_every_rule_selects_the_intended_predefined_requirements():
+    assert_that(RULE_REQUIREMENTS).is_length(len(_RULE_REQUIREMENT_TEXTS))
+    for rule, texts in _RULE_REQUIREMENT_TEXTS.items():
+        requirements = sorted(RULE_REQUIREMENTS[rule], key=predefined_operation_requirements.index)
+
+        assert_that(requirements).is_length(len(texts))
+        for requirement, text in zip(requirements, texts):
+            assert_that(requirement).contains(text)
+
+
+def test_selecting_requirements_for_map_visualization_picks_pydeck_requirements():
+    features = OperationRequirementFeatures(description="Draw a heatmap of listing prices",
+                                            operation_type="visualization")
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.requirements).contains(_PYDECK_REQUIREMENT)
+    assert_that(selection.requirements).does_not_contain(_MATPLOTLIB_REQUIREMENT)
+    assert_that(selection.confidence).is_greater_than_or_equal_to(DEFAULT_MIN_RULES_CONFIDENCE)
+
+
+def test_selecting_requirements_for_generic_visualization_uses_the_task():
+    features = OperationRequirementFeatures(description="Visualize the temperature change",
+                                            operation_type="visualization",
+                                            task_definition="Draw a time series plot of temperature change")
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.requirements).contains(_MATPLOTLIB_REQUIREMENT)
+    assert_that(selection.requirements).does_not_contain(_PYDECK_REQUIREMENT)
+
+
+def test_selecting_requirements_for_spatial_join_of_multiple_layers_picks_projection_requirements():
+    features = OperationRequirementFeatures(description="Join tracts with listings", operation_type="spatial_join",
+                                            input_count=2, has_geometry=True)
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.requirements).contains(_SJOIN_REQUIREMENT, _MULTI_LAYER_REQUIREMENT)
+
+
+def test_selecting_requirements_for_loading_zipped_shapefile_picks_read_file_requirement():
+    features = OperationRequirementFeatures(description="Load census tracts", operation_type="load",
+                                            input_data_paths=["agent://tracts.zip"], has_geometry=True)
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.requirements).contains(_ZIPPED_SHAPEFILE_REQUIREMENT)
+    assert_that(selection.requirements).does_not_contain(_POINT_REQUIREMENT)
+
+
+def test_selecting_requirements_for_unknown_operation_has_low_confidence():
+    features = OperationRequirementFeatures(description="Do something", operation_type="mystery")
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.confidence).is_less_than(DEFAULT_MIN_RULES_CONFIDENCE)
+
+
+def test_selecting_requirements_for_known_operation_type_without_matching_rules_has_low_confidence():
+    features = OperationRequirementFeatures(description="Keep listings with reviews", operation_type="filter")
+
+    selection = select_operation_requirements(features)
+
+    assert_that(selection.matched_rules).is_empty()
+    assert_that(selection.requirements).is_equal_to(RULE_REQUIREMENTS[RULE_ALWAYS])
+    assert_that(selection.confidence).is_less_than(DEFAULT_MIN_RULES_CONFIDENCE)
+
+
+def _get_solver_with_operation(llm: FakeOperationLLM, description: str, operation_type: str,
+                               data_locations_instructions: str = "",
+                               geometry_file_urls: Optional[List[str]] = None,
+                               requirement_selector: str = REQUIREMENT_SELECTOR_RULES) -> Solver:
+    graph = networkx.DiGraph()
+    graph.add_node("data_url", node_type="data", data_path="agent://data.csv", description="data url")
+    graph.add_node("do_work", node_type="operation", description=description, operation_type=operation_type)
+    graph.add_node("result", node_type="data", description="result")
+    graph.add_edge("data_url", "do_work")
+    graph.add_edge("do_work", "result")
+    return Solver(llm=llm, graph=graph, graph_code="", session_id="test_session_id",
+                  storage_mode="test_storage_mode", task_definition="Draw a heatmap", task_name="test_task_name",
+                  data_locations_instructions=data_locations_instructions,
+                  requirement_selector=requirement_selector, geometry_file_urls=geometry_file_urls)
+
+
+def test_solver_uses_rules_without_llm_call_when_confident():
+    llm = FakeOperationLLM()
+    solver = _get_solver_with_operation(llm, "Load data csv", "load")
+
+    requirements = solver.get_operation_requirement(solver.operation_parser.operation_nodes[0])
+
+    assert_that(llm.prompts).is_empty()
+    assert_that(requirements[:len(shim_instructions)]).is_equal_to(shim_instructions)
+
+
+def test_geometry_of_loaded_data_comes_from_profiled_data_files():
+    data_locations_instructions = "File Location: agent://data.csv\nProfile:\n  geometry_wkt: object\n"
+    without_geometry = _get_solver_with_operation(FakeOperationLLM(), "Load data csv", "load",
+                                                  data_locations_instructions=data_locations_instructions)
+    with_geometry = _get_solver_with_operation(FakeOperationLLM(), "Load data csv", "load",
+                                               geometry_file_urls=["agent://data.csv"])
+
+    for solver, has_geometry in [(without_geometry, False), (with_geometry, True)]:
+        op_node = solver.operation_parser.operation_nodes[0]
+        assert_that(solver._get_requirement_features(op_node).has_geometry).is_equal_to(has_geometry)
+    assert_that(without_geometry.get_operation_requirement(
+        without_geometry.operation_parser.operation_nodes[0])).contains(_POINT_REQUIREMENT)
+    assert_that(with_geometry.get_operation_requirement(
+        with_geometry.operation_parser.operation_nodes[0])).does_not_contain(_POINT_REQUIREMENT)
+
+
+def test_solver_falls_back_to_llm_when_rules_are_not_confident():
+    llm = FakeOperationLLM()
+    solver = _get_solver_with_operation(llm, "Do something", "mystery")
+
+    requirements = solver.get_operation_requirement(solver.operation_parser.operation_nodes[0])
+
+    assert_that(llm.prompts).is_length(1)
+    assert_that(llm.prompts[0]).matches(_REQUIREMENT_PROMPT_PATTERN)
+    assert_that(requirements).is_equal_to(shim_instructions + [_TEST_REQUIREMENT])
+
+
+def test_comparing_selections_reports_agreement_with_recorded_llm_selections():
+    features = OperationRequirementFeatures(description="Draw a heatmap", operation_type="map")
+    rules_requirements = select_operation_requirements(features).requirements
+    records = [
+        dict(features.__dict__, llm_requirements=rules_requirements),
+        dict(features.__dict__, llm_requirements=rules_requirements[:-1] + ["A requirement made up by the LLM"]),
+    ]
+
+    agreement = compare_requirement_selections(records)
+
+    assert_that(agreement.record_count).is_equal_to(2)
+    assert_that(agreement.exact_match_rate).is_equal_to(0.5)
+    assert_that(agreement.mean_recall).is_equal_to(1.0)
+    assert_that(agreement.false_positives).is_equal_to({rules_requirements[-1]: 1})
+    assert_that(agreement.false_negatives).is_empty()
+
+
+def test_only_selections_of_the_llm_selector_are_recorded(tmp_path, monkeypatch):
+    record_path = tmp_path / "requirement_selections.jsonl"
+    monkeypatch.setenv(ENV_REQUIREMENT_SELECTION_RECORD_PATH, str(record_path))
+    rules_solver = _get_solver_with_operation(FakeOperationLLM(), "Do something", "mystery")
+    llm_solver = _get_solver_with_operation(FakeOperationLLM(), "Load data csv", "load",
+                                            requirement_selector=REQUIREMENT_SELECTOR_LLM)
+
+    rules_solver.get_operation_requirement(rules_solver.operation_parser.operation_nodes[0])
+    assert_that(record_path.exists()).is_false()
+
+    llm_solver.get_operation_requirement(llm_solver.operation_parser.operation_nodes[0])
+    records = [json.loads(line) for line in record_path.read_text().splitlines()]
+    assert_that(records).is_length(1)
+    assert_that(records[0]).contains_entry({"description": "Load data csv"}, {"llm_requirements": [_TEST_REQUIREMENT]})
+
+
+def test_agent_takes_requirement_selector_from_environment(monkeypatch):
+    factory = StageLLMFactory.from_llm(FakeOperationLLM())
+    monkeypatch.setenv(ENV_REQUIREMENT_SELECTOR, REQUIREMENT_SELECTOR_LLM)
+    assert_that(GeospatialAgent(storage_mode="local", llm_factory=factory,
+                                code_executor=InProcessCodeExecutor()).requirement_selector) \
+        .is_equal_to(REQUIREMENT_SELECTOR_LLM)
+
+    monkeypatch.setenv(ENV_REQUIREMENT_SELECTOR, "magic")
+    with pytest.raises(GISAgentException) as e:
+        GeospatialAgent(storage_mode="local", llm_factory=factory, code_executor=InProcessCodeExecutor())
+    assert_that(e.value.message).contains("Unknown requirement selector 'magic'")
@@ -0,0 +1,54 @@
+from collections import Counter
+
+import pandas
+from assertpy import assert_that
+
+from geospatial_agent.agent.action_summarizer.sampler import DataFrameReservoir, sample_data_frame
+
+
+def _get_chunks(row_count: int, chunk_size: int):
+    data_frame = pandas.DataFrame({"id": range(row_count),
+                                   "value": [None if i % 3 == 0 else i for i in range(row_count)]})
+    return [data_frame.iloc[i:i + chunk_size] for i in range(0, row_count, chunk_size)]
+
+
+def test_data_frame_reservoir_keeps_only_complete_rows():
+    reservoir = DataFrameReservoir(k=5)
+    for chunk in _get_chunks(row_count=100, chunk_size=7):
+        reservoir.add(chunk)
+
+    assert_that(reservoir.sample).is_length(5)
+    assert_that(reservoir.sample["value"].isna().any()).is_false()
+    assert_that(reservoir.rows_seen).is_equal_to(100)
+    assert_that(reservoir.complete_rows_seen).is_equal_to(66)
+
+
+def test_data_frame_reservoir_samples_rows_of_all_chunks_uniformly():
+    counts = Counter()
+    for seed in range(1000):
+        reservoir = DataFrameReservoir(k=1, seed=seed)
+        for chunk in _get_chunks(row_count=12, chunk_size=5):
+            reservoir.add(chunk)
+        counts.update(reservoir.sample["id"].tolist())
+
+    # INFO: 8 complete rows, each picked about 1000 / 8 = 125 times.
+    assert_that(counts).is_length(8)
+    for count in counts.values():
+        assert_that(count).is_between(90, 160)
+
+
+def test_data_frame_reservoir_returns_first_rows_if_no_row_is_complete():
+    reservoir = DataFrameReservoir(k=2)
+    reservoir.add(pandas.DataFrame({"id": [1, 2, 3], "value": [None, None, None]}))
+
+    assert_that(reservoir.sample["id"].tolist()).is_equal_to([1, 2])
+
+
+def test_sampling_loaded_data_frame_keeps_k_complete_rows_in_order():
+    data_frame = pandas.DataFrame({"id": range(100), "name": [None if i % 2 else f"n{i}" for i in range(100)]})
+
+    sample = sample_data_frame(data_frame, k=3)
+
+    assert_that(sample).is_length(3)
+    assert_that(sample["name"].isna().any()).is_false()
+    assert_that(sample["id"].is_monotonic_increasing).is_true()
@@ -0,0 +1,121 @@
+import os
+import zipfile
+
+import geopandas
+import pandas
+import pytest
+from assertpy import assert_that
+from shapely.geometry import Point
+
+from geospatial_agent.agent.action_summarizer.action_summarizer import ActionSummarizer
+from geospatial_agent.agent.action_summarizer.schema_sniffer import sniff_schema, is_sniffable, \
+    SchemaSniffingException
+
+
+def _get_points_gdf() -> geopandas.GeoDataFrame:
+    return geopandas.GeoDataFrame(
+        {"name": ["a", "b", None, "d"], "price": [10, 20, 30, 40]},
+        geometry=[Point(0, 0), Point(1, 1), Point(2, 2), Point(3, 3)],
+        crs="EPSG:4326")
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    path = str(tmp_path / "listings.csv")
+    pandas.DataFrame({
+        "id": range(100),
+        "price": [float(i) for i in range(100)],
+        "neighbourhood": [None if i % 2 else f"n{i}" for i in range(100)],
+    }).to_csv(path, index=False)
+    return path
+
+
+def test_sniffing_csv_reads_columns_types_and_complete_sample_rows(csv_path):
+    schema = sniff_schema(csv_path, session_id="test_session_id", sample_rows=3)
+
+    assert_that(schema.column_names).is_equal_to(["id", "price", "neighbourhood"])
+    assert_that(schema.dtypes).is_equal_to({"id": "int64", "price": "float64", "neighbourhood": "object"})
+    assert_that(schema.sample).is_length(3)
+    assert_that(schema.sample["neighbourhood"].isna().any()).is_false()
+    assert_that(schema.crs).is_none()
+
+
+def test_sniffing_csv_reads_file_in_chunks(csv_path, mocker):
+    read_csv = mocker.spy(pandas, "read_csv")
+
+    schema = sniff_schema(csv_path, session_id="test_session_id", chunk_size=10)
+
+    assert_that(read_csv.call_args.kwargs["chunksize"]).is_equal_to(10)
+    assert_that(schema.sample).is_length(3)
+
+
+def test_sniffing_csv_samples_rows_from_whole_file(csv_path):
+    sampled_ids = set()
+    for seed in range(20):
+        schema = sniff_schema(csv_path, session_id="test_session_id", chunk_size=10, seed=seed)
+        sampled_ids.update(schema.sample["id"].tolist())
+
+    assert_that(max(sampled_ids)).is_greater_than(50)
+
+
+@pytest.mark.parametrize("file_name,driver", [("points.geojson", "GeoJSON"), ("points.gpkg", "GPKG")])
+def test_sniffing_vector_files_reads_crs_and_bounds(tmp_path, file_name, driver):
+    path = str(tmp_path / file_name)
+    _get_points_gdf().to_file(path, driver=driver)
+
+    schema = sniff_schema(path, session_id="test_session_id")
+
+    assert_that(schema.column_names).contains("name", "price", "geometry")
+    assert_that(schema.crs).is_equal_to("EPSG:4326")
+    assert_that(schema.bounds).is_equal_to((0.0, 0.0, 3.0, 3.0))
+    assert_that(schema.sample).is_length(3)
+    assert_that(schema.sample).is_instance_of(geopandas.GeoDataFrame)
+
+
+def test_sniffing_zipped_shapefile_reads_crs_and_bounds(tmp_path):
+    shapefile_dir = tmp_path / "points"
+    os.makedirs(shapefile_dir)
+    _get_points_gdf().to_file(str(shapefile_dir / "points.shp"))
+    zip_path = str(tmp_path / "points.zip")
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        for name in os.listdir(shapefile_dir):
+            zip_file.write(str(shapefile_dir / name), arcname=name)
+
+    schema = sniff_schema(zip_path, session_id="test_session_id")
+
+    assert_that(schema.crs).is_equal_to("EPSG:4326")
+    assert_that(schema.bounds).is_equal_to((0.0, 0.0, 3.0, 3.0))
+
+
+def test_sniffing_geoparquet_reads_crs_and_bounds(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "points.parquet")
+    _get_points_gdf().to_parquet(path)
+
+    schema = sniff_schema(path, session_id="test_session_id")
+
+    assert_that(schema.crs).is_equal_to("EPSG:4326")
+    assert_that(schema.bounds).is_equal_to((0.0, 0.0, 3.0, 3.0))
+
+
+def test_sniffing_unsupported_format_raises_exception():
+    assert_that(is_sniffable("agent://data.xlsx")).is_false()
+    with pytest.raises(SchemaSniffingException):
+        sniff_schema("agent://data.xlsx", session_id="test_session_id")
+
+
+def test_action_summarizer_builds_file_summaries_from_sniffed_schema(csv_path):
+    file_summaries = ActionSummarizer._gen_file_summaries_from_sniffing([csv_path], session_id="test_session_id")
+
+    assert_that(file_summaries).is_length(1)
+    assert_that(file_summaries[0].file_url).is_equal_to(csv_path)
+    assert_that(file_summaries[0].column_names).is_equal_to(["id", "price", "neighbourhood"])
+    assert_that(file_summaries[0].profile.row_count).is_equal_to(100)
+    assert_that(file_summaries[0].data_frame).is_length(3)
+
+
+def test_action_summarizer_falls_back_to_generated_code_for_unsupported_files(csv_path):
+    file_summaries = ActionSummarizer._gen_file_summaries_from_sniffing(
+        [csv_path, "agent://data.xlsx"], session_id="test_session_id")
+
+    assert_that(file_summaries).is_none()
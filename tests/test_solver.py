@@ -0,0 +1,283 @@
+import re
+from typing import Callable, List
+
+import networkx
+import pytest
+from assertpy import assert_that
+from langchain.llms.base import LLM
+
+from geospatial_agent.agent.geospatial.solver.op_context import estimate_tokens
+from geospatial_agent.agent.geospatial.solver.op_graph import OperationsParser, OperationsParserException
+from geospatial_agent.agent.geospatial.solver.op_profiler import load_operations_profile_report, \
+    render_operations_profile
+from geospatial_agent.agent.geospatial.solver.solver import Solver, REQUIREMENT_SELECTOR_LLM
+from geospatial_agent.agent.shared import execute_assembled_code
+from tests.fake_llms import ConcurrencyTrackingLLM
+
+_REQUIREMENT_PROMPT_PATTERN = r"The function to write requirements for: (\w+)\."
+_CODE_PROMPT_PATTERN = r"Operation_task: .* Do (\w+)"
+_TEST_REQUIREMENT = "Show units for graphs or maps."
+
+
+def _respond_to_operation_prompt(prompt: str) -> str:
+    if re.search(_REQUIREMENT_PROMPT_PATTERN, prompt):
+        return f'<json>["{_TEST_REQUIREMENT}"]</json>'
+
+    op_name = re.search(_CODE_PROMPT_PATTERN, prompt).group(1)
+    return f"```python\ndef {op_name}():\n    pass\n```"
+
+
+class FakeOperationLLM(ConcurrencyTrackingLLM):
+    """Fake LLM that answers requirement and code generation prompts of the solver for any operation."""
+
+    respond: Callable[[str], str] = _respond_to_operation_prompt
+
+
+def _add_operation(graph: networkx.DiGraph, op_name: str, inputs: List[str], outputs: List[str]):
+    graph.add_node(op_name, node_type="operation", description=f"Do {op_name}", operation_type="transform")
+    for data_name in inputs + outputs:
+        if data_name not in graph.nodes:
+            graph.add_node(data_name, node_type="data", description=data_name)
+    for data_name in inputs:
+        graph.add_edge(data_name, op_name)
+    for data_name in outputs:
+        graph.add_edge(op_name, data_name)
+
+
+def _get_wide_graph() -> networkx.DiGraph:
+    graph = networkx.DiGraph()
+    _add_operation(graph, "load_a", ["a_url"], ["a_gdf"])
+    _add_operation(graph, "load_b", ["b_url"], ["b_gdf"])
+    _add_operation(graph, "load_c", ["c_url"], ["c_gdf"])
+    _add_operation(graph, "join_ab", ["a_gdf", "b_gdf"], ["ab_gdf"])
+    _add_operation(graph, "plot_all", ["ab_gdf", "c_gdf"], ["plot_html"])
+    return graph
+
+
+def _get_solver(llm: LLM, graph: networkx.DiGraph, max_workers: int = 4,
+                requirement_selector: str = REQUIREMENT_SELECTOR_LLM) -> Solver:
+    return Solver(llm=llm, graph=graph, graph_code="", session_id="test_session_id",
+                  storage_mode="test_storage_mode", task_definition="test task", task_name="test_task_name",
+                  data_locations_instructions="", max_workers=max_workers,
+                  requirement_selector=requirement_selector)
+
+
+def _get_code_prompt(llm: FakeOperationLLM, op_name: str) -> str:
+    return next(prompt for prompt in llm.prompts if re.search(_CODE_PROMPT_PATTERN, prompt)
+                and re.search(_CODE_PROMPT_PATTERN, prompt).group(1) == op_name)
+
+
+def test_operation_levels_are_grouped_by_deepest_operation_ancestor():
+    solver = _get_solver(FakeOperationLLM(), _get_wide_graph())
+
+    levels = solver.operation_parser.get_operation_levels()
+    level_names = [[op_node.node_name for op_node in level] for level in levels]
+
+    assert_that(level_names).is_equal_to([["load_a", "load_b", "load_c"], ["join_ab"], ["plot_all"]])
+
+
+def test_operation_ancestors_and_descendants_are_listed_in_plan_order():
+    parser = OperationsParser(_get_wide_graph())
+
+    assert_that([op_node.node_name for op_node in parser.get_ancestors("plot_all")]) \
+        .is_equal_to(["load_a", "load_b", "load_c", "join_ab"])
+    assert_that([op_node.node_name for op_node in parser.get_ancestors("ab_gdf")]) \
+        .is_equal_to(["load_a", "load_b", "join_ab"])
+    assert_that([op_node.node_name for op_node in parser.get_descendants("load_a")]) \
+        .is_equal_to(["join_ab", "plot_all"])
+    assert_that(parser.get_descendants("plot_all")).is_empty()
+    assert_that(parser.input_node_names).is_equal_to(frozenset(["a_url", "b_url", "c_url"]))
+    assert_that(parser.output_node_names).is_equal_to(frozenset(["plot_html"]))
+
+
+def test_parsing_a_plan_graph_with_a_cycle_raises_error():
+    graph = _get_wide_graph()
+    _add_operation(graph, "loop_back", ["ab_gdf"], ["a_url"])
+
+    with pytest.raises(OperationsParserException):
+        OperationsParser(graph)
+
+
+def test_solving_generates_code_for_all_operations_in_plan_order():
+    solver = _get_solver(FakeOperationLLM(), _get_wide_graph())
+
+    op_nodes = solver.solve()
+
+    assert_that([op_node.node_name for op_node in op_nodes]) \
+        .is_equal_to(["load_a", "load_b", "load_c", "join_ab", "plot_all"])
+    for op_node in op_nodes:
+        assert_that(op_node.operation_code).contains(f"def {op_node.node_name}():")
+
+
+def test_solving_embeds_generated_direct_ancestor_code_in_operation_prompts():
+    llm = FakeOperationLLM()
+    solver = _get_solver(llm, _get_wide_graph())
+
+    solver.solve()
+
+    plot_prompt = _get_code_prompt(llm, "plot_all")
+    for ancestor in ["load_c", "join_ab"]:
+        assert_that(plot_prompt).contains(f"def {ancestor}():")
+    for ancestor in ["load_a", "load_b"]:
+        assert_that(plot_prompt).does_not_contain(f"def {ancestor}():")
+
+
+def test_solving_records_prompt_size_of_every_operation():
+    llm = FakeOperationLLM()
+    solver = _get_solver(llm, _get_wide_graph())
+
+    solver.solve()
+
+    assert_that(solver.prompt_tokens).contains_only("load_a", "load_b", "load_c", "join_ab", "plot_all")
+    assert_that(solver.prompt_tokens["plot_all"]).is_equal_to(estimate_tokens(_get_code_prompt(llm, "plot_all")))
+    for op_node in solver.operation_parser.operation_nodes:
+        assert_that(llm.prompts).contains(op_node.operation_prompt)
+
+
+def test_solving_generates_operations_of_the_same_level_concurrently():
+    llm = FakeOperationLLM(delay=0.05)
+    solver = _get_solver(llm, _get_wide_graph(), max_workers=3)
+
+    solver.solve()
+
+    assert_that(llm.max_in_flight).is_equal_to(3)
+
+
+def test_solving_with_a_single_worker_generates_operations_serially():
+    llm = FakeOperationLLM(delay=0.01)
+    solver = _get_solver(llm, _get_wide_graph(), max_workers=1)
+
+    solver.solve()
+
+    assert_that(llm.max_in_flight).is_equal_to(1)
+
+
+def test_solving_selects_requirements_for_all_operations_concurrently():
+    llm = FakeOperationLLM(delay=0.05)
+    solver = _get_solver(llm, _get_wide_graph(), max_workers=5)
+
+    solver.solve()
+
+    assert_that(llm.max_in_flight).is_equal_to(5)
+    for op_node in solver.operation_parser.operation_nodes:
+        assert_that(op_node.operation_requirements).is_not_none()
+
+
+def test_requirement_selections_do_not_delay_code_generation_of_ready_operations():
+    llm = FakeOperationLLM()
+    solver = _get_solver(llm, _get_wide_graph(), max_workers=1)
+
+    solver.solve()
+
+    prompt_kinds = ["requirements" if re.search(_REQUIREMENT_PROMPT_PATTERN, prompt) else "code"
+                    for prompt in llm.prompts]
+    assert_that(prompt_kinds).is_equal_to(["requirements", "code"] * 5)
+    assert_that(llm.prompts[1]).is_equal_to(_get_code_prompt(llm, "load_a"))
+
+
+def _get_profiled_solver(count_code: str) -> Solver:
+    graph = networkx.DiGraph()
+    _add_operation(graph, "load_listings", ["listings_url"], ["listings_df"])
+    _add_operation(graph, "count_listings", ["listings_df"], ["listing_count"])
+    graph.nodes["listings_url"]["data_path"] = "listings.csv"
+
+    solver = _get_solver(FakeOperationLLM(), graph)
+    op_codes = {
+        "load_listings": "import pandas\n\ndef load_listings(listings_url):\n"
+                         "    return pandas.DataFrame({'price': range(10)})\n",
+        "count_listings": count_code,
+    }
+    for op_node in solver.operation_parser.operation_nodes:
+        op_node.operation_code = op_codes[op_node.node_name]
+    return solver
+
+
+def test_assembled_code_profiles_operations_when_asked(tmp_path):
+    report_path = str(tmp_path / "assembled_code_profile.json")
+    solver = _get_profiled_solver("def count_listings(listings_df):\n    return len(listings_df)\n")
+
+    assert_that(solver.assemble()).does_not_contain("_operation_profiler")
+    assembled_code = solver.assemble(profile_report_path=report_path)
+    execution_result = execute_assembled_code(assembled_code, result_names=["listing_count"])
+    report = load_operations_profile_report(report_path)
+
+    assert_that(execution_result.results["listing_count"]).is_equal_to(10)
+    assert_that([operation.name for operation in report.operations]) \
+        .is_equal_to(["load_listings", "count_listings"])
+    load_profile = report.operations[0]
+    assert_that(load_profile.wall_seconds).is_greater_than_or_equal_to(0)
+    assert_that(load_profile.cpu_seconds).is_greater_than_or_equal_to(0)
+    assert_that(load_profile.peak_memory_delta_bytes).is_greater_than(0)
+    assert_that(load_profile.outputs[0].name).is_equal_to("listings_df")
+    assert_that(load_profile.outputs[0].rows).is_equal_to(10)
+    assert_that(load_profile.outputs[0].memory_bytes).is_greater_than(0)
+    assert_that(report.operations[1].outputs[0].rows).is_none()
+    assert_that(render_operations_profile(report)).contains("load_listings", "listings_df 10 rows")
+
+
+def test_profile_report_is_written_when_an_operation_fails(tmp_path):
+    report_path = str(tmp_path / "assembled_code_profile.json")
+    solver = _get_profiled_solver("def count_listings(listings_df):\n    raise ValueError('no listings')\n")
+
+    with pytest.raises(ValueError):
+        execute_assembled_code(solver.assemble(profile_report_path=report_path))
+    report = load_operations_profile_report(report_path)
+
+    assert_that(report.operations).is_length(2)
+    assert_that(report.operations[1].error).is_equal_to("ValueError: no listings")
+
+
+def _get_echo_solver(graph: networkx.DiGraph) -> Solver:
+    """Returns a solver whose operations print their name and return their output names applied to their inputs."""
+    solver = _get_solver(FakeOperationLLM(), graph)
+    for op_node in solver.operation_parser.operation_nodes:
+        # INFO: Like generated code, operations return their outputs in the order of the return line.
+        returned_names = op_node.return_line.removeprefix("return ").split(", ")
+        returns = ", ".join(f'"{name}(" + ",".join(args) + ")"' for name in returned_names)
+        op_node.operation_code = f'def {op_node.node_name}(*args, **kwargs):\n' \
+                                 f'    print("{op_node.node_name}")\n' \
+                                 f'    return {returns}\n'
+    return solver
+
+
+def _get_diamond_graph() -> networkx.DiGraph:
+    graph = networkx.DiGraph()
+    _add_operation(graph, "join", ["buffered", "right"], ["joined"])
+    _add_operation(graph, "buffer", ["left"], ["buffered"])
+    _add_operation(graph, "split", ["base"], ["left", "right"])
+    _add_operation(graph, "load", ["base_url"], ["base"])
+    graph.nodes["base_url"]["data_path"] = "base.csv"
+    return graph
+
+
+def _get_fan_out_graph() -> networkx.DiGraph:
+    graph = networkx.DiGraph()
+    _add_operation(graph, "load", ["base_url"], ["base"])
+    _add_operation(graph, "reproject", ["base"], ["projected"])
+    _add_operation(graph, "plot_map", ["projected"], ["map_html"])
+    _add_operation(graph, "plot_chart", ["projected"], ["chart_png"])
+    _add_operation(graph, "describe", ["base"], ["stats"])
+    graph.nodes["base_url"]["data_path"] = "base.csv"
+    return graph
+
+
+def test_assembled_code_of_a_diamond_plan_calls_operations_after_their_inputs():
+    assembled_code = _get_echo_solver(_get_diamond_graph()).assemble()
+
+    execution_result = execute_assembled_code(assembled_code, result_names=["joined"])
+
+    assert_that(execution_result.output.split()).is_equal_to(["load", "split", "buffer", "join"])
+    assert_that(execution_result.results["joined"]).is_equal_to("joined(buffered(left(base())),right(base()))")
+
+
+def test_assembled_code_of_a_fan_out_plan_defines_and_calls_shared_operations_once():
+    assembled_code = _get_echo_solver(_get_fan_out_graph()).assemble()
+
+    execution_result = execute_assembled_code(assembled_code, result_names=["map_html", "chart_png", "stats"])
+
+    for op_name in ["load", "reproject", "plot_map", "plot_chart", "describe"]:
+        assert_that(assembled_code.count(f"def {op_name}(")).is_equal_to(1)
+        assert_that(execution_result.output.split().count(op_name)).is_equal_to(1)
+    assert_that(execution_result.output.split()[:2]).is_equal_to(["load", "reproject"])
+    assert_that(execution_result.results["chart_png"]).is_equal_to("chart_png(projected(base()))")
+    assert_that(execution_result.results["stats"]).is_equal_to("stats(base())")
@@ -0,0 +1,133 @@
+from typing import Any, Iterator, List, Optional
+
+from assertpy import assert_that
+from langchain.llms.base import LLM
+from langchain_core.caches import InMemoryCache
+from langchain_community.llms.fake import FakeListLLM
+from langchain_core.outputs import GenerationChunk
+from pydispatch import dispatcher
+
+from geospatial_agent.agent.shared import get_code_chunk_sender, SIGNAL_CODE_CHUNK_GENERATED, EventType
+from geospatial_agent.shared.streaming import IncrementalBlockExtractor, predict_block
+from geospatial_agent.shared.utils import extract_code, extract_content_xml
+
+_CODE_RESPONSE = "Here is the code:\n```python\nimport pandas as pd\n\ndef load():\n    pass\n```\nThe code loads the data."
+
+
+class FakeStreamingLLM(LLM):
+    """Fake LLM that streams a response in fixed size chunks and counts the chunks that were read."""
+
+    response: str
+    chunk_size: int = 5
+    streaming: bool = True
+    chunks_read: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for idx in range(0, len(self.response), self.chunk_size):
+            self.chunks_read += 1
+            yield GenerationChunk(text=self.response[idx:idx + self.chunk_size])
+
+
+def _feed_all(extractor: IncrementalBlockExtractor, chunks: List[str]) -> str:
+    return "".join(extractor.feed(chunk) for chunk in chunks)
+
+
+def test_extractor_finds_code_block_split_across_chunks():
+    extractor = IncrementalBlockExtractor()
+
+    content = _feed_all(extractor, ["Sure `", "``pyt", "hon\nx = 1\n`", "`", "` trailing"])
+
+    assert_that(extractor.is_complete).is_true()
+    assert_that(content.strip()).is_equal_to("x = 1")
+    assert_that(extract_code(extractor.text)).is_equal_to(content.strip())
+
+
+def test_extractor_finds_code_block_without_language_name():
+    extractor = IncrementalBlockExtractor()
+
+    content = _feed_all(extractor, ["``", "`\nx = 1\n``", "`"])
+
+    assert_that(extractor.is_complete).is_true()
+    assert_that(content.strip()).is_equal_to("x = 1")
+
+
+def test_extractor_finds_xml_block_split_across_chunks():
+    extractor = IncrementalBlockExtractor(xml_tag="json")
+
+    content = _feed_all(extractor, ['<js', 'on>["a", ', '"b"]</j', 'son> and more'])
+
+    assert_that(extractor.is_complete).is_true()
+    assert_that(content).is_equal_to('["a", "b"]')
+    assert_that(extract_content_xml("json", extractor.text)).is_equal_to(content)
+
+
+def test_predict_block_stops_reading_once_the_block_is_closed():
+    llm = FakeStreamingLLM(response=_CODE_RESPONSE)
+    partials = []
+
+    response = predict_block(llm=llm, prompt="prompt", on_partial=partials.append)
+
+    total_chunks = -(-len(_CODE_RESPONSE) // llm.chunk_size)
+    assert_that(llm.chunks_read).is_less_than(total_chunks)
+    assert_that(extract_code(response)).is_equal_to(extract_code(_CODE_RESPONSE))
+    assert_that("".join(partials).strip()).is_equal_to(extract_code(_CODE_RESPONSE))
+
+
+def test_responses_read_up_to_the_block_are_not_returned_to_non_streaming_calls():
+    llm = FakeStreamingLLM(response=_CODE_RESPONSE, cache=InMemoryCache())
+
+    predict_block(llm=llm, prompt="prompt")
+    chunks_read = llm.chunks_read
+    cached_response = predict_block(llm=llm, prompt="prompt")
+
+    assert_that(llm.chunks_read).is_equal_to(chunks_read)
+    assert_that(extract_code(cached_response)).is_equal_to(extract_code(_CODE_RESPONSE))
+    assert_that(llm.predict("prompt")).is_equal_to(_CODE_RESPONSE)
+
+
+def test_predict_block_uses_full_responses_cached_by_non_streaming_calls():
+    llm = FakeStreamingLLM(response=_CODE_RESPONSE, cache=InMemoryCache())
+
+    llm.predict("prompt")
+    response = predict_block(llm=llm, prompt="prompt")
+
+    assert_that(response).is_equal_to(_CODE_RESPONSE)
+    assert_that(llm.chunks_read).is_equal_to(0)
+
+
+def test_predict_block_without_streaming_returns_full_response():
+    llm = FakeListLLM(responses=[_CODE_RESPONSE])
+    partials = []
+
+    response = predict_block(llm=llm, prompt="prompt", on_partial=partials.append)
+
+    assert_that(response).is_equal_to(_CODE_RESPONSE)
+    assert_that(partials).is_empty()
+
+
+def test_code_chunk_sender_dispatches_chunks_with_stream_name():
+    received = []
+
+    def receiver(sender, event_data):
+        received.append((sender, event_data))
+
+    dispatcher.connect(receiver=receiver, signal=SIGNAL_CODE_CHUNK_GENERATED)
+    try:
+        get_code_chunk_sender("test_sender", "Generating code")("x = 1")
+    finally:
+        dispatcher.disconnect(receiver=receiver, signal=SIGNAL_CODE_CHUNK_GENERATED)
+
+    assert_that(received).is_length(1)
+    sender, signal = received[0]
+    assert_that(sender).is_equal_to("test_sender")
+    assert_that(signal.event_message).is_equal_to("Generating code")
+    assert_that(signal.event_data).is_equal_to("x = 1")
+    assert_that(signal.event_type).is_equal_to(EventType.PythonCodeChunk)
@@ -0,0 +1,158 @@
+import os
+
+import geopandas
+import pandas
+import pytest
+from assertpy import assert_that
+from langchain.llms import FakeListLLM
+from shapely.geometry import Point
+
+from geospatial_agent.agent.action_summarizer.action_summarizer import ActionSummarizer, ActionContext, FileSummary
+from geospatial_agent.agent.action_summarizer.profiler import profile_data_frame
+from geospatial_agent.agent.action_summarizer.summary_cache import FileSummaryCache, CachedFileSummary, \
+    fingerprint_file, to_sample_rows, FINGERPRINT_BLOCK_SIZE
+from geospatial_agent.shared.cache import PersistentLRUCache
+
+_ACTION = "Draw a heatmap of prices"
+_MODEL_ID = "anthropic.claude-v2"
+
+
+@pytest.fixture
+def csv_path(tmp_path) -> str:
+    path = str(tmp_path / "listings.csv")
+    pandas.DataFrame({"id": [1, 2, 3], "price": [10.0, 20.0, 30.0]}).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def summary_cache(tmp_path) -> FileSummaryCache:
+    return FileSummaryCache(store=PersistentLRUCache(path=str(tmp_path / "summaries.sqlite")))
+
+
+def _get_cached_summary(file_url: str) -> CachedFileSummary:
+    data_frame = pandas.read_csv(file_url)
+    return CachedFileSummary(file_url=file_url, column_names=["id", "price"], file_summary="Listings with prices",
+                             profile=profile_data_frame(data_frame), sample_rows=to_sample_rows(data_frame))
+
+
+def test_fingerprint_changes_when_file_changes(csv_path):
+    fingerprint = fingerprint_file(csv_path)
+    assert_that(fingerprint_file(csv_path)).is_equal_to(fingerprint)
+
+    with open(csv_path, "a") as file:
+        file.write("4,40.0\n")
+
+    assert_that(fingerprint_file(csv_path)).is_not_equal_to(fingerprint)
+
+
+def test_fingerprint_hashes_middle_of_large_files(tmp_path):
+    path = str(tmp_path / "large.csv")
+    content = bytearray(b"a" * (4 * FINGERPRINT_BLOCK_SIZE))
+    with open(path, "wb") as file:
+        file.write(content)
+    stat = os.stat(path)
+    fingerprint = fingerprint_file(path)
+
+    content[2 * FINGERPRINT_BLOCK_SIZE] = ord("b")
+    with open(path, "wb") as file:
+        file.write(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert_that(fingerprint_file(path)).is_not_equal_to(fingerprint)
+
+
+def test_fingerprint_of_missing_or_remote_file_is_none(summary_cache):
+    assert_that(fingerprint_file("/not/a/file.csv")).is_none()
+    assert_that(summary_cache.get("https://example.com/file.csv", "test_session_id", _ACTION, _MODEL_ID)).is_none()
+
+
+def test_cached_summary_is_returned_for_same_file_and_action(csv_path, summary_cache):
+    summary_cache.set("test_session_id", _ACTION, _MODEL_ID, _get_cached_summary(csv_path))
+
+    cached = summary_cache.get(csv_path, "test_session_id", _ACTION, _MODEL_ID)
+
+    assert_that(cached.file_summary).is_equal_to("Listings with prices")
+    assert_that(cached.profile.row_count).is_equal_to(3)
+    assert_that(cached.get_sample_data_frame()["price"].tolist()).is_equal_to([10.0, 20.0, 30.0])
+    assert_that(summary_cache.get(csv_path, "test_session_id", "Another action", _MODEL_ID)).is_none()
+    assert_that(summary_cache.get(csv_path, "test_session_id", _ACTION, "another-model")).is_none()
+
+
+def test_cached_summaries_are_deleted_when_file_changes(csv_path, summary_cache):
+    summary_cache.set("test_session_id", _ACTION, _MODEL_ID, _get_cached_summary(csv_path))
+    size_before_change = summary_cache.store.size_bytes()
+
+    with open(csv_path, "a") as file:
+        file.write("4,40.0\n")
+
+    assert_that(size_before_change).is_greater_than(0)
+    assert_that(summary_cache.get(csv_path, "test_session_id", _ACTION, _MODEL_ID)).is_none()
+    assert_that(summary_cache.store.size_bytes()).is_equal_to(0)
+
+
+def test_invalidating_a_file_deletes_its_summaries(csv_path, summary_cache):
+    summary_cache.set("test_session_id", _ACTION, _MODEL_ID, _get_cached_summary(csv_path))
+
+    summary_cache.invalidate(csv_path, "test_session_id")
+
+    assert_that(summary_cache.get(csv_path, "test_session_id", _ACTION, _MODEL_ID)).is_none()
+
+
+def test_sample_rows_of_geo_data_frames_are_stored_as_wkt():
+    gdf = geopandas.GeoDataFrame({"name": ["a"]}, geometry=[Point(1, 2)], crs="EPSG:4326")
+
+    assert_that(to_sample_rows(gdf)).is_equal_to([{"name": "a", "geometry": "POINT (1 2)"}])
+
+
+def test_action_summarizer_reuses_cached_summaries(csv_path, summary_cache):
+    action_summarizer = ActionSummarizer(llm=FakeListLLM(responses=["Listings with prices"]),
+                                         summary_cache=summary_cache)
+    action_context = ActionContext(action=_ACTION, file_paths=[csv_path])
+    file_summaries = ActionSummarizer._gen_file_summaries_from_sniffing([csv_path], session_id="test_session_id")
+    file_summaries = action_summarizer._gen_file_summaries_for_action(_ACTION, file_summaries)
+
+    assert_that(action_summarizer._get_cached_file_summaries(action_context, "test_session_id")).is_empty()
+    action_summarizer._cache_file_summaries(_ACTION, file_summaries, "test_session_id")
+    cached_summaries = action_summarizer._get_cached_file_summaries(action_context, "test_session_id")
+
+    assert_that(cached_summaries).contains_key(csv_path)
+    assert_that(cached_summaries[csv_path]).is_instance_of(FileSummary)
+    assert_that(cached_summaries[csv_path].file_summary).is_equal_to("Listings with prices")
+    assert_that(cached_summaries[csv_path].column_names).is_equal_to(["id", "price"])
+    assert_that(cached_summaries[csv_path].profile.row_count).is_equal_to(3)
+
+
+def test_partly_cached_summaries_keep_the_order_of_file_paths(tmp_path, summary_cache):
+    file_paths = []
+    for name in ["listings", "boroughs", "stations", "parks"]:
+        path = str(tmp_path / f"{name}.csv")
+        pandas.DataFrame({"id": [1, 2, 3], "price": [10.0, 20.0, 30.0]}).to_csv(path, index=False)
+        file_paths.append(path)
+    for cached_path in [file_paths[1], file_paths[3]]:
+        summary_cache.set("test_session_id", _ACTION, _MODEL_ID, _get_cached_summary(cached_path))
+    action_summarizer = ActionSummarizer(llm=FakeListLLM(responses=["Generated summary"]),
+                                         summary_cache=summary_cache)
+
+    cached_summaries = action_summarizer._get_cached_file_summaries(
+        ActionContext(action=_ACTION, file_paths=file_paths), "test_session_id")
+    missing_file_paths = [path for path in file_paths if path not in cached_summaries]
+    generated_summaries = action_summarizer._gen_file_summaries_for_action(
+        _ACTION, ActionSummarizer._gen_file_summaries_from_sniffing(missing_file_paths, "test_session_id"))
+    file_summaries = ActionSummarizer._merge_file_summaries(file_paths, cached_summaries, generated_summaries)
+
+    assert_that(missing_file_paths).is_equal_to([file_paths[0], file_paths[2]])
+    assert_that([item.file_url for item in file_summaries]).is_equal_to(file_paths)
+    assert_that([item.file_summary for item in file_summaries]).is_equal_to(
+        ["Generated summary", "Listings with prices", "Generated summary", "Listings with prices"])
+
+
+def test_generated_summaries_of_other_file_urls_fill_missing_places_in_order():
+    cached_summary = FileSummary(file_url="agent://b.csv", data_frame=pandas.DataFrame(), column_names=[])
+    generated_summaries = [FileSummary(file_url=f"/data/{name}.csv", data_frame=pandas.DataFrame(), column_names=[])
+                           for name in ["a", "c"]]
+
+    file_summaries = ActionSummarizer._merge_file_summaries(
+        ["agent://a.csv", "agent://b.csv", "agent://c.csv"], {"agent://b.csv": cached_summary}, generated_summaries)
+
+    assert_that([item.file_url for item in file_summaries]).is_equal_to(
+        ["/data/a.csv", "agent://b.csv", "/data/c.csv"])